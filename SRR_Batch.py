@@ -0,0 +1,498 @@
+"""
+Render and merge tiles without any UI, for render nodes running Blender in background mode:
+
+    blender -b scene.blend --python <addon folder>/SRR_Batch.py -- --srr [options]
+
+Everything after `--srr` is parsed by `main()`; see `--srr --help`. The scene's Super Res Render settings
+are used unless overridden with `--set name=value`.
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Sequence, TextIO
+
+import bpy
+from bpy.types import Context
+
+if __name__ == "__main__" and not __package__:
+    # Run as a script by `--python`, outside the add-on's package, where the relative imports below can't work: import the
+    # add-on this file belongs to by its folder name, registering it if it isn't enabled, and run its copy of this module
+    import importlib
+
+    addon_dirpath = os.path.dirname(os.path.realpath(__file__))
+    sys.path.insert(0, os.path.dirname(addon_dirpath))
+    package = importlib.import_module(os.path.basename(addon_dirpath))
+    if not hasattr(bpy.types.Scene, "srr_settings"):
+        package.register()
+
+    sys.exit(importlib.import_module(f"{package.__name__}.SRR_Batch").main())
+
+from .SRR_Settings import SRR_Settings
+from .utils.merge_tiles import MergeRegion, do_merge_frames, do_merge_tiles, generate_tiles_for_merge
+from .utils.render_tiles import RenderTile, generate_tiles, get_render_tiles, get_tile_frames, set_up_render_tile
+from .utils.saved_render_settings import SavedRenderSettings, restore_render_settings, save_render_settings
+from .utils.tile_stats import TileStatsRecorder
+from .utils.tile_locks import CLAIM_POLL_INTERVAL, STALE_LOCK_SECONDS, LockRefresher, TileLocks, is_tile_done
+from .utils.tile_coordinator import (
+    CLAIM_RETRY_DELAY,
+    LEASE_TIMEOUT,
+    TOKEN_ENV_VAR,
+    CoordinatorClient,
+    CoordinatorServer,
+    Heartbeat,
+    TileCoordinator,
+    generate_token,
+    is_loopback_host,
+)
+from .utils.worker_pool import WORKER_PREFIX, get_batch_command, get_worker_threads
+
+
+def parse_tile_numbers(text: str) -> List[int]:
+    """Parse 1-based tile numbers and ranges, e.g. `1,4-6`."""
+    numbers = []
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        numbers.extend(range(int(first), int(last or first) + 1))
+    return numbers
+
+
+def parse_region(text: str) -> MergeRegion:
+    """Parse a region as `x,y,width,height` in pixels."""
+    try:
+        region = MergeRegion(*(int(value) for value in text.split(',')))
+    except (TypeError, ValueError):
+        raise argparse.ArgumentTypeError(f"expected X,Y,W,H as four whole numbers of pixels, got {text!r}")
+    if region.x < 0 or region.y < 0 or region.width <= 0 or region.height <= 0:
+        raise argparse.ArgumentTypeError(f"expected X and Y of at least 0 and a W and H of at least 1, got {text!r}")
+    return region
+
+
+def apply_setting(settings: SRR_Settings, assignment: str) -> None:
+    """Set a Super Res Render setting from `name=value`, converting the value to the setting's type."""
+    name, sep, value = assignment.partition('=')
+    prop = settings.bl_rna.properties.get(name) if sep else None
+    if prop is None or prop.is_readonly:
+        raise ValueError(f"Unknown setting {assignment!r}, expected one of the Super Res Render settings as name=value")
+
+    if prop.type == 'BOOLEAN':
+        setattr(settings, name, value.lower() in {'1', 'true', 'yes', 'on'})
+    elif prop.type == 'INT':
+        setattr(settings, name, int(value))
+    elif prop.type == 'FLOAT':
+        setattr(settings, name, float(value))
+    elif prop.type == 'ENUM' and prop.is_enum_flag:
+        setattr(settings, name, {item for item in value.split(',') if item})
+    else:
+        setattr(settings, name, value)
+
+
+def check_render_method(settings: SRR_Settings) -> None:
+    if settings.render_method == 'camsplit':
+        raise RuntimeError("The Split camera method doesn't render tiles, use Camera shift or Render border.")
+
+
+def get_stats_recorder(settings: SRR_Settings) -> Optional[TileStatsRecorder]:
+    return TileStatsRecorder() if settings.skip_empty_tiles and not settings.use_multilayer else None
+
+
+def render_tile_blocking(context: Context, tile: RenderTile, stats_recorder: TileStatsRecorder = None) -> None:
+    set_up_render_tile(context, tile, context.scene.camera)
+    bpy.ops.render.render(write_still=True)
+    if stats_recorder:
+        stats_recorder.record(tile.filepath)
+
+
+@contextmanager
+def calling_while_rendering(callback: Callable[[], None]) -> Iterator[None]:
+    """
+    Call `callback` whenever Blender reports render progress. Python threads don't run during `bpy.ops.render.render()`,
+    so this is what keeps heartbeats and lock refreshes going while a tile renders.
+    """
+    def on_render_stats(*args):
+        callback()
+
+    bpy.app.handlers.render_stats.append(on_render_stats)
+    try:
+        yield
+    finally:
+        bpy.app.handlers.render_stats.remove(on_render_stats)
+
+
+def select_tiles(context: Context, saved_settings: SavedRenderSettings, tile_numbers: Sequence[int] = None) -> List[RenderTile]:
+    """The tiles numbered `tile_numbers` (1-based, counted within each frame), by default all from the Start Tile on."""
+    if not tile_numbers:
+        # Same tiles as the Render Tiles operator
+        return get_render_tiles(context, saved_settings)[context.scene.srr_settings.start_tile - 1:]
+
+    tiles = []
+    for frame in get_tile_frames(context):
+        frame_tiles = generate_tiles(context, saved_settings, frame)
+        tiles += [frame_tiles[number - 1] for number in tile_numbers if 0 < number <= len(frame_tiles)]
+    return tiles
+
+
+def render_tiles_blocking(context: Context, tile_numbers: Sequence[int] = None) -> List[RenderTile]:
+    """
+    Render the scene's tiles one after another, each synchronously with `write_still`, then restore the scene's render settings.
+    `tile_numbers` picks which tiles to render, see `select_tiles()`. Returns the tiles rendered.
+    """
+    scene = context.scene
+    settings: SRR_Settings = scene.srr_settings
+
+    check_render_method(settings)
+    saved_settings = save_render_settings(context, scene.camera)
+    tiles = select_tiles(context, saved_settings, tile_numbers)
+
+    stats_recorder = get_stats_recorder(settings)
+
+    try:
+        for (index, tile) in enumerate(tiles):
+            start_time = time.perf_counter()
+            render_tile_blocking(context, tile, stats_recorder)
+            print(f"Rendered tile {index + 1} / {len(tiles)} ({tile.filepath}) in {time.perf_counter() - start_time:.2f}s")
+
+    finally:
+        restore_render_settings(context, saved_settings, scene.camera)
+        if stats_recorder:
+            stats_recorder.close()
+
+    return tiles
+
+
+def render_tiles_shared(context: Context, tile_numbers: Sequence[int] = None,
+        stale_seconds: float = STALE_LOCK_SECONDS) -> List[RenderTile]:
+    """
+    Render tiles together with other Blender instances rendering the same .blend file to the same shared folder,
+    each claiming tiles through lock files next to them (see `utils.tile_locks`). Returns once every tile is done,
+    waiting on tiles others are rendering in case they are abandoned. Returns the tiles rendered by this instance.
+
+    A lock unchanged for `stale_seconds` is taken over and its tile rendered again. Locks are refreshed whenever the
+    render reports progress, which it doesn't do while loading the scene or building its BVH, so `stale_seconds` must
+    exceed the longest of those stretches, in every instance; more than a tile's whole render time is always safe.
+    """
+    scene = context.scene
+    settings: SRR_Settings = scene.srr_settings
+
+    check_render_method(settings)
+    saved_settings = save_render_settings(context, scene.camera)
+    tiles = [(tile, bpy.path.abspath(tile.filepath)) for tile in select_tiles(context, saved_settings, tile_numbers)]
+    locks = TileLocks(stale_seconds=stale_seconds)
+    refresher = LockRefresher()
+    stats_recorder = get_stats_recorder(settings)
+    rendered = []
+    print(f"Rendering tiles in a shared folder as {locks.owner}")
+
+    try:
+        while True:
+            remaining = [(tile, tile_abspath) for (tile, tile_abspath) in tiles if not is_tile_done(tile_abspath)]
+            if not remaining:
+                break
+
+            claimed_any = False
+            for (tile, tile_abspath) in remaining:
+                claim = locks.try_claim(tile_abspath)
+                if claim is None:
+                    continue
+
+                claimed_any = True
+                refresher.claim = claim
+                try:
+                    with calling_while_rendering(refresher.refresh):
+                        render_tile_blocking(context, tile, stats_recorder)
+                except BaseException:
+                    # Including Ctrl+C: let someone else render it
+                    claim.release()
+                    raise
+                finally:
+                    refresher.claim = None
+                claim.finish()
+                rendered.append(tile)
+                print(f"Rendered tile {tile.filepath}, {len(rendered)} here so far.")
+
+            if not claimed_any:
+                # The rest are being rendered elsewhere; keep watching in case their renderer has died
+                time.sleep(CLAIM_POLL_INTERVAL)
+
+    finally:
+        refresher.stop()
+        restore_render_settings(context, saved_settings, scene.camera)
+        if stats_recorder:
+            stats_recorder.close()
+
+    return rendered
+
+
+def serve_tiles(context: Context, commands: TextIO, output: TextIO) -> None:
+    """
+    Worker mode of a local render pool (see `utils.worker_pool`): render the tiles whose indices in `get_render_tiles()`
+    are read from `commands`, one per line, until it is closed, reporting each as done or failed on `output`.
+    """
+    scene = context.scene
+    settings: SRR_Settings = scene.srr_settings
+
+    check_render_method(settings)
+    saved_settings = save_render_settings(context, scene.camera)
+    tiles = get_render_tiles(context, saved_settings)
+    stats_recorder = get_stats_recorder(settings)
+
+    def send(*message) -> None:
+        print(WORKER_PREFIX, *message, file=output, flush=True)
+
+    try:
+        for line in commands:
+            if not line.strip():
+                continue
+            index = int(line)
+            try:
+                render_tile_blocking(context, tiles[index], stats_recorder)
+            except (IndexError, RuntimeError) as e:
+                send('failed', index, str(e).replace('\n', ' '))
+            else:
+                send('done', index)
+
+    finally:
+        restore_render_settings(context, saved_settings, scene.camera)
+        if stats_recorder:
+            stats_recorder.close()
+
+
+def serve_coordinator(context: Context, address: str, local_workers: int = 0, token: str = None,
+        lease_timeout: float = LEASE_TIMEOUT) -> None:
+    """
+    Serve the tiles to render workers over HTTP at `address` (`[host:]port`, port 0 picks a free one) until all are
+    uploaded, with `local_workers` workers started on this machine. Workers on other machines need the same .blend file
+    and run `--coordinator <url>`. Tiles are written where a render in this Blender would write them.
+
+    Only this machine can connect unless a host such as 0.0.0.0 is given. Workers must then send the shared `token`,
+    which is generated if not given. A worker not heard from for `lease_timeout` seconds has its tiles handed to others.
+    """
+    scene = context.scene
+    settings: SRR_Settings = scene.srr_settings
+
+    check_render_method(settings)
+    tiles = get_render_tiles(context, save_render_settings(context, scene.camera))
+    filepaths = {index: bpy.path.abspath(tiles[index].filepath) for index in range(settings.start_tile - 1, len(tiles))}
+    if not filepaths:
+        raise RuntimeError("No tiles to render.")
+
+    (host, _, port) = address.rpartition(':')
+    host = host or '127.0.0.1'
+    if not token and not is_loopback_host(host):
+        token = generate_token()
+    coordinator = TileCoordinator(filepaths, lease_timeout)
+    server = CoordinatorServer((host, int(port)), coordinator, token)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://{host if host != '0.0.0.0' else socket.gethostname()}:{server.server_port}"
+    print(f"Serving {len(filepaths)} tiles at {url}, run workers with: --srr --coordinator {url}")
+    if token:
+        print(f"Workers need the coordinator token, in the {TOKEN_ENV_VAR} environment variable or --token: {token}")
+
+    local_url = f"http://{host if host != '0.0.0.0' else '127.0.0.1'}:{server.server_port}"
+    command = get_batch_command(bpy.app.binary_path, bpy.data.filepath,
+        ['--coordinator', local_url, '--threads', str(get_worker_threads(local_workers))])
+    # The token is passed in the environment, where other users can't see it
+    environment = dict(os.environ, **{TOKEN_ENV_VAR: token}) if token else None
+    workers = [subprocess.Popen(command, env=environment) for _ in range(local_workers)]
+    stats_recorder = get_stats_recorder(settings)
+
+    try:
+        while not coordinator.is_finished:
+            time.sleep(0.5)
+            for index in coordinator.pop_done():
+                print(f"Tile {index + 1} done ({len(coordinator.done)} / {len(filepaths)}) by {coordinator.done[index]}.")
+                if stats_recorder:
+                    stats_recorder.record(filepaths[index])
+            if workers and all(worker.poll() is not None for worker in workers):
+                break
+
+        # Let the workers hear that the job is finished before going away
+        time.sleep(CLAIM_RETRY_DELAY * 2)
+
+    finally:
+        server.shutdown()
+        server.server_close()
+        for worker in workers:
+            worker.wait()
+        if stats_recorder:
+            stats_recorder.close()
+
+    missing = len(filepaths) - len(coordinator.done)
+    if missing:
+        raise RuntimeError(f"{missing} of {len(filepaths)} tiles weren't rendered.")
+
+
+def work_for_coordinator(context: Context, url: str, token: str = None) -> None:
+    """
+    Render tiles claimed from the coordinator at `url` until it has none left, uploading each. Tiles are rendered to a
+    temporary folder first, so workers sharing a filesystem with the coordinator never write the same file.
+    A tile another worker uploaded first, while this one was still rendering it, is dropped rather than uploaded.
+    """
+    scene = context.scene
+    settings: SRR_Settings = scene.srr_settings
+
+    check_render_method(settings)
+    saved_settings = save_render_settings(context, scene.camera)
+    tiles = get_render_tiles(context, saved_settings)
+    client = CoordinatorClient(url, token=token)
+    heartbeat = Heartbeat(client)
+    local_dirpath = tempfile.mkdtemp(prefix="srr_worker_")
+    print(f"Rendering tiles for {url} as {client.worker}")
+
+    try:
+        connection_errors = 0
+        while True:
+            try:
+                reply = client.claim()
+                connection_errors = 0
+            except OSError as e:
+                # The coordinator shuts down once it has all tiles
+                connection_errors += 1
+                if connection_errors > 3:
+                    print(f"Can't reach the coordinator, stopping: {e}")
+                    return
+                time.sleep(CLAIM_RETRY_DELAY)
+                continue
+
+            if reply.get('finished'):
+                return
+            if 'tile' not in reply:
+                time.sleep(reply.get('wait', CLAIM_RETRY_DELAY))
+                continue
+
+            index = reply['tile']
+            tile = tiles[index]
+            local_filepath = os.path.join(local_dirpath, os.path.basename(bpy.path.abspath(tile.filepath)))
+
+            heartbeat.tile = index
+            try:
+                with calling_while_rendering(heartbeat.beat):
+                    render_tile_blocking(context, tile._replace(filepath=local_filepath))
+                # Heartbeats are infrequent, so ask again rather than upload a tile that is already done
+                if index in heartbeat.cancelled or not client.is_needed(index):
+                    print(f"Tile {index + 1} was rendered by another worker first.")
+                elif not client.upload(index, local_filepath):
+                    print(f"Tile {index + 1} was uploaded by another worker first.")
+            except RuntimeError as e:
+                client.fail(index, str(e))
+            except OSError as e:
+                # The tile is handed out again once this worker's lease runs out
+                print(f"Can't upload tile {index + 1}: {e}")
+            finally:
+                heartbeat.tile = None
+                if os.path.exists(local_filepath):
+                    os.remove(local_filepath)
+
+    finally:
+        heartbeat.stop()
+        restore_render_settings(context, saved_settings, scene.camera)
+        shutil.rmtree(local_dirpath, ignore_errors=True)
+
+
+def merge_blocking(context: Context, region: MergeRegion = None) -> None:
+    """Merge the rendered tiles of the current frame, or of every frame in the frame range."""
+    scene = context.scene
+    settings: SRR_Settings = scene.srr_settings
+
+    if settings.use_frame_range and region is None:
+        do_merge_frames(context, get_tile_frames(context))
+        return
+
+    frames = get_tile_frames(context) if settings.use_frame_range else [None]
+    for frame in frames:
+        do_merge_tiles(context, generate_tiles_for_merge(context, frame), frame, region=region)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="blender -b scene.blend --python SRR_Batch.py -- --srr",
+        description="Render and/or merge Super Res Render tiles in background mode.")
+    parser.add_argument("--set", action='append', default=[], metavar="NAME=VALUE",
+        help="Override a Super Res Render setting for this run, e.g. subdivisions=3 or merge_strategy=stream (repeatable)")
+    parser.add_argument("--threads", type=int, default=0,
+        help="Render with this many CPU threads, rather than the scene's setting")
+    parser.add_argument("--worker", action='store_true',
+        help="Render tiles by index read from stdin until it is closed, for a local render pool; other options but --set are ignored")
+    parser.add_argument("--shared", action='store_true',
+        help="Render together with other Blender instances writing to the same shared folder, claiming tiles through lock files. "
+            "Tiles with a .done marker are skipped, delete the markers to render them again")
+    parser.add_argument("--stale-timeout", type=float, default=STALE_LOCK_SECONDS, metavar="SECONDS",
+        help=f"With --shared, take over a tile whose lock hasn't been refreshed for this long; use the same value in every "
+            f"instance, longer than a tile takes to render (default: {STALE_LOCK_SECONDS:g})")
+    parser.add_argument("--serve", metavar="[HOST:]PORT",
+        help="Serve the tiles to render workers over HTTP until all are rendered. Only this machine can connect, "
+            "serve at 0.0.0.0:PORT (or this machine's address) for workers on other machines")
+    parser.add_argument("--local-workers", type=int, default=0, metavar="N",
+        help="With --serve, also start this many workers on this machine")
+    parser.add_argument("--lease-timeout", type=float, default=LEASE_TIMEOUT, metavar="SECONDS",
+        help=f"With --serve, hand a worker's tiles to others when it hasn't been heard from for this long (default: {LEASE_TIMEOUT:g})")
+    parser.add_argument("--coordinator", metavar="URL",
+        help="Render tiles claimed from the coordinator at this URL, started with --serve, until it has none left")
+    parser.add_argument("--token", default=os.environ.get(TOKEN_ENV_VAR),
+        help=f"Shared token workers must send to a coordinator, generated if it is served to other machines without one "
+            f"(default: ${TOKEN_ENV_VAR})")
+    parser.add_argument("--tiles", type=parse_tile_numbers, metavar="N[-M],...",
+        help="Only render these tiles (1-based, in each frame), e.g. 1-16,20")
+    parser.add_argument("--no-render", dest='render', action='store_false', help="Don't render, only merge")
+    parser.add_argument("--merge", action='store_true', help="Merge the tiles once rendering is done")
+    parser.add_argument("--region", type=parse_region, metavar="X,Y,W,H",
+        help="Only merge this pixel rectangle, from the bottom left; it is clipped to the image")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point for `blender -b ... -- --srr [options]`. Returns a process exit code."""
+    if argv is None:
+        argv = sys.argv[sys.argv.index('--srr') + 1:] if '--srr' in sys.argv else []
+    args = build_parser().parse_args(argv)
+
+    context = bpy.context
+    settings: SRR_Settings = context.scene.srr_settings
+
+    try:
+        for assignment in args.set:
+            apply_setting(settings, assignment)
+
+        if args.threads > 0:
+            context.scene.render.threads_mode = 'FIXED'
+            context.scene.render.threads = args.threads
+
+        region = None
+        if args.region:
+            render = context.scene.render
+            region = args.region.clip((render.resolution_x, render.resolution_y))
+            if not (region.width and region.height):
+                raise ValueError(f"The region {','.join(map(str, args.region))} lies outside the "
+                    f"{render.resolution_x}x{render.resolution_y} image.")
+
+        if args.worker:
+            serve_tiles(context, sys.stdin, sys.stdout)
+            return 0
+
+        if args.coordinator:
+            work_for_coordinator(context, args.coordinator, args.token)
+            return 0
+
+        if args.serve:
+            serve_coordinator(context, args.serve, args.local_workers, args.token, args.lease_timeout)
+        elif args.render and args.shared:
+            tiles = render_tiles_shared(context, args.tiles, args.stale_timeout)
+            print(f"All tiles done, {len(tiles)} rendered here.")
+        elif args.render:
+            tiles = render_tiles_blocking(context, args.tiles)
+            print(f"Rendered {len(tiles)} tiles.")
+
+        if args.merge or not args.render:
+            merge_blocking(context, region)
+
+    except Exception as e:
+        print(f"Super Res Render failed: {e}")
+        return 1
+
+    return 0
@@ -2,7 +2,10 @@ import bpy
 from bpy.types import Panel
 from math import ceil
 
-from .SRR_Settings import SRR_RenderStatus, SRR_Settings
+from .SRR_Settings import SRR_RenderStatus, SRR_Settings, get_merge_strategy_name
+from .utils.file import get_file_ext
+from .utils.merge_planner import plan_merge
+from .utils.perf import format_bytes
 
 
 # Interface
@@ -67,18 +70,55 @@ class SRR_UI_PT_Panel(Panel):
             col.prop(settings, "start_tile")
             col.separator()
 
+            col = layout.column(align=True)
+            col.active = panel_active
+            col.prop(settings, "use_frame_range")
+            col.prop(settings, "use_multilayer")
+            col.prop(settings, "merge_while_rendering")
+            col.prop(settings, "render_workers")
+            col.separator()
+
             col = layout.column(align=True)
             if status.is_rendering:
                 col.label(text=f"{status.tiles_done} / {status.tiles_total} tiles rendered", icon='INFO')
                 col.prop(status, "percent_complete")
                 col.operator('render.superres_kill', text="Cancel", icon='CANCEL')
             else:
-                col.operator('render.superres', text="Render Frame")
+                col.operator('render.superres_workers' if settings.render_workers else 'render.superres',
+                    text="Render Frames" if settings.use_frame_range else "Render Frame")
             col.separator()
 
             col = layout.column(align=True)
             col.active = panel_active
+            col.prop(settings, "merge_backend")
+            col.prop(settings, "merge_strategy")
+            row = col.row(align=True)
+            row.prop(settings, "merge_channels", expand=True)
+            col.prop(settings, "merge_precision")
+            col.prop(settings, "merge_view_transform")
+            col.prop(settings, "prefetch_depth")
+            col.prop(settings, "skip_empty_tiles")
+            col.prop(settings, "use_merge_cache")
+            col.prop(settings, "use_merge_checkpoints")
+            col.prop(settings, "collect_tile_stats")
+            col.prop(settings, "export_deep_zoom")
+            row = col.row(align=True)
+            row.prop(settings, "extra_outputs")
+            row = col.row(align=True)
+            row.prop(settings, "downsampled_outputs")
+            col.prop(settings, "memory_budget")
+            col.separator()
+
+            plan = plan_merge(context)
+            strategy_name = get_merge_strategy_name(plan.strategy)
+            col.label(text=f"{'Auto: ' if plan.automatic else ''}{strategy_name} ({get_file_ext(plan.estimate.output_format)})",
+                icon='INFO' if plan.fits else 'ERROR')
+            col.label(text=f"Peak memory ~{format_bytes(plan.estimate.peak_memory)} of {format_bytes(plan.budget)}")
+            col.label(text=f"Disk I/O ~{format_bytes(plan.estimate.io_bytes)}")
             col.operator('render.superres_merge', text="Merge Tiles", icon='MESH_GRID')
+            col.operator('render.superres_merge', text="Merge Region...", icon='SELECT_SET').use_region = True
+            if settings.use_frame_range:
+                col.operator('render.superres_merge_frames', text=f"Merge Frames {scene.frame_start}-{scene.frame_end}", icon='SEQUENCE')
 
         layout.separator()
         col = layout.column()
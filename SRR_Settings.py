@@ -61,6 +61,55 @@ SUBDIVISION_SIZES = (
     ('4', "16 x 16", "Break the render into 16 x 16 tiles"),
 )
 
+MERGE_BACKENDS = (
+    ('numpy', "NumPy", "Copy each tile into the output with a single vectorised NumPy slice"),
+    ('array', "Python array", "Copy tiles row by row with Python arrays (slow, fallback if NumPy is unavailable)"),
+)
+
+MERGE_STRATEGIES = (
+    ('auto', "Automatic", "Pick the first strategy whose estimated peak memory fits the memory budget"),
+    ('ram', "In memory", "Build the final image in RAM"),
+    ('memmap', "Memory-mapped", "Build the final image in a scratch file in PartRenders that the OS pages in and out, for outputs larger than RAM"),
+    ('stream', "Streaming TIFF", "Write the final image to a (Big)TIFF one band of tiles at a time, without ever holding the whole image"),
+    ('tiled', "Tiled EXR", "Write a tiled OpenEXR whose file tiles are the render tiles, re-encoding each tile on its own and in parallel"),
+)
+
+
+def get_merge_strategy_name(strategy: str) -> str:
+    """UI name of a merge strategy, including the one multilayer tiles are merged with, which isn't a setting."""
+    if strategy == 'multilayer':
+        return "Multilayer, per pass"
+    return next(name for (identifier, name, _) in MERGE_STRATEGIES if identifier == strategy)
+
+MERGE_CHANNELS = (
+    ('RGBA', "RGBA", "Keep colour and alpha"),
+    ('RGB', "RGB", "Drop alpha, for opaque images"),
+    ('BW', "BW", "Single channel luminance"),
+)
+
+MERGE_PRECISIONS = (
+    ('32', "Float (Full)", "Store merged pixels as 32 bit floats"),
+    ('16', "Float (Half)", "Store merged pixels as 16 bit floats, halving merge memory and float output size"),
+)
+
+MERGE_VIEW_TRANSFORMS = (
+    ('NONE', "Blender", "Merge linear floats and let Blender apply the scene's view transform to the whole image when saving"),
+    ('STANDARD', "Standard", "Apply the sRGB transfer function and dither to 8/16 bit as each tile is placed, for PNG, JPEG, TIFF, BMP and Targa output"),
+    ('FILMIC', "Filmic (Approximate)", "Apply an approximation of Filmic and dither to 8/16 bit as each tile is placed, for PNG, JPEG, TIFF, BMP and Targa output"),
+)
+
+EXTRA_OUTPUT_FORMATS = (
+    ('OPEN_EXR', "EXR", "Float OpenEXR, encoded on a worker thread"),
+    ('PNG', "PNG", "8 bit sRGB PNG, encoded on a worker thread"),
+    ('TIFF', "TIFF", "Float TIFF, encoded on a worker thread"),
+    ('JPEG', "JPEG", "JPEG saved through Blender with the scene's colour management"),
+)
+
+DOWNSAMPLED_OUTPUTS = (
+    ('2', "50%", "Half size copy, box filtered while merging"),
+    ('4', "25%", "Quarter size copy, box filtered while merging"),
+)
+
 class SRR_Settings(PropertyGroup):
     render_method: EnumProperty(
         name="Method",
@@ -92,3 +141,143 @@ class SRR_Settings(PropertyGroup):
         max = 256,
     )
 
+    merge_backend: EnumProperty(
+        name="Merge Backend",
+        items=MERGE_BACKENDS,
+        default='numpy',
+        description="Method used to copy rendered tiles into the final image",
+        options=set(), # Not animatable!
+    )
+
+    merge_strategy: EnumProperty(
+        name="Merge Strategy",
+        items=MERGE_STRATEGIES,
+        default='ram',
+        description="Where the final image is assembled while merging",
+        options=set(), # Not animatable!
+    )
+
+    prefetch_depth: IntProperty(
+        name="Prefetch Tiles",
+        description="Number of tiles read and decoded ahead on worker threads while merging. 0 loads each tile through Blender in turn",
+        default=4,
+        min=0,
+        max=64,
+        options=set(), # Not animatable!
+    )
+
+    memory_budget: FloatProperty(
+        name="Memory Budget (GB)",
+        description="Memory the merge may use, for picking a strategy automatically. 0 uses half of this machine's RAM",
+        default=0.0,
+        min=0.0,
+        soft_max=256.0,
+        precision=1,
+        options=set(), # Not animatable!
+    )
+
+    render_workers: IntProperty(
+        name="Workers",
+        description="Render tiles in this many background Blender processes at once, each with an equal share of the CPU threads, from the saved .blend file. 0 renders them one at a time in this session",
+        default=0,
+        min=0,
+        soft_max=16,
+        max=64,
+        options=set(), # Not animatable!
+    )
+
+    merge_while_rendering: BoolProperty(
+        name="Merge While Rendering",
+        description="Composite each tile into the final image as soon as it has rendered, so no separate merge is needed",
+        default=False,
+        options=set(), # Not animatable!
+    )
+
+    use_frame_range: BoolProperty(
+        name="Frame Range",
+        description="Render the tiles of every frame in the scene's frame range, with the frame number in the tile and merged image filenames",
+        default=False,
+        options=set(), # Not animatable!
+    )
+
+    use_merge_checkpoints: BoolProperty(
+        name="Resumable Merge",
+        description="Checkpoint memory-mapped, streamed and tiled merges after each band of tiles, so a merge interrupted by a crash carries on where it stopped",
+        default=True,
+        options=set(), # Not animatable!
+    )
+
+    skip_empty_tiles: BoolProperty(
+        name="Skip Empty Tiles",
+        description="Note which tiles are completely empty (e.g. transparent background) as they are rendered, and don't decode or copy them when merging",
+        default=False,
+        options=set(), # Not animatable!
+    )
+
+    use_merge_cache: BoolProperty(
+        name="Skip Unchanged Tiles",
+        description="Keep a manifest of merged tiles next to the output, and only re-merge tiles that changed since the last merge",
+        default=False,
+        options=set(), # Not animatable!
+    )
+
+    collect_tile_stats: BoolProperty(
+        name="Tile Statistics",
+        description="Measure each tile's luminance range, mean and histogram, NaN and infinite pixels and alpha coverage as it is merged, and save them next to the output",
+        default=False,
+        options=set(), # Not animatable!
+    )
+
+    export_deep_zoom: BoolProperty(
+        name="Deep Zoom Pyramid",
+        description="Also export a Deep Zoom (DZI) tile pyramid for zoomable web viewers, built while merging",
+        default=False,
+        options=set(), # Not animatable!
+    )
+
+    merge_channels: EnumProperty(
+        name="Merge Color",
+        items=MERGE_CHANNELS,
+        default='RGBA',
+        description="Channels kept in the merged image",
+        options=set(), # Not animatable!
+    )
+
+    merge_precision: EnumProperty(
+        name="Merge Depth",
+        items=MERGE_PRECISIONS,
+        default='32',
+        description="Precision of the merged image while merging, and of float outputs",
+        options=set(), # Not animatable!
+    )
+
+    merge_view_transform: EnumProperty(
+        name="View Transform",
+        items=MERGE_VIEW_TRANSFORMS,
+        default='NONE',
+        description="Convert tiles to display values while merging, so the merged image is stored as 8 or 16 bit integers (dithered by the scene's Dither setting)",
+        options=set(), # Not animatable!
+    )
+
+    extra_outputs: EnumProperty(
+        name="Extra Outputs",
+        items=EXTRA_OUTPUT_FORMATS,
+        default=set(),
+        description="Formats saved next to the scene's output format, all encoded at once from the same merged image",
+        options={'ENUM_FLAG'}, # Not animatable!
+    )
+
+    downsampled_outputs: EnumProperty(
+        name="Downsampled Copies",
+        items=DOWNSAMPLED_OUTPUTS,
+        default=set(),
+        description="Smaller copies of the merged image for review, built band by band from the same merge (PNG, unless the output is EXR or TIFF)",
+        options={'ENUM_FLAG'}, # Not animatable!
+    )
+
+    use_multilayer: BoolProperty(
+        name="All Render Passes",
+        description="Render tiles as multilayer EXR with every enabled pass (Z, normal, Cryptomatte, ...) and merge each pass into a multilayer EXR",
+        default=False,
+        options=set(), # Not animatable!
+    )
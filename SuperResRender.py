@@ -1,20 +1,63 @@
 import bpy
-from typing import List
+import os
+from time import monotonic
+from typing import Dict, List, Optional
 
+from bpy.props import BoolProperty, IntProperty
 from bpy.types import Context, Operator, Scene, Timer
 
-from .SRR_Settings import SRR_RenderStatus, SRR_Settings
-from .utils.merge_tiles import do_merge_tiles, generate_tiles_for_merge
+from .SRR_Settings import SRR_RenderStatus, SRR_Settings, get_merge_strategy_name
+from .utils.file import get_merge_scratch_filepath
+from .utils.merge_planner import plan_merge
+from .utils.merge_tiles import (
+    IncrementalMerge,
+    MergeRegion,
+    do_merge_frames,
+    do_merge_tiles,
+    generate_tiles_for_merge,
+    get_pixel_format,
+)
 from .utils.message_box import ShowMessageBox
+from .utils.perf import RenderGapStats, format_bytes
+from .utils.tile_preflight import TilePreflightError
+from .utils.tile_stats import TileStatsRecorder
 from .utils.saved_render_settings import (
     restore_render_settings,
     save_render_settings,
     SavedRenderSettings,
 )
-from .utils.render_tiles import RenderTile, do_render_tile, generate_tiles
+from .utils.render_tiles import RenderTile, do_render_tile, get_render_tiles, get_tile_frames
+from .utils.worker_pool import WorkerPool, get_worker_command, get_worker_threads
+
+
+# Delays for retrying to start a tile while Blender is still finishing the previous render job
+RETRY_DELAY_MIN = 0.005
+RETRY_DELAY_MAX = 0.25
+# Seconds to keep retrying for on Blender versions that can't tell whether a render job is still running
+RETRY_TIMEOUT = 10.0
+
+
+def create_incremental_merge(context: Context) -> Optional[IncrementalMerge]:
+    """The merge to composite tiles into as they are rendered, if Merge While Rendering is on and supported."""
+    settings: SRR_Settings = context.scene.srr_settings
+
+    if not settings.merge_while_rendering:
+        return None
+    if settings.use_multilayer:
+        print("Merging while rendering isn't supported for multilayer tiles, merge them once rendering is done.")
+        return None
+    if settings.use_frame_range:
+        print("Merging while rendering isn't supported for frame ranges, merge the frames once rendering is done.")
+        return None
 
+    canvas_filepath = None
+    if plan_merge(context).strategy != 'ram':
+        canvas_filepath = os.path.realpath(bpy.path.abspath(get_merge_scratch_filepath()))
+    return IncrementalMerge(generate_tiles_for_merge(context), canvas_filepath, get_pixel_format(context), settings.skip_empty_tiles)
 
-# Modal (Timer loop)
+
+# Modal (tiles are started by a bpy.app.timers callback as soon as the previous one is done;
+# the modal's timer only checks for cancelling and finishing)
 
 class SRR_OT_Render(Operator):
     bl_idname = "render.superres"
@@ -26,25 +69,92 @@ class SRR_OT_Render(Operator):
     rendering: bool = False
     tiles: List[RenderTile] = None
     saved_settings: SavedRenderSettings = None
+    merge: IncrementalMerge = None
+    stats_recorder: TileStatsRecorder = None
+    gap_stats: RenderGapStats = None
+    window = None
+    retry_delay: float = RETRY_DELAY_MIN
+    retry_started: Optional[float] = None
+    scheduler = None # The bound `start_next_tile`, kept so the timer can be unregistered
+    error: Optional[str] = None
 
     # Render callbacks
     def render_pre(self, scene: Scene, dummy):
         self.rendering = True
+        self.gap_stats.tile_started()
 
     def render_post(self, scene: Scene, dummy):
         settings: SRR_Settings = scene.srr_settings
         status: SRR_RenderStatus = settings.status
 
         # We're done with this tile.
-        self.tiles.pop(0)
+        tile = self.tiles.pop(0)
         status.tiles_done += 1
 
-        # Move on to the next
+        if self.merge:
+            self.merge.add_tile(tile.filepath)
+        elif self.stats_recorder:
+            self.stats_recorder.record(tile.filepath)
+
+    def render_complete(self, scene: Scene, dummy):
+        # The tile has been written and the render job has ended: move on to the next straight away
         self.rendering = False
+        self.gap_stats.tile_finished()
+        self.schedule_next_tile()
 
     def render_cancel(self, scene: Scene, dummy):
         self.stop = True
 
+    # Scheduling
+    def schedule_next_tile(self):
+        if not bpy.app.timers.is_registered(self.scheduler):
+            bpy.app.timers.register(self.scheduler, first_interval=0.0)
+
+    def start_next_tile(self):
+        """`bpy.app.timers` callback. Returns a delay to be called again after, or `None` when done."""
+        scene = bpy.context.scene
+        status: SRR_RenderStatus = scene.srr_settings.status
+
+        if self.stop or status.should_stop or not self.tiles or self.rendering:
+            # The modal finishes up
+            return None
+
+        try:
+            result = do_render_tile(bpy.context, self.tiles[0], scene.camera, self.window)
+        except Exception as e:
+            # Blender would drop this timer, leaving the modal waiting for a tile that never renders
+            print("Error starting to render tile:", e)
+            self.error = f"Couldn't start rendering tile {self.tiles[0].filepath}: {e}"
+            self.stop = True
+            return None
+
+        if 'CANCELLED' in result:
+            if self.is_render_job_running():
+                # Blender hasn't released the last render job yet; try again soon, backing off while it stays busy
+                delay = self.retry_delay
+                self.retry_delay = min(self.retry_delay * 2, RETRY_DELAY_MAX)
+                return delay
+
+            # The render was refused for another reason (e.g. no camera), which retrying won't fix
+            self.error = f"Couldn't start rendering tile {self.tiles[0].filepath}, see the console for details."
+            self.stop = True
+            return None
+
+        self.retry_delay = RETRY_DELAY_MIN
+        self.retry_started = None
+        self.rendering = True
+        return None
+
+    def is_render_job_running(self) -> bool:
+        if hasattr(bpy.app, "is_job_running"):
+            # Blender 3.3+
+            return bpy.app.is_job_running('RENDER')
+
+        # Otherwise keep retrying for a while, in case the last render job takes long to wind down
+        if self.retry_started is None:
+            self.retry_started = monotonic()
+        return monotonic() - self.retry_started < RETRY_TIMEOUT
+
     def execute(self, context: Context):
         scene = context.scene
         settings: SRR_Settings = scene.srr_settings
@@ -53,6 +163,12 @@ class SRR_OT_Render(Operator):
         # Reset state
         self.stop = False
         self.rendering = False
+        self.gap_stats = RenderGapStats()
+        self.window = context.window
+        self.retry_delay = RETRY_DELAY_MIN
+        self.retry_started = None
+        self.scheduler = self.start_next_tile
+        self.error = None
 
         # Save settings
         self.saved_settings = save_render_settings(context, scene.camera)
@@ -60,13 +176,21 @@ class SRR_OT_Render(Operator):
         # Prepare tiles
         # print("\n\n--------------")
         # print("Preparing tiles...")
-        self.tiles = generate_tiles(context, self.saved_settings)
+        self.tiles = get_render_tiles(context, self.saved_settings)
         if settings.start_tile > 1:
             self.tiles = self.tiles[settings.start_tile - 1:]
         if not self.tiles:
             ShowMessageBox("No tiles to render.")
             return {'CANCELLED'}
 
+        # Prepare incremental merge
+        self.merge = create_incremental_merge(context)
+
+        # The incremental merge decodes the tiles anyway and records their stats itself
+        self.stats_recorder = None
+        if settings.skip_empty_tiles and not settings.use_multilayer and not self.merge:
+            self.stats_recorder = TileStatsRecorder()
+
         status.tiles_total = len(self.tiles)
         status.tiles_done = 0
         status.is_rendering = True
@@ -75,12 +199,15 @@ class SRR_OT_Render(Operator):
         # Setup callbacks
         bpy.app.handlers.render_pre.append(self.render_pre)
         bpy.app.handlers.render_post.append(self.render_post)
+        bpy.app.handlers.render_complete.append(self.render_complete)
         bpy.app.handlers.render_cancel.append(self.render_cancel)
 
         # Setup timer and modal
         self._timer = context.window_manager.event_timer_add(0.5, window=context.window)
         context.window_manager.modal_handler_add(self)
 
+        self.schedule_next_tile()
+
         return {'RUNNING_MODAL'}
 
     def modal(self, context: Context, event):
@@ -94,38 +221,172 @@ class SRR_OT_Render(Operator):
         if event.type == 'TIMER':
             was_cancelled = self.stop or status.should_stop
 
-            if was_cancelled or not self.tiles:
+            if was_cancelled or not (self.tiles or self.rendering):
                 # print("\n*** STOPPING!")
                 # Remove callbacks & clean up
                 bpy.app.handlers.render_pre.remove(self.render_pre)
                 bpy.app.handlers.render_post.remove(self.render_post)
+                bpy.app.handlers.render_complete.remove(self.render_complete)
                 bpy.app.handlers.render_cancel.remove(self.render_cancel)
+                if bpy.app.timers.is_registered(self.scheduler):
+                    bpy.app.timers.unregister(self.scheduler)
                 context.window_manager.event_timer_remove(self._timer)
 
+                print(self.gap_stats.report())
+
                 status.should_stop = False
                 status.is_rendering = False
 
                 restore_render_settings(context, self.saved_settings, scene.camera)
 
+                if self.stats_recorder:
+                    self.stats_recorder.close()
+
                 if was_cancelled:
-                    self.report({'WARNING'}, "Rendering aborted")
+                    if self.merge:
+                        self.merge.cancel()
+                    if self.error:
+                        self.report({'ERROR'}, self.error)
+                    else:
+                        self.report({'WARNING'}, "Rendering aborted")
                     return {'CANCELLED'}
 
-                self.report({'INFO'}, "Rendering done")
+                if self.merge:
+                    stats = self.merge.finish(context)
+                    self.report({'INFO'}, f"Rendering and merging done! {stats.report().splitlines()[-1]}")
+                    ShowMessageBox("Rendering and merging done!", "Success")
+                    return {'FINISHED'}
+
+                self.report({'INFO'}, f"Rendering done. {self.gap_stats.report()}")
                 ShowMessageBox("Rendering done!", "Success")
                 return {'FINISHED'}
 
-            elif self.rendering is False:
-                # print("\n=== Ready to render!")
-                tile = self.tiles[0]
-                # print(tile)
-
-                do_render_tile(context, tile, scene.camera)
-
         # Allow stop button to cancel rendering rather than this modal
         return {'PASS_THROUGH'}
 
 
+def get_worker_blend_filepath() -> str:
+    """The copy of the .blend file render workers load, next to it so relative paths resolve the same."""
+    return f"{os.path.splitext(bpy.data.filepath)[0]}_srr_workers.blend"
+
+
+# Modal (background Blender processes render the tiles; the modal's timer hands them out and collects the results)
+
+class SRR_OT_RenderWorkers(Operator):
+    bl_idname = "render.superres_workers"
+    bl_label = "Super Render (Workers)"
+    bl_description = "Renders the tiles in several background Blender processes at once"
+
+    _timer: Timer = None
+    stop: bool = False
+    tiles: Dict[int, RenderTile] = None # By index in `get_render_tiles()`
+    failed: List[RenderTile] = None
+    pool: WorkerPool = None
+    merge: IncrementalMerge = None
+    blend_filepath: str = None
+
+    @classmethod
+    def poll(cls, context: Context):
+        settings: SRR_Settings = context.scene.srr_settings
+        return not settings.status.is_rendering and settings.render_workers > 0
+
+    def execute(self, context: Context):
+        scene = context.scene
+        settings: SRR_Settings = scene.srr_settings
+        status: SRR_RenderStatus = settings.status
+
+        if not bpy.data.filepath:
+            ShowMessageBox("Save the .blend file first, the workers render it from disk.")
+            return {'CANCELLED'}
+
+        tiles = get_render_tiles(context, save_render_settings(context, scene.camera))
+        self.tiles = {index: tiles[index] for index in range(settings.start_tile - 1, len(tiles))}
+        if not self.tiles:
+            ShowMessageBox("No tiles to render.")
+            return {'CANCELLED'}
+
+        # Workers render the scene as it is now, unsaved changes included
+        self.blend_filepath = get_worker_blend_filepath()
+        bpy.ops.wm.save_as_mainfile(filepath=self.blend_filepath, copy=True)
+
+        self.stop = False
+        self.failed = []
+        self.merge = create_incremental_merge(context)
+
+        # The incremental merge decodes the tiles anyway and records their stats itself
+        extra_args = ['--set', 'skip_empty_tiles=false'] if self.merge else []
+        worker_count = min(settings.render_workers, len(self.tiles))
+        command = get_worker_command(bpy.app.binary_path, self.blend_filepath, get_worker_threads(worker_count), extra_args)
+        self.pool = WorkerPool(command, list(self.tiles), worker_count)
+        print(f"Rendering {len(self.tiles)} tiles with {worker_count} workers...")
+
+        status.tiles_total = len(self.tiles)
+        status.tiles_done = 0
+        status.is_rendering = True
+        status.should_stop = False
+
+        self._timer = context.window_manager.event_timer_add(0.1, window=context.window)
+        context.window_manager.modal_handler_add(self)
+
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context: Context, event):
+        settings: SRR_Settings = context.scene.srr_settings
+        status: SRR_RenderStatus = settings.status
+
+        if event.type == 'ESC':
+            self.stop = True
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        for (result, index, message) in self.pool.poll():
+            tile = self.tiles[index]
+            if result == 'done':
+                status.tiles_done += 1
+                if self.merge:
+                    self.merge.add_tile(tile.filepath)
+            else:
+                self.failed.append(tile)
+                print(f"Tile {tile.filepath} failed: {message}")
+
+        was_cancelled = self.stop or status.should_stop
+        if not (was_cancelled or self.pool.is_finished):
+            return {'PASS_THROUGH'}
+
+        # Clean up
+        context.window_manager.event_timer_remove(self._timer)
+        self.pool.stop()
+        try:
+            os.remove(self.blend_filepath)
+        except OSError:
+            pass
+
+        status.should_stop = False
+        status.is_rendering = False
+
+        missing = len(self.tiles) - status.tiles_done
+        if was_cancelled or missing:
+            if self.merge:
+                self.merge.cancel()
+            if was_cancelled:
+                self.report({'WARNING'}, "Rendering aborted")
+            else:
+                self.report({'ERROR'}, f"{missing} of {len(self.tiles)} tiles weren't rendered, see the console.")
+                ShowMessageBox(f"{missing} tiles weren't rendered, see the console.", "Error", 'ERROR')
+            return {'CANCELLED'}
+
+        if self.merge:
+            stats = self.merge.finish(context)
+            self.report({'INFO'}, f"Rendering and merging done! {stats.report().splitlines()[-1]}")
+            ShowMessageBox("Rendering and merging done!", "Success")
+            return {'FINISHED'}
+
+        self.report({'INFO'}, "Rendering done.")
+        ShowMessageBox("Rendering done!", "Success")
+        return {'FINISHED'}
+
+
 class SRR_OT_StopRender(Operator):
     bl_idname = "render.superres_kill"
     bl_label = "Stop Super Render"
@@ -144,6 +405,41 @@ class SRR_OT_Merge(Operator):
     bl_label = "Super Res Merge Tiles"
     bl_description = "Merge rendered tiles into final resolution image"
 
+    use_region: BoolProperty(
+        name="Region Only",
+        description="Only merge a rectangle of the image, loading just the tiles it overlaps, into an output of its own",
+        default=False,
+        options={'SKIP_SAVE'},
+    )
+
+    region_x: IntProperty(
+        name="X",
+        description="Left edge of the region, in pixels",
+        default=0,
+        min=0,
+    )
+
+    region_y: IntProperty(
+        name="Y",
+        description="Bottom edge of the region, in pixels from the bottom of the image (as in the Image Editor)",
+        default=0,
+        min=0,
+    )
+
+    region_width: IntProperty(
+        name="Width",
+        description="Width of the region, in pixels",
+        default=1920,
+        min=1,
+    )
+
+    region_height: IntProperty(
+        name="Height",
+        description="Height of the region, in pixels",
+        default=1080,
+        min=1,
+    )
+
     @classmethod
     def poll(cls, context: Context):
         scene = context.scene
@@ -152,14 +448,90 @@ class SRR_OT_Merge(Operator):
 
         return not status.is_rendering
 
+    def invoke(self, context: Context, event):
+        if self.use_region:
+            return context.window_manager.invoke_props_dialog(self)
+        return self.execute(context)
+
+    def draw(self, context: Context):
+        layout = self.layout
+        render = context.scene.render
+
+        col = layout.column(align=True)
+        col.label(text=f"Region of the {render.resolution_x}x{render.resolution_y} image:")
+        row = col.row(align=True)
+        row.prop(self, "region_x")
+        row.prop(self, "region_y")
+        row = col.row(align=True)
+        row.prop(self, "region_width")
+        row.prop(self, "region_height")
+
+    def get_region(self, context: Context) -> MergeRegion:
+        """The requested region, clipped to the image. Empty if it lies outside it."""
+        render = context.scene.render
+        region = MergeRegion(self.region_x, self.region_y, self.region_width, self.region_height)
+        return region.clip((render.resolution_x, render.resolution_y))
+
     def execute(self, context: Context):
-        self.report({'INFO'}, "Merging tiles...")
+        scene = context.scene
+        settings: SRR_Settings = scene.srr_settings
+        frame = scene.frame_current if settings.use_frame_range else None
+
+        region = None
+        if self.use_region:
+            region = self.get_region(context)
+            if not (region.width and region.height):
+                self.report({'ERROR'}, "The region lies outside the image.")
+                return {'CANCELLED'}
+
+        plan = plan_merge(context, region_size=(region.width, region.height) if region else None)
+        strategy = f"{get_merge_strategy_name(plan.strategy)}{', picked automatically' if plan.automatic else ''}"
+        self.report({'INFO'}, f"Merging {f'{region.width}x{region.height} region' if region else 'tiles'}: {strategy}...")
+        if not plan.fits:
+            self.report({'WARNING'}, f"The merge is estimated to need ~{format_bytes(plan.estimate.peak_memory)}, "
+                f"more than the {format_bytes(plan.budget)} memory budget.")
+
+        tiles = generate_tiles_for_merge(context, frame)
+
+        try:
+            stats = do_merge_tiles(context, tiles, frame, region=region)
+        except TilePreflightError as e:
+            self.report({'ERROR'}, f"Can't merge tiles: {len(e.problems)} problem(s), see the console")
+            ShowMessageBox(str(e), "Can't merge tiles", 'ERROR')
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, f"Merge tiles done! {stats.report().splitlines()[-1]}")
+        ShowMessageBox("Merging tiles done!", "Success")
 
-        tiles = generate_tiles_for_merge(context)
+        return {'FINISHED'}
 
-        do_merge_tiles(context, tiles)
 
-        self.report({'INFO'}, "Merge tiles done!")
-        ShowMessageBox("Merging tiles done!", "Success")
+class SRR_OT_MergeFrames(Operator):
+    bl_idname = "render.superres_merge_frames"
+    bl_label = "Super Res Merge Frames"
+    bl_description = "Merge the rendered tiles of every frame in the frame range, encoding each frame while the next one is merged"
+
+    @classmethod
+    def poll(cls, context: Context):
+        scene = context.scene
+        settings: SRR_Settings = scene.srr_settings
+        status: SRR_RenderStatus = settings.status
+
+        return settings.use_frame_range and not status.is_rendering
+
+    def execute(self, context: Context):
+        frames = get_tile_frames(context)
+        self.report({'INFO'}, f"Merging {len(frames)} frames...")
+
+        try:
+            frame_stats = do_merge_frames(context, frames)
+        except TilePreflightError as e:
+            self.report({'ERROR'}, f"Can't merge tiles: {len(e.problems)} problem(s), see the console")
+            ShowMessageBox(str(e), "Can't merge tiles", 'ERROR')
+            return {'CANCELLED'}
+
+        tiles_merged = sum(stats.tiles for stats in frame_stats)
+        self.report({'INFO'}, f"Merged {len(frame_stats)} frames ({tiles_merged} tiles).")
+        ShowMessageBox("Merging frames done!", "Success")
 
         return {'FINISHED'}
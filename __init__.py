@@ -34,8 +34,10 @@ from .SRR_Settings import (
 )
 from .SuperResRender import (
     SRR_OT_Render,
+    SRR_OT_RenderWorkers,
     SRR_OT_StopRender,
     SRR_OT_Merge,
+    SRR_OT_MergeFrames,
 )
 from .SplitCamera import (
     SRR_OT_SplitCamera,
@@ -123,8 +125,10 @@ classes = (
     SRR_RenderStatus,
     SRR_Settings,
     SRR_OT_Render,
+    SRR_OT_RenderWorkers,
     SRR_OT_StopRender,
     SRR_OT_Merge,
+    SRR_OT_MergeFrames,
     SRR_OT_SplitCamera,
     SRR_UI_PT_Panel,
     DemoPreferences,
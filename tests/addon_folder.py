@@ -0,0 +1,15 @@
+"""
+pytest plugin loaded by pytest.ini: the add-on's folder is a package whose `__init__` needs Blender,
+so it is collected as a plain folder instead, which pytest would otherwise import to set it up.
+"""
+
+import os
+
+import pytest
+
+ADDON_DIRPATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def pytest_collect_directory(path, parent):
+    if str(path) == ADDON_DIRPATH:
+        return pytest.Dir.from_parent(parent, path=path)
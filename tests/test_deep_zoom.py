@@ -0,0 +1,77 @@
+import os
+from math import ceil
+
+import numpy as np
+import pytest
+
+from utils.color import to_display_rgba8
+from utils.deep_zoom import DeepZoomWriter, box_downsample_2x
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def make_image(height, width):
+    rng = np.random.default_rng(height * width)
+    return rng.random((height, width, 4), dtype=np.float32)
+
+
+def read_level(files_dirpath, level, tile_size):
+    """Assemble a pyramid level from its tiles, checking every tile but those on the right and bottom edges is full size."""
+    names = os.listdir(os.path.join(files_dirpath, str(level)))
+    columns = 1 + max(int(name.split('_')[0]) for name in names)
+    rows = 1 + max(int(name.split('_')[1].split('.')[0]) for name in names)
+    assert len(names) == columns * rows
+
+    strips = []
+    for row in range(rows):
+        tiles = []
+        for column in range(columns):
+            with Image.open(os.path.join(files_dirpath, str(level), f"{column}_{row}.png")) as tile:
+                tiles.append(np.asarray(tile))
+            if column < columns - 1:
+                assert tiles[-1].shape[1] == tile_size
+        if row < rows - 1:
+            assert tiles[0].shape[0] == tile_size
+        strips.append(np.concatenate(tiles, axis=1))
+    return np.concatenate(strips)
+
+
+def test_box_downsample_odd_width():
+    rows = np.arange(2 * 3, dtype=np.float32).reshape(2, 3, 1)
+
+    # The odd last column is averaged with itself
+    np.testing.assert_array_equal(box_downsample_2x(rows)[:, :, 0], [[2.0, 3.5]])
+
+
+@pytest.mark.parametrize("width, height, band_height", [(100, 37, 16), (64, 64, 64), (33, 70, 7)])
+def test_pyramid(tmp_path, width, height, band_height):
+    image = make_image(height, width)
+    basepath = str(tmp_path / "output")
+    tile_size = 32
+
+    writer = DeepZoomWriter(basepath, width, height, tile_size)
+    for y in range(0, height, band_height):
+        writer.write_rows(image[y:y + band_height])
+    writer.close()
+
+    with open(f"{basepath}.dzi") as f:
+        dzi = f.read()
+    assert f'TileSize="{tile_size}"' in dzi
+    assert f'<Size Width="{width}" Height="{height}"/>' in dzi
+
+    files_dirpath = f"{basepath}_files"
+    max_level = ceil(np.log2(max(width, height)))
+    assert sorted(map(int, os.listdir(files_dirpath))) == list(range(max_level + 1))
+
+    # The top level is the image itself, each level below half the one above it
+    expected = image
+    for level in range(max_level, -1, -1):
+        scale = 2 ** (max_level - level)
+        pixels = read_level(files_dirpath, level, tile_size)
+        assert pixels.shape == (ceil(height / scale), ceil(width / scale), 4)
+        np.testing.assert_allclose(pixels.astype(int), to_display_rgba8(expected), atol=1)
+
+        if expected.shape[0] % 2:
+            # An odd last row is paired with itself
+            expected = np.concatenate((expected, expected[-1:]))
+        expected = box_downsample_2x(expected)
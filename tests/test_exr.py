@@ -0,0 +1,147 @@
+import numpy as np
+import pytest
+
+from utils.exr import (
+    COMPRESSION_NONE,
+    COMPRESSION_ZIP,
+    COMPRESSION_ZIPS,
+    PIXEL_FLOAT,
+    PIXEL_HALF,
+    ExrError,
+    ExrScanlineWriter,
+    ExrTiledWriter,
+    read_exr_channels,
+    read_exr_header,
+    read_exr_rgba,
+)
+
+
+def make_image(height, width, channels):
+    rng = np.random.default_rng(height * width * channels)
+    return rng.random((height, width, channels)).astype(np.float32)
+
+
+def write_scanlines(filepath, image, channel_names, band_height=7, **kwargs):
+    (height, width, _) = image.shape
+    with ExrScanlineWriter(str(filepath), width, height, channel_names, **kwargs) as writer:
+        for y in range(0, height, band_height):
+            writer.write_rows(image[y:y + band_height])
+
+
+@pytest.mark.parametrize("compression", [COMPRESSION_NONE, COMPRESSION_ZIPS, COMPRESSION_ZIP])
+@pytest.mark.parametrize("height", [1, 16, 37])
+def test_scanline_round_trip(tmp_path, compression, height):
+    image = make_image(height, 23, 4)
+    filepath = tmp_path / "tile.exr"
+    write_scanlines(filepath, image, ['R', 'G', 'B', 'A'], pixel_type=PIXEL_FLOAT, compression=compression)
+
+    header = read_exr_header(str(filepath))
+    assert header.size == (23, height)
+    assert header.channel_names == ['A', 'B', 'G', 'R']
+
+    # Rows come back bottom-to-top, like Blender's pixels
+    np.testing.assert_array_equal(read_exr_rgba(str(filepath)), image[::-1])
+
+
+def test_half_channels_keep_their_pixel_type(tmp_path):
+    image = make_image(20, 9, 3)
+    filepath = tmp_path / "passes.exr"
+    write_scanlines(filepath, image, ['Depth.V', 'Image.R', 'Image.G'], pixel_type=[PIXEL_FLOAT, PIXEL_HALF, PIXEL_HALF])
+
+    (_, channels) = read_exr_channels(str(filepath), ['Depth.V', 'Image.G'])
+    assert set(channels) == {'Depth.V', 'Image.G'}
+    assert channels['Depth.V'].dtype == np.float32
+    assert channels['Image.G'].dtype == np.float16
+    np.testing.assert_array_equal(channels['Depth.V'], image[:, :, 0])
+    np.testing.assert_array_equal(channels['Image.G'], image[:, :, 2].astype(np.float16))
+
+
+def test_missing_channels_are_reported(tmp_path):
+    filepath = tmp_path / "tile.exr"
+    write_scanlines(filepath, make_image(4, 4, 1), ['R'])
+
+    with pytest.raises(RuntimeError, match="missing channels G"):
+        read_exr_channels(str(filepath), ['R', 'G'])
+
+
+def test_rgb_tile_is_opaque(tmp_path):
+    image = make_image(18, 11, 3)
+    filepath = tmp_path / "tile.exr"
+    write_scanlines(filepath, image, ['R', 'G', 'B'], pixel_type=PIXEL_FLOAT)
+
+    pixels = read_exr_rgba(str(filepath))
+    np.testing.assert_array_equal(pixels[:, :, :3], image[::-1])
+    assert np.all(pixels[:, :, 3] == 1.0)
+
+
+@pytest.mark.parametrize("channel_names", [['Y'], ['R'], ['A', 'Y']])
+def test_greyscale_tile_fills_colour(tmp_path, channel_names):
+    image = make_image(5, 6, len(channel_names))
+    filepath = tmp_path / "tile.exr"
+    write_scanlines(filepath, image, channel_names, pixel_type=PIXEL_FLOAT)
+
+    pixels = read_exr_rgba(str(filepath))
+    grey = image[::-1, :, -1]
+    for index in range(3):
+        np.testing.assert_array_equal(pixels[:, :, index], grey)
+    expected_alpha = image[::-1, :, 0] if 'A' in channel_names else 1.0
+    np.testing.assert_array_equal(pixels[:, :, 3], np.broadcast_to(expected_alpha, grey.shape))
+
+
+def test_tile_without_colour_is_left_to_blender(tmp_path):
+    filepath = tmp_path / "tile.exr"
+    write_scanlines(filepath, make_image(3, 3, 1), ['Depth.V'])
+
+    with pytest.raises(ExrError):
+        read_exr_rgba(str(filepath))
+
+
+def test_not_an_exr(tmp_path):
+    filepath = tmp_path / "tile.exr"
+    filepath.write_bytes(b"\x89PNG\r\n\x1a\n" + bytes(64))
+
+    with pytest.raises(ExrError):
+        read_exr_header(str(filepath))
+
+
+def test_tiled_writer_resume(tmp_path):
+    OpenEXR = pytest.importorskip("OpenEXR")
+
+    image = make_image(45, 70, 4)
+    filepath = str(tmp_path / "merged.exr")
+    tile_size = (32, 16)
+    writer = ExrTiledWriter(filepath, 70, 45, tile_size, ['R', 'G', 'B', 'A'], pixel_type=PIXEL_FLOAT)
+    tiles = [(col, row) for row in range(writer.tiles_y) for col in range(writer.tiles_x)]
+
+    def write(col, row):
+        (tile_y, tile_x) = writer.expected_tile_shape(col, row)
+        y = row * tile_size[1]
+        x = col * tile_size[0]
+        writer.write_tile(col, row, writer.encode_tile(col, row, image[y:y + tile_y, x:x + tile_x]))
+
+    for (col, row) in tiles[:3]:
+        write(col, row)
+    state = writer.checkpoint_state()
+    # Written after the checkpoint, so dropped on resuming
+    write(*tiles[3])
+    writer.file.close()
+
+    writer = ExrTiledWriter(filepath, 70, 45, tile_size, ['R', 'G', 'B', 'A'], pixel_type=PIXEL_FLOAT, resume_state=state)
+    for (col, row) in tiles[3:]:
+        write(col, row)
+    writer.close()
+
+    with OpenEXR.File(filepath, separate_channels=True) as exr:
+        # Tiles are written in any order
+        assert exr.header()['lineOrder'] == OpenEXR.RANDOM_Y
+        channels = exr.parts[0].channels
+        for (index, name) in enumerate('RGBA'):
+            np.testing.assert_array_equal(channels[name].pixels, image[:, :, index])
+
+
+def test_tiled_writer_requires_every_tile(tmp_path):
+    writer = ExrTiledWriter(str(tmp_path / "merged.exr"), 40, 40, (32, 32), ['R', 'G', 'B', 'A'])
+    writer.write_tile(0, 0, writer.encode_empty_tile(0, 0))
+
+    with pytest.raises(RuntimeError, match="3 tiles were never written"):
+        writer.close()
@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+
+import pytest
+
+from utils.merge_planner import estimate_merge, get_auto_strategies, plan_merge
+
+GIB = 1024 ** 3
+
+
+def make_context(resolution=(16384, 16384), file_format='OPEN_EXR', **settings):
+    """The parts of a Blender context the planner reads."""
+    defaults = dict(subdivisions='3', merge_backend='numpy', merge_channels='RGBA', merge_precision='32', memory_budget=64.0,
+        merge_view_transform='NONE', prefetch_depth=4, export_deep_zoom=False, extra_outputs=set(), use_multilayer=False,
+        merge_strategy='auto')
+    defaults.update(settings)
+    render = SimpleNamespace(resolution_x=resolution[0], resolution_y=resolution[1],
+        image_settings=SimpleNamespace(file_format=file_format, color_depth='32'))
+    return SimpleNamespace(scene=SimpleNamespace(render=render, srr_settings=SimpleNamespace(**defaults)))
+
+
+def estimate(strategy, **kwargs):
+    # The defaults of `make_context()`
+    arguments = dict(resolution=(16384, 16384), max_tile=(2048, 2048), channel_count=4, sample_size=4, file_format='OPEN_EXR',
+        prefetch_depth=4)
+    arguments.update(kwargs)
+    return estimate_merge(strategy, **arguments)
+
+
+def test_out_of_core_strategies_need_less_memory():
+    (ram, memmap, stream, tiled) = (estimate(strategy) for strategy in ('ram', 'memmap', 'stream', 'tiled'))
+
+    # The canvas alone is 4 GiB
+    assert ram.peak_memory > 4 * GIB
+    for strategy in (memmap, stream, tiled):
+        assert strategy.peak_memory < 2 * GIB
+    # Paging the canvas costs I/O
+    assert memmap.io_bytes > ram.io_bytes
+    assert (stream.output_format, tiled.output_format) == ('TIFF', 'OPEN_EXR')
+
+
+def test_memmap_needs_blender_for_other_formats():
+    # Only EXRs are saved from the memory-mapped canvas a chunk at a time
+    assert estimate('memmap', file_format='PNG').peak_memory > 4 * GIB
+
+
+def test_half_precision_halves_the_canvas():
+    full = estimate('ram', sample_size=4)
+    half = estimate('ram', sample_size=2)
+
+    assert full.peak_memory - half.peak_memory >= 16384 * 16384 * 4 * 2
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        estimate('bogus')
+
+
+def test_chosen_strategy_is_kept():
+    plan = plan_merge(make_context(merge_strategy='ram', memory_budget=0.5))
+
+    assert plan.strategy == 'ram'
+    assert not plan.automatic
+    assert not plan.fits
+
+
+def test_auto_prefers_ram_within_budget():
+    plan = plan_merge(make_context(memory_budget=64.0))
+
+    assert (plan.strategy, plan.automatic, plan.fits) == ('ram', True, True)
+    assert plan.budget == 64 * GIB
+
+
+@pytest.mark.parametrize("file_format, budget, expected", [('OPEN_EXR', 1.0, 'memmap'), ('PNG', 2.0, 'stream'), ('PNG', 1.2, 'tiled')])
+def test_auto_falls_back_to_out_of_core_merges(file_format, budget, expected):
+    plan = plan_merge(make_context(file_format=file_format, memory_budget=budget))
+
+    assert plan.strategy == expected
+    assert plan.fits
+
+
+def test_auto_picks_least_memory_if_nothing_fits():
+    plan = plan_merge(make_context(memory_budget=0.0001))
+
+    assert not plan.fits
+    candidates = [estimate(strategy) for strategy in get_auto_strategies('OPEN_EXR')]
+    assert plan.estimate.peak_memory == min(candidate.peak_memory for candidate in candidates)
+
+
+def test_region_never_uses_tiled():
+    assert 'tiled' not in get_auto_strategies('OPEN_EXR', region=True)
+
+    plan = plan_merge(make_context(merge_strategy='tiled'), region_size=(4000, 3000))
+    assert plan.strategy == 'memmap'
+
+
+def test_region_size_limits_the_estimate():
+    full = plan_merge(make_context(merge_strategy='ram'))
+    region = plan_merge(make_context(merge_strategy='ram'), region_size=(1000, 1000))
+
+    # Tiles are cropped to the region too
+    assert region.estimate.peak_memory < full.estimate.peak_memory / 50
+
+
+def test_multilayer_and_array_backend():
+    assert plan_merge(make_context(use_multilayer=True)).strategy == 'multilayer'
+
+    plan = plan_merge(make_context(merge_backend='array', memory_budget=0.0001))
+    assert (plan.strategy, plan.automatic) == ('ram', True)
@@ -0,0 +1,276 @@
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+try:
+    import bpy
+except ImportError:
+    # Outside Blender: the types the merge annotates with and an empty image list. Paths are set up per test.
+    bpy = types.ModuleType("bpy")
+    bpy.types = types.ModuleType("bpy.types")
+    bpy.types.Context = type("Context", (), {})
+    bpy.types.Image = type("Image", (), {})
+    bpy.data = types.SimpleNamespace(images={})
+    bpy.app = types.SimpleNamespace(version=(4, 2, 0))
+    sys.modules.update({"bpy": bpy, "bpy.types": bpy.types})
+
+from utils import merge_tiles
+from utils.color import convert_channels, quantise_for_display
+from utils.exr import COMPRESSION_ZIP, PIXEL_FLOAT, ExrScanlineWriter, read_exr_channels, read_exr_rgba
+from utils.merge_checkpoint import get_checkpoint_filepath, get_partial_filepath
+from utils.merge_tiles import (
+    FrameEncodeQueue,
+    MergeRegion,
+    do_merge_tiles,
+    generate_tiles_for_merge,
+    get_merged_image_filepath,
+)
+from utils.tile_stats import write_tile_stats
+
+RESOLUTION = (97, 61)
+
+
+class BlendPaths:
+    """Stands in for `bpy.path`, with the blend file in `dirpath`."""
+
+    def __init__(self, dirpath):
+        self.dirpath = dirpath
+
+    def abspath(self, path):
+        return os.path.join(self.dirpath, path[2:]) if path.startswith("//") else path
+
+    @staticmethod
+    def ensure_ext(path, ext):
+        return path if path.lower().endswith(ext) else path + ext
+
+
+@pytest.fixture(autouse=True)
+def blend_dirpath(tmp_path, monkeypatch):
+    """Tiles and outputs are relative to the blend file, here each test's own folder."""
+    monkeypatch.setattr(bpy, "path", BlendPaths(str(tmp_path)), raising=False)
+    (tmp_path / "PartRenders").mkdir()
+    return tmp_path
+
+
+def make_context(file_format='OPEN_EXR', resolution=RESOLUTION, **settings):
+    """The parts of a Blender context the merge reads."""
+    defaults = dict(subdivisions='2', merge_backend='numpy', merge_strategy='ram', memory_budget=64.0, prefetch_depth=2,
+        merge_channels='RGBA', merge_precision='32', merge_view_transform='NONE', use_multilayer=False, use_merge_cache=False,
+        use_merge_checkpoints=False, skip_empty_tiles=False, collect_tile_stats=False, export_deep_zoom=False,
+        downsampled_outputs=set(), extra_outputs=set())
+    defaults.update(settings)
+    image_settings = types.SimpleNamespace(file_format=file_format, color_mode='RGBA', color_depth='8', exr_codec='ZIP',
+        tiff_codec='DEFLATE', compression=15)
+    render = types.SimpleNamespace(resolution_x=resolution[0], resolution_y=resolution[1], image_settings=image_settings,
+        dither_intensity=1.0)
+    return types.SimpleNamespace(scene=types.SimpleNamespace(render=render, srr_settings=types.SimpleNamespace(**defaults)))
+
+
+def make_image(resolution=RESOLUTION, seed=0):
+    """Linear float RGBA pixels, rows bottom-to-top like Blender's."""
+    rng = np.random.default_rng(seed)
+    return rng.random((resolution[1], resolution[0], 4), dtype=np.float32) * 2
+
+
+def write_tile(tile, image):
+    (tile_x, tile_y) = tile.dimensions
+    (offset_x, offset_y) = tile.offset
+    with ExrScanlineWriter(bpy.path.abspath(tile.filepath), tile_x, tile_y, ['R', 'G', 'B', 'A'], PIXEL_FLOAT, COMPRESSION_ZIP) as writer:
+        writer.write_rows(image[offset_y:offset_y + tile_y, offset_x:offset_x + tile_x][::-1])
+
+
+def write_tiles(context, image):
+    """Render `image` as the tiles of `context`'s scene."""
+    tiles = generate_tiles_for_merge(context)
+    for tile in tiles:
+        write_tile(tile, image)
+    return tiles
+
+
+def merge(context, tiles, **kwargs):
+    """Merge like a frame of a sequence, whose outputs are written by the encode queue where they can be."""
+    encode_queue = FrameEncodeQueue()
+    try:
+        return do_merge_tiles(context, tiles, encode_queue=encode_queue, **kwargs)
+    finally:
+        encode_queue.close()
+
+
+def read_output(file_format='OPEN_EXR', tiled=False, **kwargs):
+    """The merged image as a `(height, width, channels)` array, rows bottom-to-top like the canvas."""
+    filepath = get_merged_image_filepath(file_format, **kwargs)
+    if file_format == 'TIFF':
+        tifffile = pytest.importorskip("tifffile")
+        pixels = tifffile.imread(filepath)
+    elif file_format == 'PNG':
+        Image = pytest.importorskip("PIL.Image")
+        with Image.open(filepath) as image:
+            pixels = np.asarray(image)
+    elif tiled:
+        # Our reader only decodes scanline EXRs
+        OpenEXR = pytest.importorskip("OpenEXR")
+        with OpenEXR.File(filepath, separate_channels=True) as exr:
+            channels = {name: channel.pixels for (name, channel) in exr.parts[0].channels.items()}
+    else:
+        (_, channels) = read_exr_channels(filepath)
+
+    if file_format == 'OPEN_EXR':
+        pixels = np.dstack([channels[name] for name in "RGBAY" if name in channels])
+    return pixels.reshape(pixels.shape[:2] + (-1,))[::-1]
+
+
+@pytest.mark.parametrize("strategy, file_format", [('ram', 'OPEN_EXR'), ('memmap', 'OPEN_EXR'), ('stream', 'TIFF'), ('tiled', 'OPEN_EXR')])
+def test_strategies_match_the_image(strategy, file_format):
+    context = make_context(merge_strategy=strategy)
+    image = make_image()
+    tiles = write_tiles(context, image)
+
+    stats = merge(context, tiles)
+
+    assert stats.tiles == len(tiles) == 16
+    np.testing.assert_array_equal(read_output(file_format, tiled=strategy == 'tiled'), image)
+
+
+@pytest.mark.parametrize("strategy, file_format", [('stream', 'TIFF'), ('tiled', 'OPEN_EXR')])
+def test_strategies_that_need_numpy_with_the_array_backend(strategy, file_format):
+    # These always merge with NumPy, whichever backend is chosen
+    context = make_context(merge_strategy=strategy, merge_backend='array')
+    image = make_image()
+    tiles = write_tiles(context, image)
+
+    merge(context, tiles)
+
+    np.testing.assert_array_equal(read_output(file_format, tiled=strategy == 'tiled'), image)
+
+
+@pytest.mark.parametrize("channels, precision", [('RGB', '16'), ('BW', '32')])
+def test_channels_and_precision(channels, precision):
+    context = make_context(merge_channels=channels, merge_precision=precision)
+    image = make_image()
+    tiles = write_tiles(context, image)
+
+    # Without an encode queue, the reduced canvas is written straight to the EXR
+    do_merge_tiles(context, tiles)
+
+    expected = convert_channels(image, channels).astype(np.float16 if precision == '16' else np.float32)
+    np.testing.assert_array_equal(read_output(), expected)
+
+
+@pytest.mark.parametrize("strategy, file_format", [('ram', 'OPEN_EXR'), ('memmap', 'OPEN_EXR'), ('stream', 'TIFF')])
+def test_region(strategy, file_format):
+    context = make_context(merge_strategy=strategy)
+    image = make_image()
+    tiles = write_tiles(context, image)
+    # Across tile edges in both directions
+    region = MergeRegion(10, 7, 50, 40)
+
+    stats = merge(context, tiles, region=region)
+
+    assert stats.tiles < len(tiles)
+    np.testing.assert_array_equal(read_output(file_format, region=region), image[7:47, 10:60])
+
+
+def test_display_values_are_dithered_per_tile():
+    context = make_context('PNG', merge_view_transform='STANDARD')
+    image = make_image()
+    tiles = write_tiles(context, image)
+
+    merge(context, tiles)
+
+    # Each tile's noise is seeded by its offset, so the same tile always comes out the same
+    expected = np.empty(image.shape, dtype=np.uint8)
+    for tile in tiles:
+        (tile_x, tile_y) = tile.dimensions
+        (offset_x, offset_y) = tile.offset
+        area = (slice(offset_y, offset_y + tile_y), slice(offset_x, offset_x + tile_x))
+        expected[area] = quantise_for_display(image[area], 'STANDARD', np.uint8, 1.0, tile.offset)
+    np.testing.assert_array_equal(read_output('PNG'), expected)
+
+
+@pytest.mark.parametrize("strategy, file_format", [('memmap', 'OPEN_EXR'), ('stream', 'TIFF'), ('tiled', 'OPEN_EXR')])
+def test_interrupted_merge_is_resumed(strategy, file_format, monkeypatch, capsys):
+    context = make_context(merge_strategy=strategy, use_merge_checkpoints=True)
+    image = make_image()
+    tiles = write_tiles(context, image)
+
+    decode_tile = merge_tiles.decode_tile
+    decoded = []
+
+    def crash_on_tenth_tile(tile, *args, **kwargs):
+        if len(decoded) == 9:
+            raise RuntimeError("Out of memory")
+        decoded.append(tile)
+        return decode_tile(tile, *args, **kwargs)
+
+    monkeypatch.setattr(merge_tiles, "decode_tile", crash_on_tenth_tile)
+    with pytest.raises(RuntimeError, match="Out of memory"):
+        do_merge_tiles(context, tiles)
+
+    # Two bands of four tiles were checkpointed before the crash
+    decoded.clear()
+    monkeypatch.setattr(merge_tiles, "decode_tile", lambda tile, *args, **kwargs: decoded.append(tile) or decode_tile(tile, *args, **kwargs))
+    do_merge_tiles(context, tiles)
+
+    assert "Resuming interrupted merge: 8 of 16 tiles are already written." in capsys.readouterr().out
+    assert len(decoded) == 8
+    np.testing.assert_array_equal(read_output(file_format, tiled=strategy == 'tiled'), image)
+    # The checkpoint, partial output and memory-mapped canvas are cleaned up
+    filepath = get_merged_image_filepath(file_format)
+    assert not os.path.exists(get_checkpoint_filepath(filepath)) and not os.path.exists(get_partial_filepath(filepath))
+    assert sorted(os.listdir(bpy.path.abspath("//PartRenders"))) == sorted(os.path.basename(tile.filepath) for tile in tiles)
+
+
+def test_unchanged_tiles_are_skipped_and_changed_ones_patched(monkeypatch, capsys):
+    def load_image_into_canvas(filepath, canvas):
+        # Blender loads the previous output
+        canvas[:] = read_exr_rgba(filepath)
+
+    monkeypatch.setattr(merge_tiles, "load_image_into_canvas", load_image_into_canvas)
+    context = make_context(use_merge_cache=True)
+    image = make_image()
+    tiles = write_tiles(context, image)
+
+    assert merge(context, tiles).tiles == 16
+    assert merge(context, tiles).label == "cached"
+
+    # Render one tile again, differently
+    changed = make_image(seed=1)
+    write_tile(tiles[5], changed)
+    stats = merge(context, tiles)
+
+    assert "1 of 16 tiles changed since the last merge, patching them in." in capsys.readouterr().out
+    assert stats.tiles == 1
+    (tile_x, tile_y) = tiles[5].dimensions
+    (offset_x, offset_y) = tiles[5].offset
+    area = (slice(offset_y, offset_y + tile_y), slice(offset_x, offset_x + tile_x))
+    image[area] = changed[area]
+    np.testing.assert_array_equal(read_output(), image)
+
+    # Outputs written with the merge that weren't before need it done again
+    context.scene.srr_settings.downsampled_outputs = {'2'}
+    assert merge(context, tiles).tiles == 16
+    assert os.path.exists(get_merged_image_filepath('OPEN_EXR', scale=2))
+
+
+@pytest.mark.parametrize("strategy, file_format", [('ram', 'OPEN_EXR'), ('stream', 'TIFF'), ('tiled', 'OPEN_EXR')])
+def test_empty_tiles_are_skipped(strategy, file_format):
+    context = make_context(merge_strategy=strategy, skip_empty_tiles=True)
+    image = make_image()
+    tiles = generate_tiles_for_merge(context)
+    (tile_x, tile_y) = tiles[6].dimensions
+    (offset_x, offset_y) = tiles[6].offset
+    image[offset_y:offset_y + tile_y, offset_x:offset_x + tile_x] = 0.0
+    write_tiles(context, image)
+    # As recorded while rendering
+    for tile in tiles:
+        (tile_x, tile_y) = tile.dimensions
+        (offset_x, offset_y) = tile.offset
+        write_tile_stats(bpy.path.abspath(tile.filepath), image[offset_y:offset_y + tile_y, offset_x:offset_x + tile_x])
+
+    stats = merge(context, tiles)
+
+    assert (stats.tiles, stats.tiles_skipped) == (15, 1)
+    np.testing.assert_array_equal(read_output(file_format, tiled=strategy == 'tiled'), image)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from utils.png_writer import PngWriter, write_png
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def make_image(height, width, channels, dtype):
+    rng = np.random.default_rng(height * width * channels)
+    return rng.integers(0, np.iinfo(dtype).max, (height, width, channels), dtype=dtype, endpoint=True)
+
+
+def read_png(filepath, dtype):
+    with Image.open(filepath) as image:
+        image.load()
+        if np.dtype(dtype) == np.uint16:
+            # Pillow only reads 16 bit greyscale PNGs at full depth
+            return np.asarray(image, dtype=np.uint16)
+        return np.asarray(image)
+
+
+@pytest.mark.parametrize("channels, mode", [(1, 'L'), (2, 'LA'), (3, 'RGB'), (4, 'RGBA')])
+def test_round_trip_in_bands(tmp_path, channels, mode):
+    image = make_image(37, 29, channels, np.uint8)
+    filepath = str(tmp_path / "out.png")
+    with PngWriter(filepath, 29, 37, channels) as writer:
+        for y in range(0, 37, 8):
+            writer.write_rows(image[y:y + 8])
+
+    with Image.open(filepath) as png:
+        assert png.mode == mode
+    np.testing.assert_array_equal(read_png(filepath, np.uint8).reshape(image.shape), image)
+
+
+def test_16_bit(tmp_path):
+    image = make_image(9, 11, 1, np.uint16)
+    filepath = str(tmp_path / "out.png")
+    write_png(filepath, image)
+
+    np.testing.assert_array_equal(read_png(filepath, np.uint16), image[:, :, 0])
+
+
+def test_unsupported_sample_type(tmp_path):
+    with pytest.raises(ValueError):
+        PngWriter(str(tmp_path / "out.png"), 4, 4, 4, np.float32)
+
+
+def test_wrong_row_shape(tmp_path):
+    with PngWriter(str(tmp_path / "out.png"), 4, 1, 3) as writer:
+        with pytest.raises(ValueError):
+            writer.write_rows(np.zeros((1, 4, 4), dtype=np.uint8))
+        writer.write_rows(np.zeros((1, 4, 3), dtype=np.uint8))
+
+
+def test_missing_rows(tmp_path):
+    writer = PngWriter(str(tmp_path / "out.png"), 4, 4, 3)
+    writer.write_rows(np.zeros((3, 4, 3), dtype=np.uint8))
+
+    with pytest.raises(RuntimeError, match="Wrote 3 rows"):
+        writer.close()
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from utils.tiff_writer import TiffStripWriter
+
+tifffile = pytest.importorskip("tifffile")
+
+
+def make_image(height, width, channels, dtype):
+    rng = np.random.default_rng(height * width)
+    if np.dtype(dtype).kind == 'f':
+        return rng.random((height, width, channels)).astype(dtype)
+    return rng.integers(0, np.iinfo(dtype).max, (height, width, channels), dtype=dtype)
+
+
+def write_in_bands(filepath, image, band_height, rows_per_strip, compress=True, **kwargs):
+    (height, width, channels) = image.shape
+    with TiffStripWriter(filepath, width, height, channels, image.dtype, rows_per_strip=rows_per_strip, compress=compress, **kwargs) as writer:
+        for y in range(0, height, band_height):
+            writer.write_rows(image[y:y + band_height])
+    return writer
+
+
+@pytest.mark.parametrize("height, band_height, rows_per_strip", [(63, 32, 32), (61, 16, 16), (100, 7, 3), (5, 64, 64)])
+@pytest.mark.parametrize("dtype", [np.float32, np.float16, np.uint8, np.uint16])
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip_uneven_heights(tmp_path, height, band_height, rows_per_strip, dtype, compress):
+    image = make_image(height, 37, 4, dtype)
+    filepath = str(tmp_path / "out.tif")
+
+    write_in_bands(filepath, image, band_height, rows_per_strip, compress)
+
+    np.testing.assert_array_equal(tifffile.imread(filepath), image)
+
+
+def test_bigtiff_round_trip(tmp_path):
+    image = make_image(19, 11, 3, np.uint16)
+    filepath = str(tmp_path / "out.tif")
+
+    write_in_bands(filepath, image, 8, 8, bigtiff=True)
+
+    with tifffile.TiffFile(filepath) as tif:
+        assert tif.is_bigtiff
+        np.testing.assert_array_equal(tif.asarray(), image)
+
+
+def test_checkpoint_part_way_through_a_strip_fails(tmp_path):
+    image = make_image(63, 8, 4, np.float32)
+    with TiffStripWriter(str(tmp_path / "out.tif"), 8, 63, 4, np.float32, rows_per_strip=32) as writer:
+        writer.write_rows(image[:20])
+        with pytest.raises(RuntimeError):
+            writer.checkpoint_state()
+        writer.write_rows(image[20:])
+
+
+def test_checkpoint_after_short_last_strip(tmp_path):
+    # 63 rows in strips of 32: the last band leaves a short strip, which is the end of the image
+    image = make_image(63, 8, 4, np.float32)
+    filepath = str(tmp_path / "out.tif")
+    with TiffStripWriter(filepath, 8, 63, 4, np.float32, rows_per_strip=32) as writer:
+        writer.write_rows(image[:32])
+        writer.checkpoint_state()
+        writer.write_rows(image[32:])
+        state = writer.checkpoint_state()
+
+    assert state['rows_written'] == 63
+    np.testing.assert_array_equal(tifffile.imread(filepath), image)
+
+
+def test_resume_from_checkpoint(tmp_path):
+    image = make_image(63, 8, 4, np.uint16)
+    filepath = str(tmp_path / "out.tif")
+
+    writer = TiffStripWriter(filepath, 8, 63, 4, np.uint16, rows_per_strip=16)
+    writer.write_rows(image[:32])
+    state = writer.checkpoint_state()
+    # Interrupted after writing part of the next band
+    writer.write_rows(image[32:48])
+    writer.file.close()
+
+    with TiffStripWriter(filepath, 8, 63, 4, np.uint16, rows_per_strip=16, resume_state=state) as resumed:
+        resumed.write_rows(image[32:])
+
+    np.testing.assert_array_equal(tifffile.imread(filepath), image)
+
+
+def test_close_with_missing_rows_fails(tmp_path):
+    writer = TiffStripWriter(str(tmp_path / "out.tif"), 8, 10, 1, np.uint8, rows_per_strip=4)
+    writer.write_rows(np.zeros((6, 8, 1), np.uint8))
+    with pytest.raises(RuntimeError):
+        writer.close()
@@ -0,0 +1,178 @@
+import threading
+import time
+import urllib.error
+
+import pytest
+
+from utils.tile_coordinator import (
+    CoordinatorClient,
+    CoordinatorServer,
+    Heartbeat,
+    TileCoordinator,
+    TileLease,
+    UNASSIGNED,
+    is_loopback_host,
+)
+
+
+@pytest.fixture
+def coordinator(tmp_path):
+    return TileCoordinator({index: str(tmp_path / "PartRenders" / f"tile_{index}.exr") for index in range(8)})
+
+
+@pytest.fixture
+def serve(coordinator):
+    servers = []
+
+    def serve(token=None):
+        server = CoordinatorServer(('127.0.0.1', 0), coordinator, token)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def upload(client, index, tmp_path, contents=b"pixels"):
+    filepath = tmp_path / f"{client.worker}_{index}.exr"
+    filepath.write_bytes(contents)
+    return client.upload(index, str(filepath))
+
+
+def test_workers_steal_half_of_the_longest_queue(coordinator):
+    # Each worker takes the back half of the longest queue, here the unassigned tiles
+    assert coordinator.claim("a") == {'tile': 4}
+    assert list(coordinator.queues["a"]) == [5, 6, 7]
+    assert coordinator.claim("b") == {'tile': 2}
+    assert list(coordinator.queues[UNASSIGNED]) == [0, 1]
+    # Then from whichever worker has the most left
+    assert [coordinator.claim("c")['tile'] for _ in range(2)] == [6, 7]
+    assert list(coordinator.queues["a"]) == [5]
+
+
+def test_failed_tile_is_queued_again_then_given_up(tmp_path):
+    coordinator = TileCoordinator({0: str(tmp_path / "tile_0.exr")})
+
+    assert coordinator.claim("a") == {'tile': 0}
+    coordinator.fail("a", 0, "out of memory")
+    assert not coordinator.is_finished
+
+    assert coordinator.claim("b") == {'tile': 0}
+    coordinator.fail("b", 0, "out of memory")
+    assert coordinator.failed == {0: "out of memory"}
+    assert coordinator.claim("c") == {'finished': True}
+
+
+def complete(coordinator, worker, index, contents=b"pixels"):
+    upload_filepath = coordinator.get_upload_filepath(index)
+    with open(upload_filepath, 'wb') as f:
+        f.write(contents)
+    return coordinator.complete(worker, index, upload_filepath)
+
+
+def test_lost_worker_is_not_a_failure(tmp_path):
+    coordinator = TileCoordinator({0: str(tmp_path / "tile_0.exr")}, lease_timeout=0.05)
+
+    # Workers don't heartbeat while Blender renders, so a slow tile can outlast any number of leases
+    assert coordinator.claim("a") == {'tile': 0}
+    for worker in ("b", "c", "d"):
+        time.sleep(0.1)
+        assert coordinator.claim(worker) == {'tile': 0}
+    assert not coordinator.failed
+
+    # The first copy to turn up wins, even from a worker given up for lost
+    assert complete(coordinator, "a", 0, b"first")
+    assert not complete(coordinator, "d", 0, b"last")
+    assert coordinator.done == {0: "a"}
+    with open(coordinator.filepaths[0], 'rb') as f:
+        assert f.read() == b"first"
+
+
+def test_late_upload_of_a_tile_given_up_on(tmp_path):
+    coordinator = TileCoordinator({0: str(tmp_path / "tile_0.exr")})
+    for worker in ("a", "b"):
+        assert coordinator.claim(worker) == {'tile': 0}
+        coordinator.fail(worker, 0, "out of memory")
+    assert coordinator.is_finished
+
+    # Still worth having from a worker that had it too
+    assert coordinator.heartbeat("c", [0]) == {'cancel': []}
+    assert complete(coordinator, "c", 0)
+    assert (coordinator.done, coordinator.failed) == ({0: "c"}, {})
+    assert coordinator.is_finished
+
+
+def test_upload_over_http(coordinator, serve, tmp_path):
+    client = CoordinatorClient(serve(), "a")
+
+    index = client.claim()['tile']
+    assert upload(client, index, tmp_path)
+    assert coordinator.done == {index: "a"}
+    with open(coordinator.filepaths[index], 'rb') as f:
+        assert f.read() == b"pixels"
+    assert coordinator.status()['done'] == 1
+
+
+def test_duplicate_is_dropped_before_uploading(coordinator, serve, tmp_path):
+    url = serve()
+    first = CoordinatorClient(url, "first")
+    second = CoordinatorClient(url, "second")
+
+    index = first.claim()['tile']
+    # A speculative copy of the same tile finishes first
+    coordinator.leases[index].append(TileLease("second", 0.0))
+    assert second.is_needed(index)
+    assert upload(second, index, tmp_path, b"second")
+
+    assert not first.is_needed(index)
+    assert not upload(first, index, tmp_path, b"first")
+    with open(coordinator.filepaths[index], 'rb') as f:
+        assert f.read() == b"second"
+
+
+def test_token_is_required(coordinator, serve, tmp_path):
+    url = serve(token="secret")
+
+    for client in (CoordinatorClient(url, "a"), CoordinatorClient(url, "a", token="wrong")):
+        with pytest.raises(urllib.error.HTTPError) as error:
+            client.claim()
+        assert error.value.code == 403
+        with pytest.raises(urllib.error.HTTPError):
+            upload(client, 0, tmp_path)
+    assert not coordinator.done and not coordinator.leases
+
+    client = CoordinatorClient(url, "a", token="secret")
+    index = client.claim()['tile']
+    assert upload(client, index, tmp_path)
+
+
+def test_heartbeat_from_the_render():
+    class Client:
+        sent = []
+
+        def heartbeat(self, tiles):
+            self.sent.append(tiles)
+            return {5}
+
+    heartbeat = Heartbeat(Client(), interval=3600.0)
+    heartbeat.tile = 5
+    try:
+        # Called every time the render reports progress, but only heartbeats once one is due
+        heartbeat.beat()
+        assert Client.sent == []
+        heartbeat.last_sent -= 3600.0
+        heartbeat.beat()
+        heartbeat.beat()
+        assert Client.sent == [[5]]
+        assert heartbeat.cancelled == {5}
+    finally:
+        heartbeat.stop()
+
+
+@pytest.mark.parametrize("host, loopback", [("127.0.0.1", True), ("localhost", True), ("::1", True),
+    ("0.0.0.0", False), ("192.168.1.10", False), ("render-box", False)])
+def test_is_loopback_host(host, loopback):
+    assert is_loopback_host(host) == loopback
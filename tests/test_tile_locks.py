@@ -0,0 +1,134 @@
+import os
+
+import pytest
+
+from utils import tile_locks
+from utils.tile_locks import LockRefresher, TileLocks, get_lock_filepath, is_tile_done
+
+
+@pytest.fixture
+def tile(tmp_path):
+    return str(tmp_path / "PartRenders" / "tile_1.exr")
+
+
+def read_lock(tile):
+    with open(get_lock_filepath(tile)) as f:
+        return f.read()
+
+
+def leftover_files(tile):
+    directory = os.path.dirname(tile)
+    return sorted(name for name in os.listdir(directory) if name != os.path.basename(get_lock_filepath(tile)))
+
+
+def abandon_lock(tile, *nodes):
+    """Have `dead` hold the tile's lock, and `nodes` see it unchanged for long enough to judge it stale."""
+    assert TileLocks("dead").try_claim(tile)
+    for node in nodes:
+        assert node.try_claim(tile) is None
+
+
+def take_over_first(monkeypatch, winner, tile):
+    """Have `winner` take the stale lock over just before the next node to judge it stale moves it aside."""
+    rename = os.rename
+    def rename_after_winner(source, destination):
+        monkeypatch.setattr(tile_locks.os, "rename", rename)
+        assert winner.try_claim(tile)
+        rename(source, destination)
+    monkeypatch.setattr(tile_locks.os, "rename", rename_after_winner)
+
+
+def test_only_one_claim(tile):
+    first = TileLocks("first")
+    second = TileLocks("second")
+
+    claim = first.try_claim(tile)
+    assert claim and read_lock(tile) == "first"
+    assert second.try_claim(tile) is None
+
+    with open(tile, 'w') as f:
+        f.write("pixels")
+    claim.finish()
+    assert is_tile_done(tile)
+    assert not os.path.exists(get_lock_filepath(tile))
+    assert first.try_claim(tile) is None
+    assert second.try_claim(tile) is None
+
+
+def test_released_tile_can_be_claimed_again(tile):
+    TileLocks("first").try_claim(tile).release()
+
+    assert TileLocks("second").try_claim(tile)
+
+
+def test_refreshed_lock_is_not_taken_over(tile):
+    claim = TileLocks("alive").try_claim(tile)
+    other = TileLocks("other", stale_seconds=0)
+
+    assert other.try_claim(tile) is None
+    # Bump the mtime well clear of the file system's resolution, as a refresh some seconds later would
+    stat = os.stat(claim.lock_filepath)
+    os.utime(claim.lock_filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert other.try_claim(tile) is None
+    assert read_lock(tile) == "alive"
+
+
+def test_lock_refreshed_from_the_render(tile):
+    claim = TileLocks("alive").try_claim(tile)
+    refresher = LockRefresher(interval=3600.0)
+    refresher.claim = claim
+    refreshed = []
+    claim.refresh = lambda: refreshed.append(True)
+    try:
+        # Called every time the render reports progress, but only touches the lock once it is due
+        refresher.refresh()
+        assert refreshed == []
+        refresher.last_refreshed -= 3600.0
+        refresher.refresh()
+        refresher.refresh()
+        assert refreshed == [True]
+    finally:
+        refresher.stop()
+
+
+def test_abandoned_lock_is_taken_over(tile):
+    node = TileLocks("node", stale_seconds=0)
+    abandon_lock(tile, node)
+
+    assert node.try_claim(tile)
+    assert read_lock(tile) == "node"
+    assert leftover_files(tile) == []
+
+
+def test_takeover_race_puts_the_new_lock_back(tile, monkeypatch):
+    winner = TileLocks("winner", stale_seconds=0)
+    loser = TileLocks("loser", stale_seconds=0)
+    abandon_lock(tile, winner, loser)
+    take_over_first(monkeypatch, winner, tile)
+
+    assert loser.try_claim(tile) is None
+    assert read_lock(tile) == "winner"
+    assert leftover_files(tile) == []
+
+
+def test_takeover_race_keeps_a_lock_it_cant_put_back(tile, monkeypatch, capsys):
+    winner = TileLocks("winner", stale_seconds=0)
+    loser = TileLocks("loser", stale_seconds=0)
+    abandon_lock(tile, winner, loser)
+    take_over_first(monkeypatch, winner, tile)
+
+    # And a third node makes a lock of its own while the winner's is moved aside
+    link = os.link
+    def link_after_third(source, destination):
+        assert TileLocks("third").try_claim(tile)
+        link(source, destination)
+    monkeypatch.setattr(tile_locks.os, "link", link_after_third)
+
+    assert loser.try_claim(tile) is None
+    assert read_lock(tile) == "third"
+
+    (kept,) = leftover_files(tile)
+    assert kept.startswith(os.path.basename(get_lock_filepath(tile)) + ".loser.stale.")
+    with open(os.path.join(os.path.dirname(tile), kept)) as f:
+        assert f.read() == "winner"
+    assert "Can't put back the lock" in capsys.readouterr().out
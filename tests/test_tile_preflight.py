@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from utils.exr import ExrScanlineWriter
+from utils.tile_preflight import TilePreflightError, preflight_tiles
+
+
+def write_tile(filepath, channel_names, size=(8, 6)):
+    (width, height) = size
+    with ExrScanlineWriter(str(filepath), width, height, channel_names) as writer:
+        writer.write_rows(np.zeros((height, width, len(channel_names)), dtype=np.float32))
+    return str(filepath)
+
+
+def make_tile(filepath, size=(8, 6)):
+    return SimpleNamespace(filepath=filepath, image_size=size)
+
+
+@pytest.mark.parametrize("channel_names", [['R', 'G', 'B', 'A'], ['R', 'G', 'B'], ['Y'], ['A', 'Y']])
+def test_colour_tiles_pass(tmp_path, channel_names):
+    filepath = write_tile(tmp_path / "tile.exr", channel_names)
+
+    headers = preflight_tiles([make_tile(filepath)], [filepath], required_channels=[('R', 'Y')])
+    assert sorted(headers[0].channel_names) == sorted(channel_names)
+
+
+def test_every_problem_is_reported(tmp_path):
+    no_colour = write_tile(tmp_path / "depth.exr", ['Depth.V'])
+    wrong_size = write_tile(tmp_path / "small.exr", ['R', 'G', 'B', 'A'], size=(4, 4))
+    missing = str(tmp_path / "missing.exr")
+    tiles = [make_tile(filepath) for filepath in (no_colour, wrong_size, missing)]
+
+    with pytest.raises(TilePreflightError) as error:
+        preflight_tiles(tiles, [tile.filepath for tile in tiles], required_channels=[('R', 'Y')])
+
+    assert error.value.problems == [
+        f"{no_colour}: missing channels R or Y (has Depth.V)",
+        f"{wrong_size}: is 4x4, expected 8x6",
+        f"{missing}: missing",
+    ]
+
+
+def test_same_channels(tmp_path):
+    first = write_tile(tmp_path / "first.exr", ['Image.R', 'Image.G'])
+    second = write_tile(tmp_path / "second.exr", ['Image.R'])
+    tiles = [make_tile(first), make_tile(second)]
+
+    with pytest.raises(TilePreflightError, match="has different passes"):
+        preflight_tiles(tiles, [first, second], same_channels=True)
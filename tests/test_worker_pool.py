@@ -0,0 +1,109 @@
+import sys
+import time
+
+import pytest
+
+from utils import worker_pool
+from utils.worker_pool import MAX_TILE_ATTEMPTS, WORKER_PREFIX, WorkerPool, get_worker_command, get_worker_threads
+
+# Stands in for `SRR_Batch.py --worker`: "renders" the tiles read from stdin. Tile `crash` makes the process exit
+# (only the first time if `crash_once` is a file path), tile `fail` is reported failed.
+FAKE_WORKER = f"""
+import os, sys
+(crash, fail, crash_once) = sys.argv[1:]
+for line in sys.stdin:
+    index = int(line)
+    print("Fra:1 rendering tile", index, flush=True)
+    if str(index) == crash and not os.path.exists(crash_once):
+        if crash_once != "always":
+            open(crash_once, "w").close()
+        os._exit(3)
+    if str(index) == fail:
+        print("{WORKER_PREFIX}", "failed", index, "out of memory", flush=True)
+    else:
+        print("{WORKER_PREFIX}", "done", index, flush=True)
+"""
+
+
+@pytest.fixture
+def start_pool(tmp_path):
+    script = tmp_path / "worker.py"
+    script.write_text(FAKE_WORKER)
+    pools = []
+
+    def start_pool(tiles, worker_count=3, crash=-1, fail=-1, crash_once=True):
+        crash_marker = str(tmp_path / "crashed") if crash_once else "always"
+        pool = WorkerPool([sys.executable, str(script), str(crash), str(fail), crash_marker], tiles, worker_count)
+        pools.append(pool)
+        return pool
+
+    yield start_pool
+    for pool in pools:
+        pool.stop()
+
+
+def run(pool, timeout=30.0):
+    """Poll the pool until every worker has exited, returning `{tile: (result, message)}`."""
+    results = {}
+    deadline = time.monotonic() + timeout
+    while not pool.is_finished:
+        assert time.monotonic() < deadline, "The workers didn't finish"
+        for (result, index, message) in pool.poll():
+            assert index not in results, f"Tile {index} was reported twice"
+            results[index] = (result, message)
+        time.sleep(0.01)
+    for (result, index, message) in pool.poll():
+        results[index] = (result, message)
+    return results
+
+
+def test_every_tile_is_rendered_once(start_pool, capsys):
+    tiles = list(range(2, 22))
+    results = run(start_pool(tiles))
+
+    assert results == {index: ('done', "") for index in tiles}
+    # The workers' own output is passed through, marked with the worker it came from
+    assert "[Worker 1] Fra:1 rendering tile" in capsys.readouterr().out
+
+
+def test_failed_tile_is_reported(start_pool):
+    results = run(start_pool(range(6), fail=4))
+
+    assert results.pop(4) == ('failed', "out of memory")
+    assert all(result == 'done' for (result, _) in results.values())
+
+
+def test_tile_of_a_crashed_worker_is_rendered_again(start_pool):
+    results = run(start_pool(range(6), crash=3))
+
+    assert results == {index: ('done', "") for index in range(6)}
+
+
+def test_tile_that_keeps_crashing_is_given_up(start_pool):
+    pool = start_pool(range(4), worker_count=MAX_TILE_ATTEMPTS + 1, crash=1, crash_once=False)
+    results = run(pool)
+
+    (result, message) = results.pop(1)
+    assert result == 'failed'
+    assert "exited with code 3" in message
+    assert results == {index: ('done', "") for index in (0, 2, 3)}
+    assert sum(not worker.process.returncode for worker in pool.workers) == 1
+
+
+def test_stop_kills_workers_that_dont_exit(tmp_path, monkeypatch):
+    monkeypatch.setattr(worker_pool, "WORKER_EXIT_TIMEOUT", 0.1)
+    script = tmp_path / "stuck.py"
+    script.write_text("import signal, time\nsignal.signal(signal.SIGTERM, signal.SIG_IGN)\nprint('ready', flush=True)\ntime.sleep(60)\n")
+
+    pool = WorkerPool([sys.executable, str(script)], [0], 1)
+    time.sleep(0.5)
+    pool.stop()
+    assert all(worker.process.poll() is not None for worker in pool.workers)
+
+
+def test_worker_command():
+    command = get_worker_command("blender", "scene.blend", 4, ['--set', 'subdivisions=2'])
+
+    assert command[:3] == ["blender", '-b', "scene.blend"]
+    assert command[command.index('--') + 1:] == ['--srr', '--worker', '--threads', '4', '--set', 'subdivisions=2']
+    assert get_worker_threads(10 ** 6) == 1
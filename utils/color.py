@@ -0,0 +1,102 @@
+import numpy as np
+
+
+def linear_to_srgb(values: np.ndarray) -> np.ndarray:
+    """Apply the sRGB transfer function to linear values, clipped to 0-1. Returns a new float32 array."""
+    values = np.clip(values, 0.0, 1.0, dtype=np.float32)
+    low = values * 12.92
+    high = 1.055 * np.power(values, 1 / 2.4, dtype=np.float32) - 0.055
+    return np.where(values <= 0.0031308, low, high).astype(np.float32, copy=False)
+
+
+# Approximation of Blender's Filmic view transform (base contrast): scene values are encoded as stops around
+# middle grey, from -10 to +6.5, then put through an S-curve fitted so that middle grey (0.18) and diffuse
+# white (1.0) come out at about 0.46 and 0.80, as they do with Filmic
+FILMIC_MIDDLE_GREY = 0.18
+FILMIC_MIN_STOPS = -10.0
+FILMIC_MAX_STOPS = 6.5
+FILMIC_CONTRAST = 9.75
+FILMIC_PIVOT = 0.626
+
+
+def linear_to_filmic(values: np.ndarray) -> np.ndarray:
+    """Apply an approximate Filmic view transform to linear values, giving display values in 0-1. Returns a new float32 array."""
+    darkest = FILMIC_MIDDLE_GREY * 2 ** FILMIC_MIN_STOPS
+    stops = np.log2(np.maximum(values, darkest, dtype=np.float32) / FILMIC_MIDDLE_GREY)
+    encoded = np.clip((stops - FILMIC_MIN_STOPS) / (FILMIC_MAX_STOPS - FILMIC_MIN_STOPS), 0.0, 1.0)
+
+    def curve(x):
+        return 1 / (1 + np.exp(-FILMIC_CONTRAST * (x - FILMIC_PIVOT)))
+
+    low, high = curve(0.0), curve(1.0)
+    return ((curve(encoded) - low) / (high - low)).astype(np.float32, copy=False)
+
+
+VIEW_TRANSFORMS = {
+    'STANDARD': linear_to_srgb,
+    'FILMIC': linear_to_filmic,
+}
+
+
+def quantise_for_display(pixels: np.ndarray, view_transform: str, dtype, dither: float = 0.0, seed=0) -> np.ndarray:
+    """
+    Apply `view_transform` to the colour channels of linear float `pixels` (1, 3 or 4 channels; alpha stays linear)
+    and quantise them to `dtype` (uint8 or uint16). `dither` adds triangular noise of that many steps to the colour,
+    so smooth gradients don't band; `seed` makes the noise repeatable, e.g. per tile.
+    """
+    max_value = np.iinfo(dtype).max
+    colour_channels = 1 if pixels.shape[-1] == 1 else 3
+
+    result = np.empty(pixels.shape, dtype=np.float32)
+    result[..., :colour_channels] = VIEW_TRANSFORMS[view_transform](pixels[..., :colour_channels])
+    result[..., colour_channels:] = np.clip(pixels[..., colour_channels:], 0.0, 1.0)
+    result *= max_value
+
+    if dither > 0:
+        rng = np.random.default_rng(seed)
+        shape = pixels.shape[:-1] + (colour_channels,)
+        noise = rng.random(shape, dtype=np.float32) - rng.random(shape, dtype=np.float32)
+        result[..., :colour_channels] += noise * dither
+
+    return np.clip(np.rint(result, out=result), 0, max_value).astype(dtype)
+
+
+def to_display_rgba8(pixels: np.ndarray) -> np.ndarray:
+    """Convert linear float RGBA pixels to sRGB 8-bit RGBA for viewing, leaving alpha linear."""
+    result = np.empty(pixels.shape, dtype=np.uint8)
+    result[..., :3] = np.rint(linear_to_srgb(pixels[..., :3]) * 255)
+    result[..., 3:] = np.rint(np.clip(pixels[..., 3:], 0.0, 1.0) * 255)
+    return result
+
+
+# Rec. 709 luma coefficients, as used by Blender
+LUMINANCE_WEIGHTS = np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+
+
+def convert_channels(pixels: np.ndarray, channels: str) -> np.ndarray:
+    """
+    Select channels of RGBA `pixels` for the output colour mode `channels` ('RGBA', 'RGB' or 'BW').
+    RGBA and RGB return a view; BW returns the luminance as a new single-channel array.
+    """
+    if channels == 'RGBA':
+        return pixels
+    if channels == 'RGB':
+        return pixels[..., :3]
+    if channels == 'BW':
+        return np.dot(pixels[..., :3], LUMINANCE_WEIGHTS)[..., np.newaxis]
+    raise ValueError(f"Unknown colour mode {channels}")
+
+
+def as_rgba_float32(pixels: np.ndarray) -> np.ndarray:
+    """Expand pixels with 1, 3 or 4 channels to float32 RGBA, with opaque alpha where there was none."""
+    channel_count = pixels.shape[-1]
+    if channel_count == 4:
+        return pixels.astype(np.float32, copy=False)
+
+    result = np.ones(pixels.shape[:-1] + (4,), dtype=np.float32)
+    if channel_count in {1, 3}:
+        # Greyscale is broadcast to all three colour channels
+        result[..., :3] = pixels
+    else:
+        raise ValueError(f"Can't expand {channel_count} channels to RGBA")
+    return result
@@ -0,0 +1,142 @@
+import os
+from math import ceil, log2
+from typing import List
+
+import numpy as np
+
+from .color import as_rgba_float32, to_display_rgba8
+from .png_writer import write_png
+
+
+DZI_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="png" Overlap="0" TileSize="{tile_size}">
+  <Size Width="{width}" Height="{height}"/>
+</Image>
+"""
+
+
+def box_downsample_2x(rows: np.ndarray) -> np.ndarray:
+    """
+    Halve an even number of rows in both directions by averaging 2x2 blocks.
+    An odd last column is paired with itself, so the result is `ceil(width / 2)` wide.
+    """
+    row_count, width, channels = rows.shape
+    if width % 2:
+        rows = np.concatenate((rows, rows[:, -1:]), axis=1)
+        width += 1
+
+    blocks = rows.reshape(row_count // 2, 2, width // 2, 2, channels)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+class RowDownsampler:
+    """
+    Feeds a 2x box-downsampled copy of the rows it receives to `target.write_rows()`.
+    At most one row is held back, waiting for the row it pairs with.
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.carry = None
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        if self.carry is not None:
+            rows = np.concatenate((self.carry, rows))
+            self.carry = None
+
+        even_rows = rows.shape[0] - rows.shape[0] % 2
+        if even_rows:
+            self.target.write_rows(box_downsample_2x(rows[:even_rows]))
+        if even_rows < rows.shape[0]:
+            self.carry = np.array(rows[even_rows:])
+
+    def close(self) -> None:
+        # An odd last row is paired with itself
+        if self.carry is not None:
+            self.target.write_rows(box_downsample_2x(np.concatenate((self.carry, self.carry))))
+            self.carry = None
+        self.target.close()
+
+
+class DeepZoomLevel:
+    """One level of the pyramid: cuts the rows it receives into tiles and passes a half-size copy to the next level down."""
+
+    def __init__(self, dirpath: str, level: int, width: int, height: int, tile_size: int, lower_level: "DeepZoomLevel" = None):
+        self.dirpath = os.path.join(dirpath, str(level))
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.downsampler = RowDownsampler(lower_level) if lower_level else None
+        self.tile_row = 0
+        self._pending: List[np.ndarray] = []
+        self._pending_rows = 0
+
+        os.makedirs(self.dirpath, exist_ok=True)
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        if self.downsampler:
+            self.downsampler.write_rows(rows)
+
+        self._pending.append(rows)
+        self._pending_rows += rows.shape[0]
+        if self._pending_rows >= self.tile_size:
+            self._write_tile_rows()
+
+        # Callers may reuse their band buffer, so keep our own copy of any leftover rows
+        self._pending = [np.array(chunk) for chunk in self._pending]
+
+    def close(self) -> None:
+        if self._pending_rows:
+            self._write_tile_rows(flush=True)
+        if self.downsampler:
+            self.downsampler.close()
+
+    def _write_tile_rows(self, flush: bool = False) -> None:
+        rows = self._pending[0] if len(self._pending) == 1 else np.concatenate(self._pending)
+
+        start = 0
+        while rows.shape[0] - start >= self.tile_size or (flush and start < rows.shape[0]):
+            strip = to_display_rgba8(rows[start:start + self.tile_size])
+            for (column, x) in enumerate(range(0, self.width, self.tile_size)):
+                tile_filepath = os.path.join(self.dirpath, f"{column}_{self.tile_row}.png")
+                write_png(tile_filepath, strip[:, x:x + self.tile_size])
+            start += strip.shape[0]
+            self.tile_row += 1
+
+        self._pending = [rows[start:]] if start < rows.shape[0] else []
+        self._pending_rows = rows.shape[0] - start
+
+
+class DeepZoomWriter:
+    """
+    Builds a Deep Zoom (DZI) tile pyramid from rows of linear float pixels passed top-to-bottom,
+    e.g. one band of merged tiles at a time. Each level is downsampled from the one above as rows arrive,
+    so the pyramid never needs the full image and each level only holds rows that don't yet fill a tile.
+    Writes `<basepath>.dzi` and `<basepath>_files/<level>/<column>_<row>.png`.
+    """
+
+    def __init__(self, basepath: str, width: int, height: int, tile_size: int = 256):
+        self.dzi_filepath = f"{basepath}.dzi"
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+
+        files_dirpath = f"{basepath}_files"
+        max_level = ceil(log2(max(width, height))) if max(width, height) > 1 else 0
+
+        # Build the chain from the 1x1 level up to full resolution
+        level = None
+        for level_index in range(max_level + 1):
+            scale = 2 ** (max_level - level_index)
+            level = DeepZoomLevel(files_dirpath, level_index, ceil(width / scale), ceil(height / scale), tile_size, level)
+        self.top_level = level
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        self.top_level.write_rows(as_rgba_float32(rows))
+
+    def close(self) -> None:
+        self.top_level.close()
+
+        with open(self.dzi_filepath, 'w') as f:
+            f.write(DZI_TEMPLATE.format(tile_size=self.tile_size, width=self.width, height=self.height))
+        print(f'Wrote Deep Zoom pyramid "{self.dzi_filepath}".')
@@ -0,0 +1,90 @@
+from math import ceil
+from typing import List, Tuple
+
+import numpy as np
+
+from .color import to_display_rgba8
+from .deep_zoom import RowDownsampler
+from .exr import COMPRESSION_NONE, COMPRESSION_ZIP, PIXEL_FLOAT, PIXEL_HALF, ExrScanlineWriter
+from .png_writer import PngWriter
+from .tiff_writer import TiffStripWriter
+
+
+class DownsampledLevel:
+    """
+    One size of the downsampled outputs: writes the rows it receives with `writer` (if any) and passes
+    a half-size copy on to the next smaller level. Rows stay float between levels, so each level is
+    averaged from unrounded values; they are only cast to `dtype` for writing.
+    """
+
+    def __init__(self, writer, dtype, lower_level: "DownsampledLevel" = None):
+        self.writer = writer
+        self.dtype = np.dtype(dtype)
+        self.downsampler = RowDownsampler(lower_level) if lower_level else None
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        if self.writer:
+            if self.dtype.kind == 'u' and rows.dtype.kind == 'f':
+                self.writer.write_rows(np.rint(rows).astype(self.dtype))
+            else:
+                self.writer.write_rows(rows)
+        if self.downsampler:
+            self.downsampler.write_rows(rows)
+
+    def close(self) -> None:
+        if self.writer:
+            self.writer.close()
+        if self.downsampler:
+            self.downsampler.close()
+
+
+class DisplayPngWriter(PngWriter):
+    """Writes linear float rows as an 8 bit sRGB PNG, like a viewer would show them."""
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        super().write_rows(to_display_rgba8(rows))
+
+
+class DownsampledOutputs:
+    """
+    Writes box-filtered copies of the merged image at 1/2, 1/4, ... of its size from rows passed top-to-bottom,
+    e.g. one band of merged tiles at a time, so the copies are built during the merge rather than from the
+    finished output. Each size is halved from the one above as rows arrive; only a row per size is held back.
+    `outputs` lists `(scale, filepath)` pairs, `scale` being a power of two divisor.
+    """
+
+    def __init__(self, outputs: List[Tuple[int, str]], width: int, height: int, file_format: str, channel_names: List[str],
+            dtype, compress_level: int = 6):
+        self.filepaths = [filepath for (_, filepath) in outputs]
+        writers = {scale: self._open_writer(file_format, filepath, ceil(width / scale), ceil(height / scale), channel_names, dtype,
+            compress_level) for (scale, filepath) in outputs}
+
+        # Build the chain from the smallest size up to full size, which is the merge's own output
+        level = None
+        scale = max(writers)
+        while scale >= 1:
+            level = DownsampledLevel(writers.get(scale), dtype, level)
+            scale //= 2
+        self.top_level = level
+
+    @staticmethod
+    def _open_writer(file_format: str, filepath: str, width: int, height: int, channel_names: List[str], dtype, compress_level: int):
+        dtype = np.dtype(dtype)
+        if file_format == 'OPEN_EXR':
+            pixel_type = PIXEL_HALF if dtype == np.float16 else PIXEL_FLOAT
+            return ExrScanlineWriter(filepath, width, height, channel_names, pixel_type, COMPRESSION_ZIP if compress_level else COMPRESSION_NONE)
+        if file_format == 'TIFF':
+            return TiffStripWriter(filepath, width, height, len(channel_names), dtype, rows_per_strip=64, compress=compress_level > 0)
+        if file_format == 'PNG' and dtype.kind == 'u':
+            return PngWriter(filepath, width, height, len(channel_names), dtype, compress_level)
+        if file_format == 'PNG':
+            return DisplayPngWriter(filepath, width, height, len(channel_names), compress_level=compress_level)
+        raise ValueError(f"No encoder for {file_format}")
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        self.top_level.write_rows(rows)
+
+    def close(self) -> None:
+        self.top_level.close()
+        for filepath in self.filepaths:
+            print(f'Wrote downsampled output "{filepath}".')
@@ -0,0 +1,520 @@
+import os
+import struct
+import zlib
+from typing import Dict, List, NamedTuple, Tuple, Union
+
+import numpy as np
+
+
+EXR_MAGIC = 20000630
+
+FLAG_TILED = 0x200
+FLAG_DEEP = 0x800
+FLAG_MULTIPART = 0x1000
+
+# Pixel types
+PIXEL_UINT = 0
+PIXEL_HALF = 1
+PIXEL_FLOAT = 2
+PIXEL_DTYPES = {
+    PIXEL_UINT: np.dtype('<u4'),
+    PIXEL_HALF: np.dtype('<f2'),
+    PIXEL_FLOAT: np.dtype('<f4'),
+}
+
+# Compression methods
+COMPRESSION_NONE = 0
+COMPRESSION_RLE = 1
+COMPRESSION_ZIPS = 2
+COMPRESSION_ZIP = 3
+COMPRESSION_NAMES = ('NONE', 'RLE', 'ZIPS', 'ZIP', 'PIZ', 'PXR24', 'B44', 'B44A', 'DWAA', 'DWAB')
+LINES_PER_BLOCK = {
+    COMPRESSION_NONE: 1,
+    COMPRESSION_RLE: 1,
+    COMPRESSION_ZIPS: 1,
+    COMPRESSION_ZIP: 16,
+}
+
+
+class ExrError(RuntimeError):
+    """The file isn't an EXR this module can read. Callers fall back to loading it through Blender."""
+
+
+class ExrChannel(NamedTuple):
+    name: str
+    pixel_type: int
+    x_sampling: int
+    y_sampling: int
+
+
+class ExrHeader(NamedTuple):
+    channels: List[ExrChannel] # Sorted by name, the order they are stored in
+    compression: int
+    data_window: Tuple[int, int, int, int] # x_min, y_min, x_max, y_max (inclusive)
+    display_window: Tuple[int, int, int, int]
+    tiled: bool
+    header_size: int # Offset of the chunk offset table
+    metadata: Dict[str, bytes] # String attributes, e.g. the Cryptomatte manifest
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        x_min, y_min, x_max, y_max = self.data_window
+        return (x_max - x_min + 1, y_max - y_min + 1)
+
+    @property
+    def channel_names(self) -> List[str]:
+        return [channel.name for channel in self.channels]
+
+
+def parse_exr_header(data: bytes) -> ExrHeader:
+    """Parse the header of a single-part EXR from the start of the file contents."""
+    if len(data) < 8:
+        raise ExrError("File is too short to be an EXR")
+
+    magic, version = struct.unpack_from('<ii', data, 0)
+    if magic != EXR_MAGIC:
+        raise ExrError("Not an OpenEXR file")
+    if version & (FLAG_DEEP | FLAG_MULTIPART):
+        raise ExrError("Deep and multi-part EXRs are not supported")
+
+    attributes = {}
+    pos = 8
+    try:
+        while data[pos] != 0:
+            name_end = data.index(b'\0', pos)
+            type_end = data.index(b'\0', name_end + 1)
+            name = data[pos:name_end].decode('latin-1')
+            attribute_type = data[name_end + 1:type_end].decode('latin-1')
+            (size,) = struct.unpack_from('<i', data, type_end + 1)
+            value_start = type_end + 5
+            attributes[name] = (attribute_type, data[value_start:value_start + size])
+            pos = value_start + size
+    except (IndexError, ValueError, struct.error):
+        raise ExrError("Truncated EXR header")
+
+    for required in ('channels', 'compression', 'dataWindow', 'displayWindow'):
+        if required not in attributes:
+            raise ExrError(f"EXR header is missing '{required}'")
+
+    channels = []
+    channel_data = attributes['channels'][1]
+    channel_pos = 0
+    while channel_pos < len(channel_data) and channel_data[channel_pos] != 0:
+        name_end = channel_data.index(b'\0', channel_pos)
+        name = channel_data[channel_pos:name_end].decode('latin-1')
+        pixel_type, _linear, x_sampling, y_sampling = struct.unpack_from('<iB3xii', channel_data, name_end + 1)
+        channels.append(ExrChannel(name, pixel_type, x_sampling, y_sampling))
+        channel_pos = name_end + 17
+
+    return ExrHeader(
+        channels = sorted(channels, key=lambda channel: channel.name.encode('latin-1')),
+        compression = attributes['compression'][1][0],
+        data_window = struct.unpack('<4i', attributes['dataWindow'][1]),
+        display_window = struct.unpack('<4i', attributes['displayWindow'][1]),
+        tiled = bool(version & FLAG_TILED),
+        header_size = pos + 1,
+        metadata = {name: value for (name, (attribute_type, value)) in attributes.items() if attribute_type == 'string'},
+    )
+
+
+def read_exr_header(filepath: str, max_size: int = 1 << 16) -> ExrHeader:
+    """Read only the header of an EXR file, without touching any pixel data."""
+    with open(filepath, 'rb') as f:
+        data = f.read(max_size)
+    try:
+        return parse_exr_header(data)
+    except ExrError:
+        if len(data) < max_size:
+            raise
+    # Very large headers (lots of channels or metadata) need a bigger read
+    return read_exr_header(filepath, max_size * 16)
+
+
+def _undo_zip_predictor(data: bytes) -> np.ndarray:
+    # Reverse the byte delta predictor, then re-interleave the two halves of the buffer
+    buffer = np.frombuffer(data, dtype=np.uint8).copy()
+    buffer[1:] -= 128
+    buffer = np.cumsum(buffer, dtype=np.uint8)
+
+    result = np.empty_like(buffer)
+    half = (len(buffer) + 1) // 2
+    result[0::2] = buffer[:half]
+    result[1::2] = buffer[half:]
+    return result
+
+
+def _decode_rle(data: bytes, expected_size: int) -> bytes:
+    result = bytearray()
+    pos = 0
+    while pos < len(data) and len(result) < expected_size:
+        count = struct.unpack_from('<b', data, pos)[0]
+        pos += 1
+        if count < 0:
+            result += data[pos:pos - count]
+            pos -= count
+        else:
+            result += data[pos:pos + 1] * (count + 1)
+            pos += 1
+    return bytes(result)
+
+
+def _decompress_block(compression: int, data: bytes, expected_size: int) -> np.ndarray:
+    if compression == COMPRESSION_NONE or len(data) == expected_size:
+        # Blocks that don't shrink are stored uncompressed
+        return np.frombuffer(data, dtype=np.uint8)
+    if compression in {COMPRESSION_ZIP, COMPRESSION_ZIPS}:
+        return _undo_zip_predictor(zlib.decompress(data))
+    if compression == COMPRESSION_RLE:
+        return _undo_zip_predictor(_decode_rle(data, expected_size))
+    raise ExrError(f"Unsupported EXR compression {COMPRESSION_NAMES[compression]}")
+
+
+def read_exr_channels(filepath: str, channel_names: List[str] = None) -> Tuple[ExrHeader, Dict[str, np.ndarray]]:
+    """
+    Decode a scanline EXR with NONE, RLE, ZIPS or ZIP compression (the codecs SRR writes tiles with).
+    Returns the header and a `(height, width)` array per channel, rows top-to-bottom, in the file's pixel type.
+    Only `channel_names` are returned if given.
+    """
+    with open(filepath, 'rb') as f:
+        data = f.read()
+
+    header = parse_exr_header(data)
+    if header.tiled:
+        raise ExrError("Tiled EXRs are not supported")
+    if header.compression not in LINES_PER_BLOCK:
+        raise ExrError(f"Unsupported EXR compression {COMPRESSION_NAMES[header.compression]}")
+    if any(channel.x_sampling != 1 or channel.y_sampling != 1 for channel in header.channels):
+        raise ExrError("Subsampled EXR channels are not supported")
+
+    wanted = header.channel_names if channel_names is None else channel_names
+    missing = [name for name in wanted if name not in header.channel_names]
+    if missing:
+        raise RuntimeError(f"Image tile {filepath} is missing channels {', '.join(missing)}.")
+
+    width, height = header.size
+    y_min = header.data_window[1]
+    lines_per_block = LINES_PER_BLOCK[header.compression]
+    block_count = (height + lines_per_block - 1) // lines_per_block
+
+    # Byte layout of one scanline: each channel's samples in turn
+    line_layout = []
+    line_size = 0
+    for channel in header.channels:
+        dtype = PIXEL_DTYPES[channel.pixel_type]
+        line_layout.append((channel.name, dtype, line_size))
+        line_size += width * dtype.itemsize
+
+    result = {name: np.empty((height, width), dtype=dtype) for (name, dtype, _) in line_layout if name in wanted}
+
+    offsets = np.frombuffer(data, dtype='<u8', count=block_count, offset=header.header_size)
+    for offset in offsets.tolist():
+        block_y, data_size = struct.unpack_from('<ii', data, offset)
+        first_line = block_y - y_min
+        line_count = min(lines_per_block, height - first_line)
+        block = _decompress_block(header.compression, data[offset + 8:offset + 8 + data_size], line_count * line_size)
+        block = block.reshape(line_count, line_size)
+
+        for (name, dtype, start) in line_layout:
+            if name in result:
+                samples = block[:, start:start + width * dtype.itemsize]
+                result[name][first_line:first_line + line_count] = samples.view(dtype)
+
+    return (header, result)
+
+
+def read_exr_rgba(filepath: str) -> np.ndarray:
+    """
+    Decode an RGBA EXR into a `(height, width, 4)` float32 array with rows bottom-to-top,
+    the same layout as Blender's `Image.pixels`.
+    Channels are filled in the way Blender loads them: a missing alpha is opaque, and RGB files
+    (or greyscale ones, with only Y or R) have their missing colour channels copied from the others.
+    """
+    available = read_exr_header(filepath).channel_names
+    grey = next((name for name in ('R', 'Y') if name in available), None)
+    if grey is None:
+        raise ExrError(f"No colour channels among {', '.join(available)}")
+
+    sources = [name if name in available else grey for name in 'RGB']
+    header, channels = read_exr_channels(filepath, sorted(set(sources) | ({'A'} & set(available))))
+    width, height = header.size
+
+    pixels = np.empty((height, width, 4), dtype=np.float32)
+    for (index, name) in enumerate(sources):
+        pixels[:, :, index] = channels[name][::-1]
+    if 'A' in channels:
+        pixels[:, :, 3] = channels['A'][::-1]
+    else:
+        pixels[:, :, 3] = 1.0
+
+    return pixels
+
+
+LINE_ORDER_INCREASING_Y = 0
+LINE_ORDER_RANDOM_Y = 2
+
+
+def _attribute(name: str, attribute_type: str, value: bytes) -> bytes:
+    return name.encode('latin-1') + b'\0' + attribute_type.encode('latin-1') + b'\0' + struct.pack('<i', len(value)) + value
+
+
+def _apply_zip_predictor(data: bytes) -> bytes:
+    # Split even and odd bytes into two halves, then delta-encode the bytes
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    interleaved = np.concatenate((buffer[0::2], buffer[1::2]))
+    predicted = interleaved.copy()
+    predicted[1:] = interleaved[1:] - interleaved[:-1] + 128
+    return predicted.tobytes()
+
+
+def compress_block(compression: int, data: bytes) -> bytes:
+    """Compress one block of pixel data; blocks that don't shrink are stored as they are."""
+    if compression == COMPRESSION_NONE:
+        return data
+    if compression in {COMPRESSION_ZIP, COMPRESSION_ZIPS}:
+        compressed = zlib.compress(_apply_zip_predictor(data))
+        return compressed if len(compressed) < len(data) else data
+    raise ExrError(f"Unsupported EXR compression {COMPRESSION_NAMES[compression]}")
+
+
+def _channel_pixel_types(channel_names: List[str], pixel_type: Union[int, List[int]]) -> List[int]:
+    return list(pixel_type) if isinstance(pixel_type, (list, tuple)) else [pixel_type] * len(channel_names)
+
+
+def build_exr_header(width: int, height: int, channel_names: List[str], pixel_type: Union[int, List[int]], compression: int,
+        tile_size: Tuple[int, int] = None, metadata: Dict[str, bytes] = None) -> bytes:
+    """
+    Magic number, version and header attributes for a single-part scanline or tiled EXR.
+    `pixel_type` is either one type for all channels or one per channel; `metadata` is written as string attributes.
+    """
+    # Tiles are appended in whatever order they finish encoding
+    line_order = LINE_ORDER_RANDOM_Y if tile_size else LINE_ORDER_INCREASING_Y
+    channel_list = b''
+    for (name, channel_type) in sorted(zip(channel_names, _channel_pixel_types(channel_names, pixel_type)), key=lambda item: item[0].encode('latin-1')):
+        channel_list += name.encode('latin-1') + b'\0' + struct.pack('<iB3xii', channel_type, 0, 1, 1)
+    channel_list += b'\0'
+
+    window = struct.pack('<4i', 0, 0, width - 1, height - 1)
+    attributes = [
+        _attribute('channels', 'chlist', channel_list),
+        _attribute('compression', 'compression', bytes([compression])),
+        _attribute('dataWindow', 'box2i', window),
+        _attribute('displayWindow', 'box2i', window),
+        _attribute('lineOrder', 'lineOrder', bytes([line_order])),
+        _attribute('pixelAspectRatio', 'float', struct.pack('<f', 1.0)),
+        _attribute('screenWindowCenter', 'v2f', struct.pack('<2f', 0.0, 0.0)),
+        _attribute('screenWindowWidth', 'float', struct.pack('<f', 1.0)),
+    ]
+
+    version = 2
+    if tile_size:
+        # One level, rounding down
+        attributes.append(_attribute('tiles', 'tiledesc', struct.pack('<IIB', tile_size[0], tile_size[1], 0)))
+        version |= FLAG_TILED
+    for (name, value) in (metadata or {}).items():
+        attributes.append(_attribute(name, 'string', value))
+    if any(len(name) > 31 for name in channel_names):
+        version |= 0x400 # Long names
+
+    return struct.pack('<ii', EXR_MAGIC, version) + b''.join(attributes) + b'\0'
+
+
+def pack_channels(pixels: np.ndarray, channel_names: List[str], pixel_type: Union[int, List[int]]) -> bytes:
+    """
+    Lay out `(rows, width, channels)` pixels, rows top-to-bottom, as EXR pixel data:
+    each row holds every channel's samples in turn, channels sorted by name.
+    """
+    order = sorted(range(len(channel_names)), key=lambda index: channel_names[index].encode('latin-1'))
+    pixel_types = _channel_pixel_types(channel_names, pixel_type)
+
+    if len(set(pixel_types)) == 1:
+        planar = np.transpose(pixels[:, :, order], (0, 2, 1))
+        return np.ascontiguousarray(planar, dtype=PIXEL_DTYPES[pixel_types[0]]).tobytes()
+
+    # Mixed pixel types: convert each channel on its own, then join the rows back up as bytes
+    samples = [np.ascontiguousarray(pixels[:, :, index], dtype=PIXEL_DTYPES[pixel_types[index]]).view(np.uint8) for index in order]
+    return np.concatenate(samples, axis=1).tobytes()
+
+
+class ExrTiledWriter:
+    """
+    Writes a single-level tiled EXR whose tiles can be encoded independently and in parallel
+    with `encode_tile()`, then appended in any order with `write_tile()`.
+    The chunk offset table is filled in by `close()`.
+
+    A partly written file can be continued by passing a `checkpoint_state()` as `resume_state`,
+    with the same image parameters; tiles written after the checkpoint are dropped.
+    """
+
+    def __init__(self, filepath: str, width: int, height: int, tile_size: Tuple[int, int], channel_names: List[str],
+            pixel_type: int = PIXEL_HALF, compression: int = COMPRESSION_ZIP, resume_state: dict = None):
+        if compression not in {COMPRESSION_NONE, COMPRESSION_ZIP, COMPRESSION_ZIPS}:
+            raise ExrError(f"Unsupported EXR compression {COMPRESSION_NAMES[compression]}")
+
+        self.filepath = filepath
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.channel_names = channel_names
+        self.pixel_type = pixel_type
+        self.compression = compression
+
+        self.tiles_x = (width + tile_size[0] - 1) // tile_size[0]
+        self.tiles_y = (height + tile_size[1] - 1) // tile_size[1]
+        self.offsets = [0] * (self.tiles_x * self.tiles_y)
+        self.empty_tiles: Dict[Tuple[int, int], bytes] = {} # Compressed all-zero tile data by shape
+
+        header = build_exr_header(width, height, channel_names, pixel_type, compression, tile_size)
+        self.offset_table_position = len(header)
+
+        if resume_state:
+            self.file = open(filepath, 'r+b')
+            self.file.truncate(resume_state['end'])
+            self.file.seek(0, os.SEEK_END)
+            self.offsets = list(resume_state['offsets'])
+            return
+
+        self.file = open(filepath, 'wb')
+        self.file.write(header)
+        self.file.write(bytes(8 * len(self.offsets)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def expected_tile_shape(self, tile_col: int, tile_row: int) -> Tuple[int, int]:
+        """`(height, width)` of a tile; tiles on the right and bottom edges may be smaller."""
+        tile_x, tile_y = self.tile_size
+        return (min(tile_y, self.height - tile_row * tile_y), min(tile_x, self.width - tile_col * tile_x))
+
+    def encode_tile(self, tile_col: int, tile_row: int, pixels: np.ndarray) -> bytes:
+        """
+        Encode one tile (`(height, width, channels)`, rows top-to-bottom) into a complete chunk.
+        Doesn't touch the file, so it can run on worker threads; zlib releases the GIL while compressing.
+        """
+        if pixels.shape != self.expected_tile_shape(tile_col, tile_row) + (len(self.channel_names),):
+            raise ValueError(f"Tile {tile_col},{tile_row} has shape {pixels.shape}; expected {self.expected_tile_shape(tile_col, tile_row)}")
+
+        data = compress_block(self.compression, pack_channels(pixels, self.channel_names, self.pixel_type))
+        return struct.pack('<5i', tile_col, tile_row, 0, 0, len(data)) + data
+
+    def encode_empty_tile(self, tile_col: int, tile_row: int) -> bytes:
+        """Encode an all-zero tile. Only compressed once per tile shape, as most empty tiles share one."""
+        shape = self.expected_tile_shape(tile_col, tile_row)
+        data = self.empty_tiles.get(shape)
+        if data is None:
+            zeros = np.zeros(shape + (len(self.channel_names),), dtype=np.float32)
+            data = compress_block(self.compression, pack_channels(zeros, self.channel_names, self.pixel_type))
+            self.empty_tiles[shape] = data
+        return struct.pack('<5i', tile_col, tile_row, 0, 0, len(data)) + data
+
+    def write_tile(self, tile_col: int, tile_row: int, chunk: bytes) -> None:
+        self.offsets[tile_row * self.tiles_x + tile_col] = self.file.tell()
+        self.file.write(chunk)
+
+    def checkpoint_state(self) -> dict:
+        """Make the tiles written so far durable and return the state needed to resume writing after them."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {
+            'end': self.file.tell(),
+            'offsets': list(self.offsets),
+        }
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+
+        missing = self.offsets.count(0)
+        if missing:
+            self.file.close()
+            raise RuntimeError(f"{missing} tiles were never written to {self.filepath}.")
+
+        self.file.seek(self.offset_table_position)
+        self.file.write(struct.pack(f'<{len(self.offsets)}Q', *self.offsets))
+        self.file.close()
+
+
+class ExrScanlineWriter:
+    """
+    Writes a scanline EXR one block of rows at a time, so only the rows being written need to be in memory.
+    Rows are passed top-to-bottom as `(rows, width, channels)` arrays via `write_rows()`.
+    `pixel_type` may be given per channel, e.g. to keep a float depth pass next to half colour passes.
+    """
+
+    def __init__(self, filepath: str, width: int, height: int, channel_names: List[str],
+            pixel_type: Union[int, List[int]] = PIXEL_HALF, compression: int = COMPRESSION_ZIP, metadata: Dict[str, bytes] = None):
+        if compression not in {COMPRESSION_NONE, COMPRESSION_ZIP, COMPRESSION_ZIPS}:
+            raise ExrError(f"Unsupported EXR compression {COMPRESSION_NAMES[compression]}")
+
+        self.filepath = filepath
+        self.width = width
+        self.height = height
+        self.channel_names = channel_names
+        self.pixel_type = pixel_type
+        self.compression = compression
+        self.lines_per_block = LINES_PER_BLOCK[compression]
+        self.rows_written = 0
+        self.offsets: List[int] = []
+        self._pending: List[np.ndarray] = []
+        self._pending_rows = 0
+
+        self.file = open(filepath, 'wb')
+        self.file.write(build_exr_header(width, height, channel_names, pixel_type, compression, metadata=metadata))
+        self.offset_table_position = self.file.tell()
+        self.file.write(bytes(8 * ((height + self.lines_per_block - 1) // self.lines_per_block)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        if rows.shape[1:] != (self.width, len(self.channel_names)):
+            raise ValueError(f"Expected rows of shape (n, {self.width}, {len(self.channel_names)}); got {rows.shape}")
+
+        self._pending.append(rows)
+        self._pending_rows += rows.shape[0]
+
+        if self._pending_rows >= self.lines_per_block:
+            pending = self._pending[0] if len(self._pending) == 1 else np.concatenate(self._pending)
+            full_rows = self._pending_rows - self._pending_rows % self.lines_per_block
+            for start in range(0, full_rows, self.lines_per_block):
+                self._write_block(pending[start:start + self.lines_per_block])
+            self._pending = [pending[full_rows:]] if full_rows < self._pending_rows else []
+            self._pending_rows -= full_rows
+
+        # Callers may reuse their band buffer, so keep our own copy of any leftover rows
+        self._pending = [np.array(chunk) for chunk in self._pending]
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+
+        if self._pending_rows:
+            self._write_block(np.concatenate(self._pending))
+            self._pending = []
+            self._pending_rows = 0
+
+        if self.rows_written != self.height:
+            self.file.close()
+            raise RuntimeError(f"Wrote {self.rows_written} rows to {self.filepath}; expected {self.height}.")
+
+        self.file.seek(self.offset_table_position)
+        self.file.write(struct.pack(f'<{len(self.offsets)}Q', *self.offsets))
+        self.file.close()
+
+    def _write_block(self, rows: np.ndarray) -> None:
+        data = compress_block(self.compression, pack_channels(rows, self.channel_names, self.pixel_type))
+        self.offsets.append(self.file.tell())
+        self.file.write(struct.pack('<ii', self.rows_written, len(data)))
+        self.file.write(data)
+        self.rows_written += rows.shape[0]
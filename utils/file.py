@@ -3,12 +3,20 @@ import os
 def get_tile_suffix(col: int, row: int) -> str:
     return f"_R{(row + 1):02}_C{(col + 1):02}"
 
-def get_tile_filepath(tile_suffix: str) -> str:
+def get_frame_suffix(frame: int = None) -> str:
+    """Frame number for tile and output filenames, padded like Blender's `####`; empty for a single frame."""
+    return "" if frame is None else f"_{frame:04}"
+
+def get_tile_filepath(tile_suffix: str, frame: int = None) -> str:
     file_extension = get_file_ext('OPEN_EXR')
-    filepath = os.path.join("//PartRenders", f"Part{tile_suffix}{file_extension}")
+    filepath = os.path.join("//PartRenders", f"Part{tile_suffix}{get_frame_suffix(frame)}{file_extension}")
     return filepath
 
 
+def get_merge_scratch_filepath(name: str = "merge_canvas") -> str:
+    return os.path.join("//PartRenders", f"{name}.raw")
+
+
 def get_file_ext(file_format: str) -> str:
     """
     `file_format` can be one of the following values:
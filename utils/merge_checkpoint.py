@@ -0,0 +1,89 @@
+import json
+import os
+from typing import Dict, Optional
+
+
+CHECKPOINT_VERSION = 1
+
+
+def get_checkpoint_filepath(output_filepath: str) -> str:
+    return f"{output_filepath}.checkpoint.json"
+
+
+def get_partial_filepath(output_filepath: str) -> str:
+    """Where a resumable merge writes its output until it is complete."""
+    return f"{output_filepath}.partial"
+
+
+class MergeCheckpoint:
+    """
+    Records which tiles a merge has durably written to its partial output, and the state its writer needs
+    to carry on, so a merge interrupted by a crash can resume instead of starting over.
+    Saved atomically each time a band of tiles is complete.
+    """
+
+    def __init__(self, filepath: str, config: dict):
+        self.filepath = filepath
+        self.config = config
+        self.tiles_done: Dict[str, list] = {} # Tile filepath: [size, mtime] when it was written
+        self.writer_state: dict = None
+
+    @classmethod
+    def load(cls, filepath: str, config: dict, abspaths: Dict[str, str]) -> Optional["MergeCheckpoint"]:
+        """
+        The saved checkpoint, if there is one for a merge with the same `config` and none of the tiles
+        it has written have changed since. `abspaths` maps tile filepaths to absolute paths.
+        """
+        try:
+            with open(filepath, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get('version') != CHECKPOINT_VERSION or data.get('config') != config:
+            return None
+
+        for (tile_filepath, (size, mtime)) in data.get('tiles_done', {}).items():
+            try:
+                stat = os.stat(abspaths[tile_filepath])
+            except (KeyError, OSError):
+                return None
+            if stat.st_size != size or stat.st_mtime != mtime:
+                return None
+
+        checkpoint = cls(filepath, config)
+        checkpoint.tiles_done = data.get('tiles_done', {})
+        checkpoint.writer_state = data.get('writer')
+        return checkpoint
+
+    @property
+    def resuming(self) -> bool:
+        return bool(self.tiles_done)
+
+    def is_done(self, tile_filepath: str) -> bool:
+        return tile_filepath in self.tiles_done
+
+    def mark_done(self, tile_filepath: str, abspath: str) -> None:
+        stat = os.stat(abspath)
+        self.tiles_done[tile_filepath] = [stat.st_size, stat.st_mtime]
+
+    def save(self, writer_state: dict = None) -> None:
+        self.writer_state = writer_state
+        data = {
+            'version': CHECKPOINT_VERSION,
+            'config': self.config,
+            'tiles_done': self.tiles_done,
+            'writer': writer_state,
+        }
+
+        # Write atomically, so a crash while saving leaves the previous checkpoint intact
+        temp_filepath = f"{self.filepath}.tmp"
+        with open(temp_filepath, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filepath, self.filepath)
+
+    def remove(self) -> None:
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Tuple
+
+
+MANIFEST_VERSION = 1
+HASH_CHUNK_SIZE = 1 << 20
+
+
+class TileEntry(NamedTuple):
+    filepath: str
+    size: int
+    mtime: float
+    hash: str
+    dimensions: tuple
+    offset: tuple
+
+
+def get_manifest_filepath(output_filepath: str) -> str:
+    return f"{output_filepath}.manifest.json"
+
+
+def hash_file(filepath: str) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_filepath: str) -> dict:
+    """Read a merge manifest, or return `None` if there isn't a usable one."""
+    try:
+        with open(manifest_filepath, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+
+    return manifest
+
+
+def scan_tiles(tiles: list, abspaths: List[str], previous: Dict[str, dict] = None) -> Tuple[List[TileEntry], list]:
+    """
+    Build manifest entries for `tiles` and work out which have changed since `previous` (the `tiles` of an
+    earlier manifest). Files whose size and mtime are unchanged are trusted without being read; the rest
+    are hashed in parallel, so a tile that was only touched isn't treated as changed.
+    Returns the new entries and the list of changed tiles.
+    """
+    previous = previous or {}
+
+    stats = [os.stat(path) for path in abspaths]
+    needs_hash = []
+    for (index, (tile, stat)) in enumerate(zip(tiles, stats)):
+        old = previous.get(tile.filepath)
+        unchanged = old is not None \
+            and old['size'] == stat.st_size \
+            and old['mtime'] == stat.st_mtime \
+            and tuple(old['dimensions']) == tuple(tile.dimensions) \
+            and tuple(old['offset']) == tuple(tile.offset)
+        if not unchanged:
+            needs_hash.append(index)
+
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+        hashes = dict(zip(needs_hash, executor.map(hash_file, [abspaths[index] for index in needs_hash])))
+
+    entries = []
+    changed = []
+    for (index, (tile, stat)) in enumerate(zip(tiles, stats)):
+        old = previous.get(tile.filepath)
+        file_hash = hashes[index] if index in hashes else old['hash']
+
+        entries.append(TileEntry(
+            filepath = tile.filepath,
+            size = stat.st_size,
+            mtime = stat.st_mtime,
+            hash = file_hash,
+            dimensions = tuple(tile.dimensions),
+            offset = tuple(tile.offset),
+        ))
+
+        if old is None \
+                or old['hash'] != file_hash \
+                or tuple(old['dimensions']) != tuple(tile.dimensions) \
+                or tuple(old['offset']) != tuple(tile.offset):
+            changed.append(tile)
+
+    return (entries, changed)
+
+
+def write_manifest(manifest_filepath: str, output_filepath: str, config: dict, entries: List[TileEntry]) -> None:
+    output_stat = os.stat(output_filepath)
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'output': {
+            'filepath': os.path.basename(output_filepath),
+            'size': output_stat.st_size,
+            'mtime': output_stat.st_mtime,
+        },
+        'config': config,
+        'tiles': {entry.filepath: entry._asdict() for entry in entries},
+    }
+
+    # Write atomically, so a crash never leaves a manifest that claims a merge that didn't happen
+    temp_filepath = f"{manifest_filepath}.tmp"
+    with open(temp_filepath, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(temp_filepath, manifest_filepath)
+
+
+def is_output_current(manifest: dict, output_filepath: str, config: dict) -> bool:
+    """Whether the output file on disk is the one `manifest` describes, made with the same settings."""
+    if manifest.get('config') != config:
+        return False
+
+    try:
+        output_stat = os.stat(output_filepath)
+    except OSError:
+        return False
+
+    output = manifest.get('output', {})
+    return output.get('size') == output_stat.st_size and output.get('mtime') == output_stat.st_mtime
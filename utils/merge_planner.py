@@ -0,0 +1,199 @@
+from math import ceil
+from typing import TYPE_CHECKING, NamedTuple
+
+from .perf import get_total_memory
+
+if TYPE_CHECKING:
+    # Only annotations need Blender's types, so the planner's arithmetic can be used (and tested) without Blender
+    from bpy.types import Context
+    from ..SRR_Settings import SRR_Settings
+
+
+# Tiles are rendered, decoded and handed to Blender as float RGBA
+FLOAT_RGBA_BYTES = 16
+# Rows the scanline EXR writer is given at a time
+EXR_CHUNK_ROWS = 256
+DEEP_ZOOM_TILE_SIZE = 256
+# Extra output formats encoded by our own writers on worker threads, rather than through Blender
+THREADED_OUTPUT_FORMATS = {'OPEN_EXR', 'PNG', 'TIFF'}
+# Formats the strategies write regardless of the scene's output format
+STRATEGY_OUTPUT_FORMATS = {'stream': 'TIFF', 'tiled': 'OPEN_EXR', 'multilayer': 'OPEN_EXR_MULTILAYER'}
+# Formats storing display-referred integers, which tiles can be quantised for as they are merged
+DISPLAY_FORMATS = {'PNG', 'JPEG', 'TIFF', 'BMP', 'TARGA', 'TARGA_RAW'}
+# Used when the machine's memory can't be determined
+FALLBACK_MEMORY_BUDGET = 8 * 1024 ** 3
+
+
+class MergeEstimate(NamedTuple):
+    strategy: str
+    peak_memory: int # Bytes held by the merge at its peak
+    io_bytes: int # Bytes read and written, including scratch files
+    output_format: str # File format the merge writes
+
+
+class MergePlan(NamedTuple):
+    estimate: MergeEstimate
+    budget: int
+    automatic: bool # Whether the strategy was picked by the planner
+
+    @property
+    def strategy(self) -> str:
+        return self.estimate.strategy
+
+    @property
+    def fits(self) -> bool:
+        return self.estimate.peak_memory <= self.budget
+
+
+def get_memory_budget(settings: "SRR_Settings") -> int:
+    if settings.memory_budget > 0:
+        return int(settings.memory_budget * 1024 ** 3)
+    # Leave the other half for Blender itself and the rest of the system
+    return get_total_memory() // 2 or FALLBACK_MEMORY_BUDGET
+
+
+def get_display_depth(settings: "SRR_Settings", image_settings, file_format: str) -> int:
+    """Bits per sample of a display-quantised merge writing `file_format`, or 0 if the merge keeps linear floats."""
+    if settings.merge_view_transform == 'NONE' or file_format not in DISPLAY_FORMATS:
+        return 0
+    return 16 if file_format in {'PNG', 'TIFF'} and image_settings.color_depth == '16' else 8
+
+
+def estimate_merge(strategy: str, resolution: tuple, max_tile: tuple, channel_count: int, sample_size: int, file_format: str,
+        prefetch_depth: int = 0, use_numpy: bool = True, deep_zoom: bool = False, extra_outputs: tuple = (),
+        display_depth: int = 0) -> MergeEstimate:
+    """
+    Estimate the peak memory and I/O volume of merging with `strategy`. Compression is ignored,
+    so I/O is an upper bound; memory counts the large buffers the merge allocates, not Blender's own.
+    `display_depth` is the bits per sample of a display-quantised merge, 0 for linear floats.
+    """
+    res_x, res_y = resolution
+    max_tile_x, max_tile_y = max_tile
+    pixels = res_x * res_y
+    tile_pixels = max_tile_x * max_tile_y
+
+    canvas = pixels * channel_count * sample_size
+    tile_input = pixels * FLOAT_RGBA_BYTES
+
+    if not use_numpy:
+        # `array('f')` canvas, Blender's copy of it for saving, and each tile as a Python list of floats
+        return MergeEstimate(strategy, pixels * FLOAT_RGBA_BYTES * 2 + tile_pixels * 4 * 32, tile_input + pixels * FLOAT_RGBA_BYTES, file_format)
+
+    # Decoded tiles queued by the prefetcher, the one being placed, and the Blender load buffer
+    tiles_in_flight = (max(prefetch_depth, 0) + 2) * tile_pixels * FLOAT_RGBA_BYTES
+
+    # Saving an EXR from a NumPy canvas writes it directly a chunk of rows at a time when it is
+    # memory-mapped or not float RGBA, as are PNG and TIFF from a display-quantised canvas (integer samples);
+    # otherwise Blender needs a float RGBA image of the whole output
+    is_float_rgba = channel_count == 4 and sample_size == 4
+    is_display = display_depth > 0
+    exr_chunk = min(EXR_CHUNK_ROWS, res_y) * res_x * channel_count * 4 * 3
+    blender_image = pixels * FLOAT_RGBA_BYTES * (1 if is_float_rgba else 2)
+    if is_display and file_format in THREADED_OUTPUT_FORMATS:
+        blender_image = exr_chunk
+
+    band = res_x * max_tile_y * channel_count * sample_size
+    if deep_zoom and strategy != 'tiled':
+        # Rows waiting to fill a row of Deep Zoom tiles, on every level of the pyramid
+        band += DEEP_ZOOM_TILE_SIZE * res_x * FLOAT_RGBA_BYTES * 2
+        tile_input += pixels * 4 * 4 // 3
+
+    # Extra outputs are encoded alongside the main save: our own encoders a chunk at a time on worker
+    # threads, the rest through Blender one after another
+    extra_formats = [extra for extra in extra_outputs if extra != file_format]
+    extra_encoding = sum(exr_chunk for extra in extra_formats if extra in THREADED_OUTPUT_FORMATS)
+    extra_save = blender_image if any(extra not in THREADED_OUTPUT_FORMATS for extra in extra_formats) else 0
+    extra_io = canvas * len(extra_formats)
+
+    if strategy == 'ram':
+        save = exr_chunk if file_format == 'OPEN_EXR' and not is_float_rgba else blender_image
+        save = max(save, extra_save) + extra_encoding
+        return MergeEstimate(strategy, canvas + tiles_in_flight + save, tile_input + canvas + extra_io, file_format)
+
+    if strategy == 'memmap':
+        # The canvas is paged in and out by the OS, at the cost of writing and reading it back once
+        save = exr_chunk if file_format == 'OPEN_EXR' else blender_image
+        save = max(save, extra_save) + extra_encoding
+        return MergeEstimate(strategy, tiles_in_flight + save, tile_input + canvas * 3 + extra_io, file_format)
+
+    if strategy == 'stream':
+        # One band, plus the rows the TIFF writer holds back to fill a strip
+        return MergeEstimate(strategy, tiles_in_flight + band * 2, tile_input + canvas, 'TIFF')
+
+    if strategy == 'tiled':
+        # Each prefetched tile is converted and encoded on a worker thread
+        encoding = (max(prefetch_depth, 0) + 1) * tile_pixels * channel_count * sample_size * 2
+        return MergeEstimate(strategy, tiles_in_flight + encoding, tile_input + canvas, 'OPEN_EXR')
+
+    if strategy == 'multilayer':
+        # Per pass: each is merged on its own memory-mapped canvas, assumed here to be four float channels
+        return MergeEstimate(strategy, tiles_in_flight + exr_chunk, tile_input + pixels * 16 * 3, 'OPEN_EXR_MULTILAYER')
+
+    raise ValueError(f"Unknown merge strategy {strategy}")
+
+
+def get_auto_strategies(file_format: str, region: bool = False) -> tuple:
+    """
+    Strategies `auto` picks from, most preferred first. In memory and memory-mapped merges keep the scene's output
+    format; after those, prefer the one whose output is closest to it.
+    A `region` merge crops the tiles at its edges, so they no longer fit the grid of a tiled EXR.
+    """
+    if region:
+        return ('ram', 'memmap', 'stream')
+    if file_format == 'OPEN_EXR':
+        return ('ram', 'memmap', 'tiled', 'stream')
+    return ('ram', 'memmap', 'stream', 'tiled')
+
+
+def get_region_strategy(strategy: str) -> str:
+    """The strategy used for `strategy` when merging a region, which the tiled EXR strategy can't."""
+    return 'memmap' if strategy == 'tiled' else strategy
+
+
+def plan_merge(context: "Context", use_numpy: bool = None, region_size: tuple = None) -> MergePlan:
+    """
+    Estimate the merge for the current settings. With the `auto` strategy, picks the first strategy
+    that fits the memory budget, or the one needing the least memory if none do.
+    `region_size` is the size of the region merged, if not the whole image.
+    Only does arithmetic on the settings, so it is cheap enough to run while drawing the panel.
+    """
+    scene = context.scene
+    render = scene.render
+    settings: "SRR_Settings" = scene.srr_settings
+
+    tiles_per_side = 2 ** int(settings.subdivisions)
+    max_tile = (ceil(render.resolution_x / tiles_per_side), ceil(render.resolution_y / tiles_per_side))
+    resolution = (render.resolution_x, render.resolution_y)
+    if region_size:
+        resolution = tuple(region_size)
+        max_tile = (min(max_tile[0], resolution[0]), min(max_tile[1], resolution[1]))
+
+    if use_numpy is None:
+        use_numpy = settings.merge_backend == 'numpy'
+    channel_count = {'RGBA': 4, 'RGB': 3, 'BW': 1}[settings.merge_channels] if use_numpy else 4
+    sample_size = 2 if use_numpy and settings.merge_precision == '16' else 4
+    file_format = render.image_settings.file_format
+    budget = get_memory_budget(settings)
+
+    def estimate(strategy: str) -> MergeEstimate:
+        output_format = STRATEGY_OUTPUT_FORMATS.get(strategy, file_format)
+        display_depth = get_display_depth(settings, render.image_settings, output_format) if use_numpy else 0
+        return estimate_merge(strategy, resolution, max_tile, channel_count, display_depth // 8 or sample_size, file_format,
+            settings.prefetch_depth, use_numpy, settings.export_deep_zoom, tuple(settings.extra_outputs), display_depth)
+
+    if settings.use_multilayer:
+        return MergePlan(estimate('multilayer'), budget, automatic=False)
+
+    if settings.merge_strategy != 'auto':
+        strategy = get_region_strategy(settings.merge_strategy) if region_size else settings.merge_strategy
+        return MergePlan(estimate(strategy), budget, automatic=False)
+
+    if not use_numpy:
+        return MergePlan(estimate('ram'), budget, automatic=True)
+
+    estimates = [estimate(strategy) for strategy in get_auto_strategies(file_format, region=bool(region_size))]
+    for candidate in estimates:
+        if candidate.peak_memory <= budget:
+            return MergePlan(candidate, budget, automatic=True)
+
+    return MergePlan(min(estimates, key=lambda candidate: candidate.peak_memory), budget, automatic=True)
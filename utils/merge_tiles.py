@@ -1,22 +1,158 @@
 import bpy
-from bpy.types import Context
+from bpy.types import Context, Image
 import gc
+import json
 import os
 from array import array
-from math import ceil
-from typing import List, NamedTuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from math import ceil, gcd
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
 
-from ..SRR_Settings import SRR_Settings
-from .file import get_file_ext, get_tile_filepath, get_tile_suffix
+try:
+    import numpy as np
+except ImportError:
+    # Blender bundles NumPy, but fall back to the `array` backend if it is ever missing
+    np = None
+else:
+    from .color import as_rgba_float32, convert_channels, quantise_for_display, to_display_rgba8
+    from .exr import (
+        COMPRESSION_NONE,
+        COMPRESSION_ZIP,
+        PIXEL_DTYPES,
+        PIXEL_FLOAT,
+        PIXEL_HALF,
+        ExrError,
+        ExrHeader,
+        ExrScanlineWriter,
+        ExrTiledWriter,
+        read_exr_channels,
+        read_exr_rgba,
+    )
+    from .deep_zoom import DeepZoomWriter
+    from .downsampled_outputs import DownsampledOutputs
+    from .png_writer import PngWriter
+    from .tiff_writer import TiffStripWriter
+
+from .file import get_file_ext, get_frame_suffix, get_merge_scratch_filepath, get_tile_filepath, get_tile_suffix
+from .merge_planner import STRATEGY_OUTPUT_FORMATS, THREADED_OUTPUT_FORMATS, get_display_depth, plan_merge
+from .merge_checkpoint import MergeCheckpoint, get_checkpoint_filepath, get_partial_filepath
+from .merge_manifest import get_manifest_filepath, is_output_current, load_manifest, scan_tiles, write_manifest
+from .perf import MergeStats, format_bytes
+from .tile_preflight import preflight_tiles
+from .tile_stats import MergeTileStats, is_empty_tile, write_tile_stats
+
+if TYPE_CHECKING:
+    # Only annotations need the add-on's settings, so the merge can be tested as the `utils` package on its own
+    from ..SRR_Settings import SRR_Settings
+
+
+FINAL_IMAGE_NAME = "super_res_render_output"
+# EXR codecs our own writer can produce, so Blender isn't needed to save the output
+DIRECT_EXR_CODECS = {'NONE', 'ZIP', 'ZIPS'}
 
 
 class MergeTile(NamedTuple):
     dimensions: tuple
     offset: tuple
     filepath: str
+    # When merging a region, only part of the rendered tile is merged: `(x, y, image_x, image_y)` is where
+    # that part lies within the rendered tile, and its size
+    crop: tuple = None
+
+    @property
+    def image_size(self) -> tuple:
+        """Size of the rendered tile image, which is larger than `dimensions` if the tile is cropped."""
+        return tuple(self.crop[2:]) if self.crop else self.dimensions
+
+    def crop_pixels(self, pixels: "np.ndarray") -> "np.ndarray":
+        """The part of a rendered tile's pixels (rows bottom-to-top) that is merged, as a view."""
+        if not self.crop:
+            return pixels
+        tile_x, tile_y = self.dimensions
+        crop_x, crop_y = self.crop[:2]
+        return pixels[crop_y:crop_y + tile_y, crop_x:crop_x + tile_x]
+
+
+class MergeRegion(NamedTuple):
+    """A rectangle of the full image in pixels, from the bottom left like Blender's Image Editor."""
+    x: int
+    y: int
+    width: int
+    height: int
+
+    @property
+    def suffix(self) -> str:
+        return f"_region_{self.x}_{self.y}_{self.width}x{self.height}"
+
+    def clip(self, resolution: Tuple[int, int]) -> "MergeRegion":
+        """The part of the region inside an image of `resolution`. Empty (no width or height) if it lies outside it."""
+        res_x, res_y = resolution
+        x = min(max(self.x, 0), res_x)
+        y = min(max(self.y, 0), res_y)
+        width = max(min(self.x + self.width, res_x) - x, 0)
+        height = max(min(self.y + self.height, res_y) - y, 0)
+        return MergeRegion(x, y, width, height)
+
+
+CHANNEL_NAMES = {
+    'RGBA': ['R', 'G', 'B', 'A'],
+    'RGB': ['R', 'G', 'B'],
+    'BW': ['Y'],
+}
+
+
+class PixelFormat(NamedTuple):
+    """
+    How merged pixels are stored: colour mode ('RGBA', 'RGB' or 'BW') and half or full float,
+    or with a `view_transform`, display values quantised to `depth` bit integers.
+    """
+    channels: str = 'RGBA'
+    half: bool = False
+    view_transform: str = None
+    depth: int = 8
+    dither: float = 0.0
+
+    @property
+    def dtype(self):
+        if self.view_transform:
+            return np.uint16 if self.depth == 16 else np.uint8
+        return np.float16 if self.half else np.float32
+
+    @property
+    def channel_names(self) -> List[str]:
+        return CHANNEL_NAMES[self.channels]
+
+    @property
+    def channel_count(self) -> int:
+        return len(self.channel_names)
+
+    def convert(self, pixels: "np.ndarray", seed=0) -> "np.ndarray":
+        """
+        Convert decoded float RGBA pixels to this format. Channel selection may return a view; quantising
+        returns a new array, dithered with noise from `seed` so every merge of a tile comes out the same.
+        """
+        pixels = convert_channels(pixels, self.channels)
+        if self.view_transform:
+            pixels = quantise_for_display(pixels, self.view_transform, self.dtype, self.dither, seed)
+        return pixels
+
+
+def get_pixel_format(context: Context, file_format: str = None) -> PixelFormat:
+    """How to store merged pixels for an output in `file_format`, the scene's output format by default."""
+    settings: SRR_Settings = context.scene.srr_settings
+    render = context.scene.render
+
+    depth = get_display_depth(settings, render.image_settings, file_format or render.image_settings.file_format)
+    if depth:
+        return PixelFormat(channels=settings.merge_channels, view_transform=settings.merge_view_transform, depth=depth,
+            dither=render.dither_intensity)
+    return PixelFormat(channels=settings.merge_channels, half=settings.merge_precision == '16')
 
 
-def generate_tiles_for_merge(context: Context) -> List[MergeTile]:
+def generate_tiles_for_merge(context: Context, frame: int = None) -> List[MergeTile]:
     scene = context.scene
 
     render = scene.render
@@ -34,7 +170,6 @@ def generate_tiles_for_merge(context: Context) -> List[MergeTile]:
     number_divisions = int(settings.subdivisions)
 
     tiles_per_side = 2 ** number_divisions
-    total_tiles = tiles_per_side ** 2
     max_tile_x = ceil(res_x / tiles_per_side)
     max_tile_y = ceil(res_y / tiles_per_side)
     last_tile_x = res_x - (max_tile_x * (tiles_per_side - 1))
@@ -62,7 +197,7 @@ def generate_tiles_for_merge(context: Context) -> List[MergeTile]:
             tile_x = last_tile_x if is_last_col else max_tile_x
 
             tile_suffix = get_tile_suffix(current_col, current_row)
-            filepath = get_tile_filepath(tile_suffix)
+            filepath = get_tile_filepath(tile_suffix, frame)
             tile = MergeTile(
                 dimensions = (tile_x, tile_y),
                 offset = (offset_x, offset_y),
@@ -76,20 +211,133 @@ def generate_tiles_for_merge(context: Context) -> List[MergeTile]:
     return tiles
 
 
-def do_merge_tiles(context: Context, tiles: List[MergeTile]) -> None:
-    scene = context.scene
+def crop_tiles_to_region(tiles: List[MergeTile], region: MergeRegion) -> List[MergeTile]:
+    """
+    The tiles overlapping `region`, cropped to it and offset from its bottom left corner,
+    so they merge into an image of just the region. Tiles outside it are dropped.
+    """
+    cropped = []
+    for tile in tiles:
+        tile_x, tile_y = tile.dimensions
+        offset_x, offset_y = tile.offset
 
-    render = scene.render
+        start_x = max(offset_x, region.x)
+        start_y = max(offset_y, region.y)
+        end_x = min(offset_x + tile_x, region.x + region.width)
+        end_y = min(offset_y + tile_y, region.y + region.height)
+        if end_x <= start_x or end_y <= start_y:
+            continue
 
-    res_x = render.resolution_x
-    res_y = render.resolution_y
+        cropped.append(MergeTile(
+            dimensions = (end_x - start_x, end_y - start_y),
+            offset = (start_x - region.x, start_y - region.y),
+            filepath = tile.filepath,
+            crop = (start_x - offset_x, start_y - offset_y, tile_x, tile_y),
+        ))
+
+    return cropped
+
+
+def get_merge_resolution(tiles: List[MergeTile]) -> Tuple[int, int]:
+    """Size of the image covered by `tiles`, in pixels."""
+    res_x = max(tile.offset[0] + tile.dimensions[0] for tile in tiles)
+    res_y = max(tile.offset[1] + tile.dimensions[1] for tile in tiles)
+    return (res_x, res_y)
+
+
+def iter_tile_rows(tiles: List[MergeTile]) -> Iterator[Tuple[int, int, List[MergeTile]]]:
+    """
+    Group tiles into horizontal bands, top band first (the order image files store rows in).
+    Yields `(offset_y, band_y, band_tiles)` for each band.
+    """
+    bands = {}
+    for tile in tiles:
+        bands.setdefault((tile.offset[1], tile.dimensions[1]), []).append(tile)
+
+    for (offset_y, band_y) in sorted(bands.keys(), reverse=True):
+        yield (offset_y, band_y, bands[(offset_y, band_y)])
+
+
+class BandFeed:
+    """
+    Passes the merged image to band outputs (e.g. a Deep Zoom pyramid) one band of tiles at a time,
+    top band first, as soon as every tile in the band has been placed on the canvas.
+    """
+
+    def __init__(self, tiles: List[MergeTile], outputs: list):
+        self.outputs = outputs
+        self.bands = [(offset_y, band_y) for (offset_y, band_y, _) in iter_tile_rows(tiles)]
+        self.remaining = {(offset_y, band_y): len(band_tiles) for (offset_y, band_y, band_tiles) in iter_tile_rows(tiles)}
+        self.next_band = 0
+
+    def tile_placed(self, tile: MergeTile, canvas: "np.ndarray") -> None:
+        key = (tile.offset[1], tile.dimensions[1])
+        if key in self.remaining:
+            self.remaining[key] -= 1
+
+        while self.next_band < len(self.bands) and self.remaining[self.bands[self.next_band]] <= 0:
+            self._emit_next_band(canvas)
+
+    def flush(self, canvas: "np.ndarray") -> None:
+        """Emit every band not emitted yet, complete or not."""
+        while self.next_band < len(self.bands):
+            self._emit_next_band(canvas)
+
+    def _emit_next_band(self, canvas: "np.ndarray") -> None:
+        offset_y, band_y = self.bands[self.next_band]
+        self.next_band += 1
+
+        # Image data runs bottom-to-top, outputs expect rows top-to-bottom
+        rows = canvas[offset_y:offset_y + band_y][::-1]
+        for output in self.outputs:
+            output.write_rows(rows)
+
+
+def create_band_outputs(context: Context, resolution: Tuple[int, int], frame: int = None, pixel_format: PixelFormat = None,
+        region: MergeRegion = None, file_format: str = None) -> list:
+    """
+    Extra outputs built band by band from the merged image while merging. `pixel_format` and `file_format`
+    are those of the merged output, the scene's output format by default.
+    """
+    settings: SRR_Settings = context.scene.srr_settings
+    image_settings = context.scene.render.image_settings
+    res_x, res_y = resolution
+    pixel_format = pixel_format or PixelFormat()
+    file_format = file_format or image_settings.file_format
+
+    outputs = []
+    if settings.export_deep_zoom and pixel_format.view_transform:
+        print("Deep Zoom export needs the linear merged image, skipping it with a merge-time view transform.")
+    elif settings.export_deep_zoom:
+        basepath = os.path.splitext(get_merged_image_filepath('PNG', frame, region))[0]
+        outputs.append(DeepZoomWriter(basepath, res_x, res_y))
 
+    if settings.downsampled_outputs:
+        # Written by our own encoders as the bands arrive, in the merged output's format; formats that need Blender get a PNG
+        file_format = file_format if file_format in THREADED_OUTPUT_FORMATS else 'PNG'
+        scales = sorted(int(scale) for scale in settings.downsampled_outputs)
+        outputs.append(DownsampledOutputs([(scale, get_merged_image_filepath(file_format, frame, region, scale)) for scale in scales],
+            res_x, res_y, file_format, pixel_format.channel_names, pixel_format.dtype, get_compress_level(image_settings, file_format)))
+
+    return outputs
+
+
+def get_merged_image_filepath(file_format: str, frame: int = None, region: MergeRegion = None, scale: int = 1) -> str:
+    """Where the merged image is saved; a `scale` above 1 gives its 1/`scale` size downsampled copy."""
+    final_image_ext = get_file_ext(file_format)
+    region_suffix = region.suffix if region else ""
+    scale_suffix = f"_{100 // scale}pct" if scale > 1 else ""
+    final_image_filepath = f"//super_res_render_output{region_suffix}{scale_suffix}{get_frame_suffix(frame)}" # TODO: allow customisation of output path - GitHub issue #1
+    final_image_filepath = bpy.path.ensure_ext(final_image_filepath, final_image_ext)
+    return os.path.realpath(bpy.path.abspath(final_image_filepath))
+
+
+def free_previous_merge_image() -> None:
     # Potentially free up memory from a previous merge
-    final_image_name = "super_res_render_output"
-    if final_image_name in bpy.data.images.keys():
+    if FINAL_IMAGE_NAME in bpy.data.images.keys():
         print("Removing previous merge image from Blender's memory...")
+        final_image = bpy.data.images[FINAL_IMAGE_NAME]
         try:
-            final_image = bpy.data.images[final_image_name]
             final_image.buffers_free()
         except Exception as e:
             print("Error freeing previous merge image:", e)
@@ -98,74 +346,1316 @@ def do_merge_tiles(context: Context, tiles: List[MergeTile]) -> None:
             final_image = None
             gc.collect()
 
+
+def load_tile_image(tile: MergeTile) -> Image:
+    """
+    Load a rendered tile into Blender and check that it has the expected size and channels.
+    The caller must free the image with `free_tile_image()`.
+    """
+    tile_x, tile_y = tile.image_size
+
+    print(f"Loading tile: {tile.filepath}")
+    tile_image = bpy.data.images.load(tile.filepath, check_existing=False)
+
     try:
-        print(f"Allocating storage for {res_x * res_y * 4} floats ({res_x * res_y} output pixels)...")
-        final_image_pixels = array('f', [0.0, 0.0, 0.0, 0.0] * res_x * res_y)
-        bytes_allocated = final_image_pixels.buffer_info()[1] * final_image_pixels.itemsize
-        print(f"Allocated {bytes_allocated / 1024 / 1024:,.2f} MBytes of memory.\n")
+        image_x, image_y = tile_image.size
 
-        for (dimensions, offset, filepath) in tiles:
-            tile_x, tile_y = dimensions
-            offset_x, offset_y = offset
+        if not (image_x == tile_x and image_y == tile_y):
+            raise RuntimeError(f"Image tile {tile.filepath} has incorrect dimensions {image_x}x{image_y}! Expected {tile_x}x{tile_y}.")
 
-            print(f"Loading tile: {filepath}")
+        if not tile_image.channels == 4:
+            raise RuntimeError(f"Image tile {tile.filepath} has {tile_image.channels} channels! Expected 4.")
 
-            try:
-                tile_image = bpy.data.images.load(filepath, check_existing=False)
-                image_x, image_y = tile_image.size
+    except Exception:
+        free_tile_image(tile_image)
+        raise
+
+    return tile_image
+
+
+def free_tile_image(tile_image: Image) -> None:
+    tile_image.buffers_free()
+    bpy.data.images.remove(tile_image)
+
+
+def get_merge_config(context: Context, tiles: List[MergeTile], region: MergeRegion = None) -> dict:
+    """Settings that change the merged output or what is written with it; a cached merge is only reused if these match."""
+    settings: SRR_Settings = context.scene.srr_settings
+    render = context.scene.render
+
+    return {
+        'resolution': list(get_merge_resolution(tiles)),
+        'tile_count': len(tiles),
+        'file_format': render.image_settings.file_format,
+        'merge_strategy': settings.merge_strategy,
+        'merge_channels': settings.merge_channels,
+        'merge_precision': settings.merge_precision,
+        'use_multilayer': settings.use_multilayer,
+        'extra_outputs': sorted(settings.extra_outputs),
+        'export_deep_zoom': settings.export_deep_zoom,
+        'downsampled_outputs': sorted(settings.downsampled_outputs),
+        'region': list(region) if region else None,
+        'view_transform': settings.merge_view_transform,
+        'dither': render.dither_intensity,
+    }
+
+
+def check_merge_manifest(context: Context, tiles: List[MergeTile], final_image_filepath: str,
+        region: MergeRegion = None) -> Tuple[list, List[MergeTile], bool]:
+    """
+    Compare the tiles on disk with the manifest of the previous merge.
+    Returns the new manifest entries, the tiles that changed, and whether the previous output is still valid.
+    """
+    manifest = load_manifest(get_manifest_filepath(final_image_filepath))
+    abspaths = [bpy.path.abspath(tile.filepath) for tile in tiles]
+
+    missing = [tile.filepath for (tile, path) in zip(tiles, abspaths) if not os.path.exists(path)]
+    if missing:
+        raise RuntimeError(f"Missing image tiles: {', '.join(missing)}")
+
+    output_current = manifest is not None and is_output_current(manifest, final_image_filepath, get_merge_config(context, tiles, region))
+    entries, changed_tiles = scan_tiles(tiles, abspaths, manifest['tiles'] if output_current else None)
+
+    return (entries, changed_tiles, output_current)
+
+
+def update_merge_manifest(context: Context, tiles: List[MergeTile], final_image_filepath: str, entries: list = None) -> None:
+    if entries is None:
+        entries, _ = scan_tiles(tiles, [bpy.path.abspath(tile.filepath) for tile in tiles])
+
+    manifest_filepath = get_manifest_filepath(final_image_filepath)
+    write_manifest(manifest_filepath, final_image_filepath, get_merge_config(context, tiles), entries)
+    print(f'Wrote merge manifest "{manifest_filepath}".')
+
+
+def open_merge_checkpoint(context: Context, tiles: List[MergeTile], final_image_filepath: str, strategy: str,
+        work_filepath: str, region: MergeRegion = None) -> MergeCheckpoint:
+    """
+    The checkpoint of an interrupted merge with the same settings and unchanged tiles whose partial output
+    (`work_filepath`) is still there, or a fresh checkpoint if there isn't one to resume.
+    """
+    config = dict(get_merge_config(context, tiles, region), strategy=strategy)
+    checkpoint_filepath = get_checkpoint_filepath(final_image_filepath)
+    abspaths = {tile.filepath: bpy.path.abspath(tile.filepath) for tile in tiles}
+
+    checkpoint = MergeCheckpoint.load(checkpoint_filepath, config, abspaths)
+    if checkpoint and checkpoint.resuming and os.path.exists(work_filepath):
+        print(f"Resuming interrupted merge: {len(checkpoint.tiles_done)} of {len(tiles)} tiles are already written.")
+        return checkpoint
+
+    # Don't let a stale checkpoint describe the partial output this merge is about to start over
+    checkpoint = MergeCheckpoint(checkpoint_filepath, config)
+    checkpoint.remove()
+    return checkpoint
+
+
+class BandCheckpointer:
+    """
+    Saves a merge checkpoint each time every tile of a band has been written. `sync()` is called first
+    to make the writes durable, and returns the writer state stored with the checkpoint.
+    """
+
+    def __init__(self, checkpoint: MergeCheckpoint, tiles: List[MergeTile], sync: Callable[[], dict]):
+        self.checkpoint = checkpoint
+        self.sync = sync
+        self.band_tiles = {}
+        for tile in tiles:
+            self.band_tiles.setdefault((tile.offset[1], tile.dimensions[1]), []).append(tile)
+        self.remaining = {key: len(band_tiles) for (key, band_tiles) in self.band_tiles.items()}
+        self.bands_left = len(self.band_tiles)
+
+    def tile_written(self, tile: MergeTile) -> None:
+        key = (tile.offset[1], tile.dimensions[1])
+        self.remaining[key] -= 1
+        if self.remaining[key] > 0:
+            return
+
+        self.bands_left -= 1
+        if self.bands_left == 0:
+            # Finishing the output is what commits the last band
+            return
+
+        writer_state = self.sync()
+        for band_tile in self.band_tiles[key]:
+            self.checkpoint.mark_done(band_tile.filepath, bpy.path.abspath(band_tile.filepath))
+        self.checkpoint.save(writer_state)
+        print(f"Checkpointed {len(self.checkpoint.tiles_done)} tiles.")
+
+
+class MergeJob:
+    """
+    One merge by `do_merge_tiles()`: the steps every merge goes through, and a method per merge strategy,
+    sharing what is merged, where it goes, and the extras written alongside it.
+    """
+
+    def __init__(self, context: Context, tiles: List[MergeTile], frame: Optional[int], region: Optional[MergeRegion], strategy: str,
+            use_numpy: bool, output_format: str, pixel_format: Optional[PixelFormat], headers: list,
+            encode_queue: "FrameEncodeQueue" = None):
+        self.context = context
+        self.settings: SRR_Settings = context.scene.srr_settings
+        self.tiles = tiles
+        self.frame = frame
+        self.region = region
+        self.strategy = strategy
+        self.use_numpy = use_numpy
+        self.output_format = output_format
+        self.pixel_format = pixel_format
+        self.headers = headers
+        self.final_image_filepath = get_merged_image_filepath(output_format, frame, region)
+        self.encode_queue = encode_queue
+        self.resolution = get_merge_resolution(tiles)
+
+        self.manifest_entries = None
+        self.manifest_config = None
+        self.patch_tiles: Optional[List[MergeTile]] = None # Only these are merged, onto the previous output
+        self.band_outputs = []
+        self.canvas_filepath: Optional[str] = None
+        self.work_filepath: Optional[str] = None
+        self.checkpoint: Optional[MergeCheckpoint] = None
+        self.empty_tiles: Set[str] = set()
+        self.tile_stats: Optional[MergeTileStats] = None
+        self.deferred_encode: Optional["DeferredEncode"] = None # Set when the outputs are left to the encode queue
+        self.stats: Optional[MergeStats] = None
+
+    def is_up_to_date(self) -> bool:
+        """
+        Compare the tiles with the manifest of the last merge. Returns whether its output is still current;
+        if not, notes the tiles to patch into it, if only some changed and it can be patched.
+        """
+        (self.manifest_entries, changed_tiles, output_current) = check_merge_manifest(self.context, self.tiles, self.final_image_filepath,
+            self.region)
+        if output_current and not changed_tiles:
+            return True
+
+        # Patching needs a canvas to load the previous output into, and a lossless output to load
+        can_patch = self.use_numpy and self.strategy in {'ram', 'memmap'} \
+            and self.context.scene.render.image_settings.file_format == 'OPEN_EXR' and self.pixel_format == PixelFormat()
+        if output_current and can_patch:
+            print(f"{len(changed_tiles)} of {len(self.tiles)} tiles changed since the last merge, patching them in.")
+            self.patch_tiles = changed_tiles
+        return False
+
+    def set_up_outputs(self) -> None:
+        """Create the outputs written from bands of the merged image, and tell which extras this merge can't write."""
+        settings = self.settings
+        strategy = self.strategy
 
-                if not (image_x == tile_x and image_y == tile_y):
-                    raise RuntimeError(f"Image tile {filepath} has incorrect dimensions {image_x}x{image_y}! Expected {tile_x}x{tile_y}.")
+        if strategy == 'multilayer':
+            if settings.export_deep_zoom:
+                print("Deep Zoom export isn't supported for multilayer merges, skipping it.")
+        elif strategy == 'tiled':
+            if settings.export_deep_zoom:
+                print("The tiled EXR strategy never assembles bands of the image, skipping the Deep Zoom export.")
+        elif self.use_numpy:
+            self.band_outputs = create_band_outputs(self.context, self.resolution, self.frame, self.pixel_format, self.region,
+                self.output_format)
+        elif settings.export_deep_zoom:
+            print("Deep Zoom export requires the NumPy merge backend, skipping it.")
 
-                if not tile_image.channels == 4:
-                    raise RuntimeError(f"Image tile {filepath} has {tile_image.channels} channels! Expected 4.")
+        if settings.downsampled_outputs and (strategy in {'multilayer', 'tiled'} or not self.use_numpy):
+            print("Downsampled copies are built from bands of the merged image, which this merge never assembles, skipping them.")
 
-                # Copy the pixels
-                tile_pixels = list(tile_image.pixels)
+        if settings.extra_outputs and strategy in {'multilayer', 'stream', 'tiled'}:
+            print("Extra outputs are encoded from the whole merged image, which this strategy never holds, skipping them.")
 
-                for y in range(tile_y):
-                    # Copy a row
-                    source_pixel_start = y * tile_x * 4
-                    source_pixel_end = source_pixel_start + (tile_x * 4)
+    def set_up_checkpoint(self) -> None:
+        """Merges that build their output on disk can checkpoint it, so a crash doesn't lose the work done so far."""
+        if self.use_numpy and self.strategy == 'memmap':
+            # Numbered by frame, as a frame can still be encoding from its canvas while the next one is merged
+            self.canvas_filepath = os.path.realpath(bpy.path.abspath(get_merge_scratch_filepath(f"merge_canvas{get_frame_suffix(self.frame)}")))
+        self.work_filepath = self.canvas_filepath if self.strategy == 'memmap' else get_partial_filepath(self.final_image_filepath)
 
-                    target_y = offset_y + y
-                    target_pixel_start = (target_y * res_x + offset_x) * 4
-                    target_pixel_end = target_pixel_start + (tile_x * 4)
+        if self.settings.use_merge_checkpoints and self.use_numpy and self.strategy in {'memmap', 'stream', 'tiled'}:
+            if self.patch_tiles is not None or self.band_outputs:
+                print("Patching a cached merge or writing Deep Zoom or downsampled copies can't be resumed, merging without checkpoints.")
+            else:
+                self.checkpoint = open_merge_checkpoint(self.context, self.tiles, self.final_image_filepath, self.strategy, self.work_filepath,
+                    self.region)
 
-                    final_image_pixels[target_pixel_start:target_pixel_end] = array('f', tile_pixels[source_pixel_start:source_pixel_end])
+    def set_up_tile_stats(self) -> None:
+        settings = self.settings
+        is_rgba = self.use_numpy and self.strategy != 'multilayer'
 
-                del tile_pixels
-                print(f"Copied {tile_x * tile_y} pixels OK.")
+        # Tiles known to be empty needn't be read. Quantising for display may turn zeros into something else (dither).
+        if settings.skip_empty_tiles and is_rgba and not self.pixel_format.view_transform:
+            self.empty_tiles = find_empty_tiles(self.tiles)
 
+        # Measured from the decoded tiles as they are merged
+        if settings.collect_tile_stats and is_rgba:
+            self.tile_stats = MergeTileStats(self.resolution)
+        elif settings.collect_tile_stats:
+            print("Tile statistics are only collected for NumPy merges of RGBA tiles, skipping them.")
+
+    def run(self) -> MergeStats:
+        """Merge with the job's strategy, then finish up, right away or on the encode queue."""
+        merge = {
+            'multilayer': self.merge_multilayer,
+            'stream': self.merge_streaming,
+            'tiled': self.merge_tiled,
+            'ram': self.merge_canvas,
+            'memmap': self.merge_canvas,
+        }[self.strategy]
+        merge()
+
+        for output in self.band_outputs:
+            output.close()
+
+        # Resolved now, the rest may run on the encode queue's thread, which must not touch bpy
+        if self.settings.use_merge_cache:
+            self.manifest_config = get_merge_config(self.context, self.tiles, self.region)
+            if self.manifest_entries is None:
+                (self.manifest_entries, _) = scan_tiles(self.tiles, [bpy.path.abspath(tile.filepath) for tile in self.tiles])
+
+        if self.deferred_encode:
+            self.encode_queue.submit(self.frame, self.finish)
+        else:
+            self.finish()
+
+        return self.stats
+
+    @property
+    def exr_compression(self) -> int:
+        return COMPRESSION_NONE if self.context.scene.render.image_settings.exr_codec == 'NONE' else COMPRESSION_ZIP
+
+    @property
+    def output_filepath(self) -> str:
+        """File the stream and tiled strategies write; a checkpointed merge writes a partial file, moved into place once complete."""
+        return self.work_filepath if self.checkpoint else self.final_image_filepath
+
+    def merge_multilayer(self) -> None:
+        self.stats = MergeStats("numpy, multilayer")
+
+        try:
+            merge_tiles_multilayer(self.tiles, self.final_image_filepath, self.exr_compression, self.settings.prefetch_depth, self.stats,
+                self.headers)
+        except Exception as e:
+            print("Error merging multilayer tiles:", e)
+            raise
+
+    def merge_streaming(self) -> None:
+        self.stats = MergeStats("numpy, stream")
+        compress = self.context.scene.render.image_settings.tiff_codec != 'NONE'
+
+        try:
+            merge_tiles_streaming(self.tiles, self.output_filepath, compress, self.settings.prefetch_depth, self.stats,
+                self.band_outputs, self.pixel_format, self.checkpoint, self.empty_tiles, self.tile_stats)
+        except Exception as e:
+            print("Error streaming image tiles:", e)
+            raise
+
+        if self.checkpoint:
+            os.replace(self.work_filepath, self.final_image_filepath)
+
+    def merge_tiled(self) -> None:
+        self.stats = MergeStats("numpy, tiled")
+
+        try:
+            merge_tiles_tiled(self.tiles, self.output_filepath, self.exr_compression, self.settings.prefetch_depth, self.stats,
+                self.pixel_format, self.checkpoint, self.empty_tiles, self.tile_stats)
+        except Exception as e:
+            print("Error writing tiled image:", e)
+            raise
+
+        if self.checkpoint:
+            os.replace(self.work_filepath, self.final_image_filepath)
+
+    def merge_canvas(self) -> None:
+        """The in memory and memory-mapped strategies: composite the tiles onto a canvas, then save it."""
+        settings = self.settings
+        self.stats = MergeStats(f"numpy, {self.strategy}" if self.use_numpy else "array, ram")
+        completed = False
+
+        try:
+            try:
+                band_feed = BandFeed(self.tiles, self.band_outputs) if self.band_outputs else None
+                if self.patch_tiles is not None:
+                    final_image_pixels = merge_tiles_numpy(self.patch_tiles, self.canvas_filepath, settings.prefetch_depth, self.stats,
+                        band_feed, base_image_filepath=self.final_image_filepath, resolution=self.resolution, empty=self.empty_tiles,
+                        tile_stats=self.tile_stats)
+                elif self.use_numpy:
+                    final_image_pixels = merge_tiles_numpy(self.tiles, self.canvas_filepath, settings.prefetch_depth, self.stats, band_feed,
+                        pixel_format=self.pixel_format, checkpoint=self.checkpoint, empty=self.empty_tiles, tile_stats=self.tile_stats)
+                else:
+                    final_image_pixels = merge_tiles_array(self.tiles, self.stats)
+
+            except Exception as e:
+                print("Error compositing image tiles:", e)
+                raise
+
+            # Free up any memory still held by loaded images
+            print("\nFreeing image memory...")
+            gc.collect()
+
+            if self.use_numpy and self.encode_queue is not None and can_encode_without_blender(self.context, self.pixel_format):
+                self.deferred_encode = DeferredEncode(self.context, final_image_pixels, self.pixel_format, self.frame, self.region)
+            elif self.use_numpy:
+                save_merged_outputs(self.context, final_image_pixels, self.resolution, self.pixel_format, self.frame, self.region)
+            else:
+                if settings.extra_outputs:
+                    print("Extra outputs require the NumPy merge backend, skipping them.")
+                save_merged_image(self.context, final_image_pixels, self.resolution, frame=self.frame)
+
+            del final_image_pixels
+            gc.collect()
+            completed = True
+
+        finally:
+            # The memmap is closed once the last reference to it is gone.
+            # An interrupted merge keeps it for its checkpoint to resume from, a deferred encode until it is written.
+            if self.canvas_filepath and os.path.exists(self.canvas_filepath) and (completed or self.checkpoint is None) \
+                    and self.deferred_encode is None:
+                os.remove(self.canvas_filepath)
+
+    def finish(self) -> None:
+        """Write a deferred encode, then the merge's records. May run on the encode queue's thread, so mustn't touch bpy."""
+        if self.deferred_encode:
+            encoded = False
+            try:
+                self.deferred_encode.run()
+                encoded = True
             finally:
-                tile_image.buffers_free()
-                bpy.data.images.remove(tile_image)
-                del tile_image
+                if self.canvas_filepath and os.path.exists(self.canvas_filepath) and (encoded or self.checkpoint is None):
+                    os.remove(self.canvas_filepath)
 
-    except Exception as e:
-        print("Error compositing image tiles:", e)
-        raise
+        if self.checkpoint:
+            self.checkpoint.remove()
 
-    # Free up any memory still held by loaded images
-    print("\nFreeing image memory...")
-    gc.collect()
+        if self.tile_stats:
+            # A patched merge only measured the tiles that changed
+            self.tile_stats.write(self.final_image_filepath, update=self.patch_tiles is not None)
+
+        if self.manifest_config is not None:
+            manifest_filepath = get_manifest_filepath(self.final_image_filepath)
+            write_manifest(manifest_filepath, self.final_image_filepath, self.manifest_config, self.manifest_entries)
+            print(f'Wrote merge manifest "{manifest_filepath}".')
+
+        self.stats.finish()
+        print(self.stats.report())
+
+
+def do_merge_tiles(context: Context, tiles: List[MergeTile], frame: int = None, encode_queue: "FrameEncodeQueue" = None,
+        region: MergeRegion = None) -> MergeStats:
+    """
+    Merge the tiles of `frame` (or of the unnumbered current frame) into the output image.
+    With an `encode_queue`, outputs that don't need Blender are handed to it and written while the caller
+    goes on to merge the next frame; the returned stats are only final once the queue has been closed.
+    With a `region`, only the tiles overlapping it are loaded, and only it is merged, into an output of its own.
+    """
+    settings: SRR_Settings = context.scene.srr_settings
+    render = context.scene.render
+
+    free_previous_merge_image()
+
+    use_numpy = settings.merge_backend == 'numpy' and np is not None
+
+    if region:
+        if not use_numpy:
+            raise RuntimeError("Merging a region requires the NumPy merge backend.")
+        tiles = crop_tiles_to_region(tiles, region)
+        if not tiles:
+            raise RuntimeError(f"The region {region.width}x{region.height} at {region.x},{region.y} is outside the image.")
+        print(f"Merging the {region.width}x{region.height} region at {region.x},{region.y} from {len(tiles)} tiles.")
+
+    # Multilayer tiles are always merged per pass, which the plan reports as the 'multilayer' strategy
+    plan = plan_merge(context, use_numpy, (region.width, region.height) if region else None)
+    strategy = plan.strategy
+    print(f"Merge plan: {'automatic, ' if plan.automatic else ''}{strategy}, "
+        f"~{format_bytes(plan.estimate.peak_memory)} peak memory of a {format_bytes(plan.budget)} budget, "
+        f"~{format_bytes(plan.estimate.io_bytes)} disk I/O")
+    if not plan.fits:
+        print("Warning: the merge is estimated to need more memory than the budget allows.")
+
+    use_multilayer = strategy == 'multilayer'
+    output_format = STRATEGY_OUTPUT_FORMATS.get(strategy, render.image_settings.file_format)
+    if use_multilayer and np is None:
+        raise RuntimeError("Merging multilayer tiles requires NumPy.")
+    if strategy in {'stream', 'tiled'} and np is None:
+        raise RuntimeError(f"The {strategy} merge strategy requires NumPy.")
+    # The stream and tiled strategies always merge with NumPy, whichever backend is chosen
+    pixel_format = get_pixel_format(context, output_format) if use_numpy or strategy in {'stream', 'tiled'} else None
+
+    # Catch broken tiles from their headers, before allocating anything or copying a single tile.
+    # RGB and greyscale tiles are filled in to RGBA when they are read, so only a colour channel is needed.
+    headers = preflight_tiles(tiles, [bpy.path.abspath(tile.filepath) for tile in tiles],
+        required_channels=None if use_multilayer else [('R', 'Y')], same_channels=use_multilayer)
+
+    job = MergeJob(context, tiles, frame, region, strategy, use_numpy, output_format, pixel_format, headers, encode_queue)
+
+    # Only redo the work for tiles that changed since the last merge
+    if settings.use_merge_cache and job.is_up_to_date():
+        print("No tiles have changed since the last merge, nothing to do.")
+        stats = MergeStats("cached")
+        stats.finish()
+        return stats
+
+    job.set_up_outputs()
+    job.set_up_checkpoint()
+    job.set_up_tile_stats()
+    return job.run()
+
+
+def find_empty_tiles(tiles: List[MergeTile]) -> Set[str]:
+    """Filepaths of the tiles whose stats, recorded when they were rendered, say they are completely empty."""
+    empty = {tile.filepath for tile in tiles if is_empty_tile(bpy.path.abspath(tile.filepath))}
+    if empty:
+        print(f"{len(empty)} of {len(tiles)} tiles are empty, skipping them.")
+    return empty
+
+
+def allocate_canvas(shape: tuple, dtype, filepath: str = None, resume: bool = False) -> "np.ndarray":
+    """
+    Allocate a zeroed canvas, either in RAM or as an `np.memmap` backed by a scratch file at `filepath`.
+    A new memmap file is sparse, so untouched regions cost neither RAM nor disk.
+    With `resume`, the existing scratch file is mapped as it is instead.
+    """
+    if filepath is None:
+        return np.zeros(shape, dtype=dtype)
+
+    if resume:
+        print(f'Reopening canvas scratch file "{filepath}"...')
+        return np.memmap(filepath, dtype=dtype, mode='r+', shape=shape)
+
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    print(f'Mapping canvas onto scratch file "{filepath}"...')
+    return np.memmap(filepath, dtype=dtype, mode='w+', shape=shape)
+
+
+def decode_tile(tile: MergeTile, filepath: str, channel_names: List[str] = None) -> "np.ndarray":
+    """
+    Decode a tile without going through Blender, so it can run on a worker thread.
+    Decodes RGBA as float32 by default, or just `channel_names` in the file's pixel type.
+    Cropped tiles are cropped after decoding.
+    """
+    tile_x, tile_y = tile.image_size
+
+    if channel_names is None:
+        pixels = read_exr_rgba(filepath)
+    else:
+        try:
+            _, channels = read_exr_channels(filepath, channel_names)
+        except ExrError as e:
+            # Blender can't load single passes either, so there is nothing to fall back to
+            raise RuntimeError(f"Can't read passes from image tile {tile.filepath}: {e}") from e
+        # Image data runs bottom-to-top, EXR rows run top-to-bottom
+        pixels = np.stack([channels[name] for name in channel_names], axis=-1)[::-1]
+
+    image_y, image_x = pixels.shape[:2]
+
+    if not (image_x == tile_x and image_y == tile_y):
+        raise RuntimeError(f"Image tile {tile.filepath} has incorrect dimensions {image_x}x{image_y}! Expected {tile_x}x{tile_y}.")
+
+    return tile.crop_pixels(pixels)
+
+
+def iter_tile_pixels(tiles: List[MergeTile], prefetch_depth: int = 0, stats: MergeStats = None,
+        process: Callable[[MergeTile, "np.ndarray"], Any] = None, channel_names: List[str] = None,
+        empty: Set[str] = None, tile_stats: MergeTileStats = None) -> Iterator[Tuple[MergeTile, Any]]:
+    """
+    Yield each tile in order with its pixels as a `(tile_y, tile_x, 4)` float32 array, rows bottom-to-top.
+    With `channel_names`, only those channels are decoded, as `(tile_y, tile_x, len(channel_names))` arrays.
+
+    With `prefetch_depth` > 0, up to that many tiles are read and decoded ahead on worker threads while the
+    caller places the current one, which bounds memory to `prefetch_depth + 1` decoded tiles. Tiles the
+    worker threads can't decode are loaded through Blender on the main thread instead.
+    The yielded array may be reused for the next tile, so copy out of it before moving on.
+
+    If `process` is given, it is called with each tile and its pixels (on the worker thread when prefetching)
+    and its result is yielded instead of the pixels.
+    Tiles whose filepaths are in `empty` are neither read nor processed, and yielded with `None`.
+    Each tile's RGBA pixels are measured into `tile_stats`, if given, before they are processed.
+    """
+    if not tiles:
+        return
+
+    max_tile_x = max(tile.image_size[0] for tile in tiles)
+    max_tile_y = max(tile.image_size[1] for tile in tiles)
+    tile_buffer = np.empty(max_tile_x * max_tile_y * 4, dtype=np.float32)
+
+    def load_with_blender(tile: MergeTile) -> "np.ndarray":
+        tile_x, tile_y = tile.image_size
+
+        tile_image = load_tile_image(tile)
+        try:
+            tile_pixels = tile_buffer[:tile_x * tile_y * 4]
+            tile_image.pixels.foreach_get(tile_pixels)
+            return tile.crop_pixels(tile_pixels.reshape(tile_y, tile_x, 4))
+        finally:
+            free_tile_image(tile_image)
+            del tile_image
+
+    def finish_tile(tile: MergeTile, tile_pixels: "np.ndarray"):
+        if tile_stats and not channel_names:
+            tile_stats.measure(tile, tile_pixels)
+        return process(tile, tile_pixels) if process else tile_pixels
+
+    def load_on_main_thread(tile: MergeTile):
+        if channel_names:
+            tile_pixels = decode_tile(tile, bpy.path.abspath(tile.filepath), channel_names)
+        else:
+            tile_pixels = load_with_blender(tile)
+        return finish_tile(tile, tile_pixels)
+
+    def load_on_worker_thread(tile: MergeTile, filepath: str):
+        return finish_tile(tile, decode_tile(tile, filepath, channel_names))
+
+    empty = empty or set()
+
+    def skip(tile: MergeTile) -> None:
+        if tile_stats:
+            tile_stats.measure_empty(tile)
+        if stats:
+            stats.add_skipped_tile()
+        print(f"Skipped empty tile: {tile.filepath}")
+
+    if prefetch_depth <= 0:
+        for tile in tiles:
+            if tile.filepath in empty:
+                skip(tile)
+                yield (tile, None)
+            else:
+                yield (tile, load_on_main_thread(tile))
+        return
+
+    worker_count = min(prefetch_depth, os.cpu_count() or 1)
+    print(f"Prefetching {prefetch_depth} tiles ahead on {worker_count} threads.")
+
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        pending = deque()
+        remaining = iter(tiles)
+
+        def submit_next():
+            tile = next(remaining, None)
+            if tile is not None and tile.filepath in empty:
+                pending.append((tile, None))
+            elif tile is not None:
+                # Resolve the path here, bpy must not be touched from the worker threads
+                filepath = bpy.path.abspath(tile.filepath)
+                pending.append((tile, executor.submit(load_on_worker_thread, tile, filepath)))
+
+        for _ in range(prefetch_depth):
+            submit_next()
+
+        try:
+            while pending:
+                tile, future = pending.popleft()
+
+                if future is None:
+                    skip(tile)
+                    submit_next()
+                    yield (tile, None)
+                    continue
+
+                wait_start = perf_counter()
+                try:
+                    tile_pixels = future.result()
+                    print(f"Decoded tile: {tile.filepath}")
+                except ExrError as e:
+                    print(f"Can't decode {tile.filepath} on a worker thread ({e}), loading it through Blender...")
+                    tile_pixels = load_on_main_thread(tile)
+                if stats:
+                    stats.add_wait(perf_counter() - wait_start)
+
+                # Keep the workers busy while the caller copies this tile
+                submit_next()
+
+                yield (tile, tile_pixels)
+
+        finally:
+            for (_, future) in pending:
+                future.cancel()
+
+
+def load_image_into_canvas(filepath: str, canvas: "np.ndarray") -> None:
+    """Fill `canvas` with the pixels of a previously merged image."""
+    res_y, res_x = canvas.shape[:2]
+
+    print(f'Loading previous output "{filepath}"...')
+    image = bpy.data.images.load(filepath, check_existing=False)
+    try:
+        image_x, image_y = image.size
+        if not (image_x == res_x and image_y == res_y and image.channels == 4):
+            raise RuntimeError(f"Previous output {filepath} doesn't match the current merge settings.")
+
+        image.pixels.foreach_get(canvas.reshape(-1))
+    finally:
+        free_tile_image(image)
+        del image
+
+
+def merge_tiles_numpy(tiles: List[MergeTile], canvas_filepath: str = None, prefetch_depth: int = 0, stats: MergeStats = None,
+        band_feed: BandFeed = None, base_image_filepath: str = None, resolution: Tuple[int, int] = None,
+        pixel_format: PixelFormat = PixelFormat(), checkpoint: MergeCheckpoint = None, empty: Set[str] = None,
+        tile_stats: MergeTileStats = None) -> "np.ndarray":
+    """
+    Composite the tiles into a `(res_y, res_x, channels)` canvas in `pixel_format`, memory-mapped onto `canvas_filepath` if given.
+    Each tile is placed with a single slice assignment, and completed bands are passed on to `band_feed`.
+    To patch tiles into an existing merge, pass its `base_image_filepath` and the full output `resolution`.
+    With a `checkpoint` (memory-mapped canvases only), the canvas is flushed and checkpointed after each band,
+    and tiles an interrupted merge already placed are skipped.
+    Tiles in `empty` are left to the zeroed canvas; they are only cleared when it holds earlier pixels.
+    """
+    res_x, res_y = resolution or get_merge_resolution(tiles)
+    channel_count = pixel_format.channel_count
+
+    print(f"Allocating storage for {res_x * res_y * channel_count} {np.dtype(pixel_format.dtype).name} values ({res_x * res_y} output pixels)...")
+    resume = checkpoint is not None and checkpoint.resuming
+    canvas = allocate_canvas((res_y, res_x, channel_count), pixel_format.dtype, canvas_filepath, resume)
+    print(f"Allocated {canvas.nbytes / 1024 / 1024:,.2f} MBytes{' (memory-mapped)' if canvas_filepath else ''}.\n")
+
+    if base_image_filepath:
+        load_image_into_canvas(base_image_filepath, canvas)
+
+    checkpointer = None
+    if checkpoint is not None:
+        tiles = [tile for tile in tiles if not checkpoint.is_done(tile.filepath)]
+        checkpointer = BandCheckpointer(checkpoint, tiles, canvas.flush)
+
+    def convert(tile: MergeTile, tile_pixels: "np.ndarray") -> "np.ndarray":
+        # Runs on the worker threads when prefetching
+        return pixel_format.convert(tile_pixels, tile.offset)
+
+    # A new canvas is already zero, a patched or resumed one may hold pixels of the tile
+    is_fresh = not base_image_filepath and not resume
+
+    for (tile, tile_pixels) in iter_tile_pixels(tiles, prefetch_depth, stats, process=convert, empty=empty, tile_stats=tile_stats):
+        tile_x, tile_y = tile.dimensions
+        offset_x, offset_y = tile.offset
+
+        if tile_pixels is None:
+            if not is_fresh:
+                canvas[offset_y:offset_y + tile_y, offset_x:offset_x + tile_x] = 0
+        else:
+            canvas[offset_y:offset_y + tile_y, offset_x:offset_x + tile_x] = tile_pixels
+            if stats:
+                stats.add_tile(tile_pixels.nbytes)
+            print(f"Copied {tile_x * tile_y} pixels OK.")
+
+        if band_feed:
+            band_feed.tile_placed(tile, canvas)
+        if checkpointer:
+            checkpointer.tile_written(tile)
+
+    if band_feed:
+        band_feed.flush(canvas)
+
+    return canvas
+
+
+def merge_tiles_streaming(tiles: List[MergeTile], filepath: str, compress: bool = True, prefetch_depth: int = 0, stats: MergeStats = None,
+        band_outputs: list = (), pixel_format: PixelFormat = PixelFormat(), checkpoint: MergeCheckpoint = None,
+        empty: Set[str] = None, tile_stats: MergeTileStats = None) -> None:
+    """
+    Write the tiles straight to a (Big)TIFF at `filepath` in `pixel_format`, one band of tiles at a time.
+    Only one band (`res_x * max_tile_y` pixels) is ever held in memory; the full image never is.
+    Each band is also passed to `band_outputs`.
+    With a `checkpoint`, each written band is checkpointed, and an interrupted merge carries on after its last band.
+    Tiles in `empty` are left as the band's zeros.
+    """
+    res_x, res_y = get_merge_resolution(tiles)
+    max_tile_y = max(tile.dimensions[1] for tile in tiles)
+
+    band_buffer = np.zeros((max_tile_y, res_x, pixel_format.channel_count), dtype=pixel_format.dtype)
+    print(f"Allocated {band_buffer.nbytes / 1024 / 1024:,.2f} MBytes for one band of tiles.\n")
+    print(f'Streaming output to "{filepath}" ...')
+
+    # Load the tiles band by band, so the prefetcher runs ahead across band boundaries
+    ordered_tiles = [tile for (_, _, band_tiles) in iter_tile_rows(tiles) for tile in band_tiles]
+
+    # Each band must end on a strip, to checkpoint after it. Bands are all the same height but the bottom one,
+    # unless merging a region, where the top one is cropped too.
+    band_heights = [band_y for (_, band_y, _) in iter_tile_rows(tiles)]
+    rows_per_strip = reduce(gcd, band_heights[:-1] or band_heights)
+
+    resume_state = None
+    if checkpoint is not None:
+        if checkpoint.resuming:
+            resume_state = checkpoint.writer_state
+        ordered_tiles = [tile for tile in ordered_tiles if not checkpoint.is_done(tile.filepath)]
+
+    with TiffStripWriter(filepath, res_x, res_y, pixel_format.channel_count, pixel_format.dtype, rows_per_strip=rows_per_strip, compress=compress,
+            resume_state=resume_state) as writer:
+        checkpointer = BandCheckpointer(checkpoint, ordered_tiles, writer.checkpoint_state) if checkpoint else None
+        band = None
+        band_key = None
+        band_members = []
+
+        def write_band():
+            # Image data runs bottom-to-top, TIFF rows run top-to-bottom
+            writer.write_rows(band[::-1])
+            for output in band_outputs:
+                output.write_rows(band[::-1])
+            print(f"Wrote band of {band.shape[0]} rows.")
+
+            if checkpointer:
+                for tile in band_members:
+                    checkpointer.tile_written(tile)
+
+        def convert(tile: MergeTile, tile_pixels: "np.ndarray") -> "np.ndarray":
+            # Runs on the worker threads when prefetching
+            return pixel_format.convert(tile_pixels, tile.offset)
+
+        for (tile, tile_pixels) in iter_tile_pixels(ordered_tiles, prefetch_depth, stats, process=convert, empty=empty,
+                tile_stats=tile_stats):
+            tile_x, tile_y = tile.dimensions
+            offset_x, offset_y = tile.offset
+
+            if band_key != (offset_y, tile_y):
+                if band is not None:
+                    write_band()
+                band_key = (offset_y, tile_y)
+                band = band_buffer[:tile_y]
+                band.fill(0)
+                band_members = []
+            band_members.append(tile)
+
+            if tile_pixels is None:
+                continue
+
+            band[:, offset_x:offset_x + tile_x] = tile_pixels
+            if stats:
+                stats.add_tile(tile_pixels.nbytes)
+            print(f"Copied {tile_x * tile_y} pixels OK.")
+
+        if band is not None:
+            write_band()
+
+
+def merge_tiles_tiled(tiles: List[MergeTile], filepath: str, compression: int, prefetch_depth: int = 0,
+        stats: MergeStats = None, pixel_format: PixelFormat = PixelFormat(), checkpoint: MergeCheckpoint = None,
+        empty: Set[str] = None, tile_stats: MergeTileStats = None) -> None:
+    """
+    Write a tiled EXR at `filepath` in `pixel_format` whose file tiles are the render tiles, so each tile is decoded, re-encoded
+    and written on its own. With prefetching, tiles are decoded and encoded in parallel on the worker threads
+    and memory stays at one tile per thread; the full image is never assembled.
+    With a `checkpoint`, each completed band of tiles is checkpointed, and an interrupted merge skips the tiles it wrote.
+    Tiles in `empty` aren't read; they are written as an all-zero chunk encoded once.
+    """
+    res_x, res_y = get_merge_resolution(tiles)
+    max_tile_x = max(tile.dimensions[0] for tile in tiles)
+    max_tile_y = max(tile.dimensions[1] for tile in tiles)
+
+    print(f'Writing {max_tile_x}x{max_tile_y} tiled EXR "{filepath}" ...')
+
+    pixel_type = PIXEL_HALF if pixel_format.half else PIXEL_FLOAT
+
+    resume_state = None
+    if checkpoint is not None:
+        if checkpoint.resuming:
+            resume_state = checkpoint.writer_state
+        tiles = [tile for tile in tiles if not checkpoint.is_done(tile.filepath)]
+
+    with ExrTiledWriter(filepath, res_x, res_y, (max_tile_x, max_tile_y), pixel_format.channel_names, pixel_type, compression,
+            resume_state) as writer:
+        checkpointer = BandCheckpointer(checkpoint, tiles, writer.checkpoint_state) if checkpoint else None
+
+        def get_tile_position(tile: MergeTile) -> Tuple[int, int]:
+            tile_x, tile_y = tile.dimensions
+            offset_x, offset_y = tile.offset
+
+            # EXR tiles are counted from the top left
+            tile_col = offset_x // max_tile_x
+            tile_row = (res_y - offset_y - tile_y) // max_tile_y
+            if (tile_col * max_tile_x, tile_row * max_tile_y) != (offset_x, res_y - offset_y - tile_y) \
+                    or writer.expected_tile_shape(tile_col, tile_row) != (tile_y, tile_x):
+                raise RuntimeError(f"Image tile {tile.filepath} doesn't line up with the {max_tile_x}x{max_tile_y} EXR tile grid.")
+            return (tile_col, tile_row)
+
+        def encode(tile: MergeTile, tile_pixels: "np.ndarray") -> Tuple[int, int, bytes]:
+            tile_col, tile_row = get_tile_position(tile)
+            # Image data runs bottom-to-top, EXR rows run top-to-bottom
+            return (tile_col, tile_row, writer.encode_tile(tile_col, tile_row, pixel_format.convert(tile_pixels[::-1], tile.offset)))
+
+        for (tile, encoded) in iter_tile_pixels(tiles, prefetch_depth, stats, process=encode, empty=empty, tile_stats=tile_stats):
+            if encoded is None:
+                tile_col, tile_row = get_tile_position(tile)
+                encoded = (tile_col, tile_row, writer.encode_empty_tile(tile_col, tile_row))
+            elif stats:
+                stats.add_tile(tile.dimensions[0] * tile.dimensions[1] * 4 * 4)
+
+            tile_col, tile_row, chunk = encoded
+            writer.write_tile(tile_col, tile_row, chunk)
+            print(f"Wrote tile {tile_col},{tile_row} ({len(chunk)} bytes).")
+            if checkpointer:
+                checkpointer.tile_written(tile)
+
+
+def get_exr_passes(channel_names: List[str]) -> List[Tuple[str, List[str]]]:
+    """Group multilayer EXR channels (`<view layer>.<pass>.<channel>`) into `(pass, channel_names)`, in file order."""
+    passes: Dict[str, List[str]] = {}
+    for name in channel_names:
+        passes.setdefault(name.rpartition('.')[0], []).append(name)
+    return list(passes.items())
+
+
+def merge_exr_metadata(headers: List[ExrHeader]) -> Dict[str, bytes]:
+    """
+    String attributes for the merged image, taken from the first tile. Cryptomatte manifests are
+    combined from all tiles, in case a tile only lists the objects it saw.
+    """
+    metadata = dict(headers[0].metadata)
+    for key in metadata:
+        if key.startswith('cryptomatte/') and key.endswith('/manifest'):
+            manifest = {}
+            for header in headers:
+                try:
+                    manifest.update(json.loads(header.metadata.get(key, b'{}').decode('utf-8')))
+                except ValueError:
+                    print(f"Ignoring unreadable Cryptomatte manifest {key}.")
+            metadata[key] = json.dumps(manifest, sort_keys=True).encode('utf-8')
+    return metadata
+
+
+def merge_tiles_multilayer(tiles: List[MergeTile], filepath: str, compression: int, prefetch_depth: int = 0,
+        stats: MergeStats = None, headers: List[ExrHeader] = None) -> None:
+    """
+    Merge multilayer EXR tiles into a multilayer EXR at `filepath`, one render pass at a time.
+    Each pass is composited onto its own memory-mapped scratch canvas, which is flushed and released
+    before the next pass starts, so memory grows with the largest pass rather than the number of passes.
+    The passes are then interleaved into the output a block of rows at a time.
+    `headers` are the tiles' preflighted EXR headers; they are read here if not given.
+    """
+    res_x, res_y = get_merge_resolution(tiles)
+
+    # The headers are enough to plan the passes
+    if headers is None:
+        headers = preflight_tiles(tiles, [bpy.path.abspath(tile.filepath) for tile in tiles], same_channels=True)
+
+    pixel_types = {channel.name: channel.pixel_type for channel in headers[0].channels}
+    passes = get_exr_passes(headers[0].channel_names)
+    print(f"Merging {len(passes)} passes: {', '.join(pass_name or '(unnamed)' for (pass_name, _) in passes)}")
+
+    pass_canvases = []
+    try:
+        for (pass_index, (pass_name, channel_names)) in enumerate(passes):
+            pass_types = {pixel_types[name] for name in channel_names}
+            dtype = PIXEL_DTYPES[pass_types.pop()] if len(pass_types) == 1 else np.dtype(np.float32)
+            shape = (res_y, res_x, len(channel_names))
+            canvas_filepath = os.path.realpath(bpy.path.abspath(get_merge_scratch_filepath(f"merge_pass_{pass_index}")))
+            pass_canvases.append((canvas_filepath, dtype, shape))
+
+            print(f"\nMerging pass {pass_name or '(unnamed)'} ({', '.join(channel_names)})...")
+            canvas = allocate_canvas(shape, dtype, canvas_filepath)
+
+            for (tile, tile_pixels) in iter_tile_pixels(tiles, prefetch_depth, stats, channel_names=channel_names):
+                tile_x, tile_y = tile.dimensions
+                offset_x, offset_y = tile.offset
+
+                canvas[offset_y:offset_y + tile_y, offset_x:offset_x + tile_x] = tile_pixels
+                if stats:
+                    stats.add_tile(tile_pixels.nbytes)
+
+            canvas.flush()
+            del canvas
+            gc.collect()
+
+        output_names = [name for (_, channel_names) in passes for name in channel_names]
+        print(f'\nWriting multilayer EXR "{filepath}" ...')
+
+        canvases = [np.memmap(path, dtype=dtype, mode='r', shape=shape) for (path, dtype, shape) in pass_canvases]
+        with ExrScanlineWriter(filepath, res_x, res_y, output_names, [pixel_types[name] for name in output_names],
+                compression, merge_exr_metadata(headers)) as writer:
+            # Image data runs bottom-to-top, EXR rows run top-to-bottom
+            for end in range(res_y, 0, -256):
+                start = max(end - 256, 0)
+                writer.write_rows(np.concatenate([canvas[start:end] for canvas in canvases], axis=2)[::-1])
+        del canvases
+
+    finally:
+        gc.collect()
+        for (path, _, _) in pass_canvases:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class IncrementalMerge:
+    """
+    Composites tiles into the output canvas as soon as each one has been rendered and written,
+    so the final image is ready shortly after the last tile instead of after a separate merge pass.
+
+    Tiles are decoded and placed on a background thread while the next tile renders.
+    Tiles that weren't rendered in this session (e.g. when starting from a later tile) are
+    loaded from disk by `finish()`. With `skip_empty_tiles`, the stats of each decoded tile are recorded
+    for later merges, and missing tiles known to be empty aren't loaded.
+    """
+
+    def __init__(self, tiles: List[MergeTile], canvas_filepath: str = None, pixel_format: PixelFormat = None,
+            skip_empty_tiles: bool = False):
+        if np is None:
+            raise RuntimeError("Merging while rendering requires NumPy.")
+
+        self.tiles = {tile.filepath: tile for tile in tiles}
+        self.resolution = get_merge_resolution(tiles)
+        self.canvas_filepath = canvas_filepath
+        self.pixel_format = pixel_format or PixelFormat()
+        self.skip_empty_tiles = skip_empty_tiles
+        self.stats = MergeStats("numpy, incremental")
+        self.merged = set()
+        self.futures = []
+
+        res_x, res_y = self.resolution
+        self.canvas = allocate_canvas((res_y, res_x, self.pixel_format.channel_count), self.pixel_format.dtype, canvas_filepath)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def add_tile(self, filepath: str) -> None:
+        """Queue a freshly written tile for compositing. Safe to call from render handlers."""
+        tile = self.tiles.get(filepath)
+        if tile is None or filepath in self.merged:
+            return
+
+        self.merged.add(filepath)
+        self.futures.append((tile, self.executor.submit(self._place_tile, tile, bpy.path.abspath(filepath))))
+
+    def _place_tile(self, tile: MergeTile, filepath: str) -> None:
+        tile_pixels = decode_tile(tile, filepath)
+        if self.skip_empty_tiles:
+            try:
+                write_tile_stats(filepath, tile_pixels)
+            except OSError as e:
+                print(f"Can't record stats of tile {tile.filepath}: {e}")
+        self._copy_tile(tile, tile_pixels)
+
+    def _copy_tile(self, tile: MergeTile, tile_pixels: "np.ndarray") -> None:
+        tile_x, tile_y = tile.dimensions
+        offset_x, offset_y = tile.offset
+
+        self.canvas[offset_y:offset_y + tile_y, offset_x:offset_x + tile_x] = self.pixel_format.convert(tile_pixels, tile.offset)
+        self.stats.add_tile(tile_pixels.nbytes)
+        print(f"Merged tile {tile.filepath} ({tile_x * tile_y} pixels).")
+
+    def finish(self, context: Context) -> MergeStats:
+        """Wait for the queued tiles, load any missing ones and save the final image."""
+        try:
+            self.executor.shutdown(wait=True)
+
+            missing = [tile for tile in self.tiles.values() if tile.filepath not in self.merged]
+            for (tile, future) in self.futures:
+                try:
+                    future.result()
+                except ExrError as e:
+                    print(f"Can't decode {tile.filepath} on a worker thread ({e}), loading it through Blender...")
+                    missing.append(tile)
+
+            if missing:
+                print(f"Loading {len(missing)} tiles that weren't rendered in this session...")
+                # The canvas is new, so empty tiles are already in place unless quantising changes their zeros
+                empty = find_empty_tiles(missing) if self.skip_empty_tiles and not self.pixel_format.view_transform else None
+                for (tile, tile_pixels) in iter_tile_pixels(missing, stats=self.stats, empty=empty):
+                    if tile_pixels is not None:
+                        self._copy_tile(tile, tile_pixels)
+
+            band_outputs = create_band_outputs(context, self.resolution, pixel_format=self.pixel_format)
+            if band_outputs:
+                BandFeed(list(self.tiles.values()), band_outputs).flush(self.canvas)
+                for output in band_outputs:
+                    output.close()
+
+            free_previous_merge_image()
+            save_merged_outputs(context, self.canvas, self.resolution, self.pixel_format)
+
+            settings: SRR_Settings = context.scene.srr_settings
+            if settings.use_merge_cache:
+                final_image_filepath = get_merged_image_filepath(context.scene.render.image_settings.file_format)
+                update_merge_manifest(context, list(self.tiles.values()), final_image_filepath)
+
+        finally:
+            self.cancel()
+
+        self.stats.finish()
+        print(self.stats.report())
+
+        return self.stats
+
+    def cancel(self) -> None:
+        """Stop merging and release the canvas."""
+        self.executor.shutdown(wait=True)
+        self.futures.clear()
+        self.canvas = None
+        gc.collect()
+
+        if self.canvas_filepath and os.path.exists(self.canvas_filepath):
+            os.remove(self.canvas_filepath)
+
+
+def merge_tiles_array(tiles: List[MergeTile], stats: MergeStats = None) -> array:
+    """Composite the tiles into a flat `array('f')`, copying row by row. Slow, but needs nothing beyond the standard library."""
+    res_x, res_y = get_merge_resolution(tiles)
+
+    print(f"Allocating storage for {res_x * res_y * 4} floats ({res_x * res_y} output pixels)...")
+    final_image_pixels = array('f', [0.0, 0.0, 0.0, 0.0] * res_x * res_y)
+    bytes_allocated = final_image_pixels.buffer_info()[1] * final_image_pixels.itemsize
+    print(f"Allocated {bytes_allocated / 1024 / 1024:,.2f} MBytes of memory.\n")
+
+    for tile in tiles:
+        tile_x, tile_y = tile.dimensions
+        offset_x, offset_y = tile.offset
+
+        tile_image = load_tile_image(tile)
+        try:
+            # Copy the pixels
+            tile_pixels = list(tile_image.pixels)
+
+            for y in range(tile_y):
+                # Copy a row
+                source_pixel_start = y * tile_x * 4
+                source_pixel_end = source_pixel_start + (tile_x * 4)
+
+                target_y = offset_y + y
+                target_pixel_start = (target_y * res_x + offset_x) * 4
+                target_pixel_end = target_pixel_start + (tile_x * 4)
+
+                final_image_pixels[target_pixel_start:target_pixel_end] = array('f', tile_pixels[source_pixel_start:source_pixel_end])
+
+            if stats:
+                stats.add_tile(tile_x * tile_y * 4 * final_image_pixels.itemsize)
+            del tile_pixels
+            print(f"Copied {tile_x * tile_y} pixels OK.")
+
+        finally:
+            free_tile_image(tile_image)
+            del tile_image
+
+    return final_image_pixels
+
+
+def iter_canvas_rows(canvas: "np.ndarray", chunk_rows: int = 256) -> Iterator["np.ndarray"]:
+    """Yield the canvas a chunk of rows at a time, top-to-bottom, as image files store them."""
+    res_y = canvas.shape[0]
+    # Image data runs bottom-to-top
+    for end in range(res_y, 0, -chunk_rows):
+        yield canvas[max(end - chunk_rows, 0):end][::-1]
+
+
+def write_canvas_exr(filepath: str, canvas: "np.ndarray", pixel_format: PixelFormat, compression: int) -> None:
+    """Write a NumPy canvas straight to a scanline EXR in its own pixel format, without converting the whole image."""
+    res_y, res_x = canvas.shape[:2]
+    pixel_type = PIXEL_HALF if pixel_format.half else PIXEL_FLOAT
+
+    with ExrScanlineWriter(filepath, res_x, res_y, pixel_format.channel_names, pixel_type, compression) as writer:
+        for rows in iter_canvas_rows(canvas):
+            writer.write_rows(rows)
+
+
+def encode_canvas(file_format: str, filepath: str, canvas: "np.ndarray", pixel_format: PixelFormat, compress_level: int = 6) -> None:
+    """
+    Encode a read-only canvas into `filepath` a chunk of rows at a time, without touching bpy, so it can
+    run on a worker thread. zlib releases the GIL while compressing, so several encodes run in parallel.
+    EXR and TIFF keep the merged samples; PNG gets 8 bit sRGB from float canvases, like a viewer would show it,
+    and the samples as they are from display-quantised ones. A `compress_level` of 0 writes uncompressed EXR and TIFF.
+    """
+    res_y, res_x, channel_count = canvas.shape
+
+    if file_format == 'OPEN_EXR':
+        write_canvas_exr(filepath, canvas, pixel_format, COMPRESSION_ZIP if compress_level else COMPRESSION_NONE)
+    elif file_format == 'PNG' and pixel_format.view_transform:
+        with PngWriter(filepath, res_x, res_y, channel_count, canvas.dtype, compress_level) as writer:
+            for rows in iter_canvas_rows(canvas):
+                writer.write_rows(rows)
+    elif file_format == 'PNG':
+        with PngWriter(filepath, res_x, res_y, channel_count, compress_level=compress_level) as writer:
+            for rows in iter_canvas_rows(canvas):
+                writer.write_rows(to_display_rgba8(rows))
+    elif file_format == 'TIFF':
+        with TiffStripWriter(filepath, res_x, res_y, channel_count, canvas.dtype, rows_per_strip=64, compress=compress_level > 0) as writer:
+            for rows in iter_canvas_rows(canvas):
+                writer.write_rows(rows)
+    else:
+        raise ValueError(f"No encoder for {file_format}")
+
+
+def get_compress_level(image_settings, file_format: str) -> int:
+    """zlib level for writing the scene's output in `file_format` with our own encoders, following its compression settings."""
+    if file_format == 'OPEN_EXR':
+        return 0 if image_settings.exr_codec == 'NONE' else 6
+    if file_format == 'TIFF':
+        return 0 if image_settings.tiff_codec == 'NONE' else 6
+    if file_format == 'PNG':
+        # Blender's PNG compression is a percentage of zlib's highest level
+        return round(image_settings.compression * 9 / 100)
+    return 6
+
+
+def get_extra_output_formats(context: Context, pixel_format: PixelFormat) -> List[str]:
+    """The extra output formats to save besides the scene's output format."""
+    settings: SRR_Settings = context.scene.srr_settings
+    primary_format = context.scene.render.image_settings.file_format
+
+    extra_formats = [file_format for file_format in sorted(settings.extra_outputs) if file_format != primary_format]
+    if pixel_format.view_transform and 'OPEN_EXR' in extra_formats:
+        print("The merged image holds display values rather than linear floats, skipping the extra EXR output.")
+        extra_formats.remove('OPEN_EXR')
+    return extra_formats
+
+
+def save_merged_outputs(context: Context, canvas: "np.ndarray", resolution: Tuple[int, int], pixel_format: PixelFormat,
+        frame: int = None, region: MergeRegion = None) -> None:
+    """
+    Save the scene's output and every extra output format from the same canvas. Formats with their own encoder
+    are written on worker threads while the outputs that need Blender (e.g. JPEG) are saved on the main thread.
+    """
+    extra_formats = get_extra_output_formats(context, pixel_format)
+    threaded_formats = [file_format for file_format in extra_formats if file_format in THREADED_OUTPUT_FORMATS]
+    blender_formats = [file_format for file_format in extra_formats if file_format not in THREADED_OUTPUT_FORMATS]
+
+    with ThreadPoolExecutor(max_workers=max(len(threaded_formats), 1)) as executor:
+        encodes = []
+        for file_format in threaded_formats:
+            # Resolve the path here, bpy must not be touched from the worker threads
+            filepath = get_merged_image_filepath(file_format, frame, region)
+            print(f'Encoding {file_format} output "{filepath}" on a worker thread...')
+            encodes.append((file_format, executor.submit(encode_canvas, file_format, filepath, canvas, pixel_format)))
+
+        save_merged_image(context, canvas, resolution, pixel_format, frame=frame, region=region)
+        for file_format in blender_formats:
+            save_merged_image(context, canvas, resolution, pixel_format, file_format, frame, region)
+
+        for (file_format, future) in encodes:
+            future.result()
+            print(f"Encoded {file_format} output OK.")
+
+
+def can_encode_without_blender(context: Context, pixel_format: PixelFormat) -> bool:
+    """Whether our own encoders can write the scene's output and every extra output, so no output needs bpy."""
+    settings: SRR_Settings = context.scene.srr_settings
+    image_settings = context.scene.render.image_settings
+
+    if pixel_format.view_transform:
+        # Display-quantised PNG and TIFF are written as they are
+        if image_settings.file_format not in THREADED_OUTPUT_FORMATS:
+            return False
+    elif image_settings.file_format != 'OPEN_EXR' or image_settings.exr_codec not in DIRECT_EXR_CODECS:
+        return False
+    return all(file_format in THREADED_OUTPUT_FORMATS for file_format in settings.extra_outputs)
+
+
+class DeferredEncode:
+    """
+    The outputs `save_merged_outputs()` would write for a merged canvas, resolved from the scene up front
+    so `run()` can write them later on another thread. Only for outputs `can_encode_without_blender()`.
+    """
+
+    def __init__(self, context: Context, canvas: "np.ndarray", pixel_format: PixelFormat, frame: int = None, region: MergeRegion = None):
+        image_settings = context.scene.render.image_settings
+        primary_format = image_settings.file_format
+
+        self.canvas = canvas
+        self.pixel_format = pixel_format
+        # (file format, filepath, zlib level), the scene's output first
+        self.outputs = [(primary_format, get_merged_image_filepath(primary_format, frame, region),
+            get_compress_level(image_settings, primary_format))]
+        self.outputs += [(file_format, get_merged_image_filepath(file_format, frame, region), 6)
+            for file_format in get_extra_output_formats(context, pixel_format)]
+
+    def run(self) -> None:
+        try:
+            for (file_format, filepath, compress_level) in self.outputs:
+                print(f'Encoding {file_format} output "{filepath}" ...')
+                encode_canvas(file_format, filepath, self.canvas, self.pixel_format, compress_level)
+        finally:
+            # Release the canvas, so a memory-mapped one can be removed
+            self.canvas = None
+            gc.collect()
+
+
+class FrameEncodeQueue:
+    """
+    Writes the outputs of merged frames on a background thread while the next frame's tiles are decoded
+    and placed, so decoding and encoding overlap across a sequence instead of taking turns.
+    At most one frame is encoding at a time, so at most two canvases are alive at once.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+
+    def submit(self, frame: int, job: Callable[[], None]) -> None:
+        """Queue `job` for `frame`, once the previous frame is written."""
+        self.wait()
+        print(f"Encoding frame {frame} in the background.")
+        self.pending = (frame, self.executor.submit(job))
+
+    def wait(self) -> None:
+        """Wait for the frame being encoded, raising its error if it failed."""
+        if self.pending is None:
+            return
+
+        frame, future = self.pending
+        self.pending = None
+        future.result()
+        print(f"Encoded frame {frame} OK.")
+
+    def close(self) -> None:
+        try:
+            self.wait()
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+def do_merge_frames(context: Context, frames: List[int]) -> List[MergeStats]:
+    """
+    Merge the tiles of each of `frames`. Each frame's output is encoded while the next frame's tiles are
+    decoded, where the output can be written without Blender; otherwise frames are merged one after another.
+    """
+    encode_queue = FrameEncodeQueue()
+    frame_stats = []
+
+    try:
+        for frame in frames:
+            print(f"\nMerging frame {frame}...")
+            frame_stats.append(do_merge_tiles(context, generate_tiles_for_merge(context, frame), frame, encode_queue))
+    finally:
+        encode_queue.close()
+
+    return frame_stats
+
+
+def save_merged_image(context: Context, final_image_pixels, resolution: Tuple[int, int], pixel_format: PixelFormat = None,
+        file_format: str = None, frame: int = None, region: MergeRegion = None) -> None:
+    """
+    Save the composited pixels (a flat `array('f')` or a NumPy canvas in `pixel_format`) in `file_format`,
+    or the scene's output format if not given.
+    EXR output from a NumPy canvas in a reduced format is written directly, as are PNG and TIFF from a display-quantised
+    canvas; everything else is saved through Blender.
+    """
+    render = context.scene.render
+    image_settings = render.image_settings
+    res_x, res_y = resolution
+
+    file_format = file_format or image_settings.file_format
+    final_image_filepath = get_merged_image_filepath(file_format, frame, region)
+
+    # Already converted for display, so saved as it is rather than through the scene's view transform
+    if np is not None and isinstance(final_image_pixels, np.ndarray) and pixel_format and pixel_format.view_transform:
+        if file_format in THREADED_OUTPUT_FORMATS:
+            print(f'Composited output OK. Writing {pixel_format.depth} bit {file_format} "{final_image_filepath}" ...')
+            encode_canvas(file_format, final_image_filepath, final_image_pixels, pixel_format, get_compress_level(image_settings, file_format))
+        else:
+            save_display_image(final_image_pixels, final_image_filepath, file_format)
+        return
+
+    if np is not None and isinstance(final_image_pixels, np.ndarray):
+        # Saving through Blender needs a float RGBA copy of the whole image, which a memory-mapped canvas is meant to avoid
+        needs_direct_write = (pixel_format and pixel_format != PixelFormat()) or isinstance(final_image_pixels, np.memmap)
+        if file_format == 'OPEN_EXR' and needs_direct_write and image_settings.exr_codec in DIRECT_EXR_CODECS:
+            pixel_format = pixel_format or PixelFormat()
+            print(f'Composited output OK. Writing {pixel_format.channels} {"half" if pixel_format.half else "float"} EXR "{final_image_filepath}" ...')
+            compression = COMPRESSION_NONE if image_settings.exr_codec == 'NONE' else COMPRESSION_ZIP
+            write_canvas_exr(final_image_filepath, final_image_pixels, pixel_format, compression)
+            return
+
+        # Blender images are always float RGBA
+        final_image_pixels = as_rgba_float32(final_image_pixels).reshape(-1)
 
     if not len(final_image_pixels) == res_x * res_y * 4:
         raise RuntimeError(f"Got {len(final_image_pixels)} pixels; expected {res_x * res_y * 4}.")
 
-    final_image_ext = get_file_ext(render.image_settings.file_format)
-    final_image_filepath = "//super_res_render_output" # TODO: allow customisation of output path - GitHub issue #1
-    final_image_filepath = bpy.path.ensure_ext(final_image_filepath, final_image_ext)
-    final_image_filepath = os.path.realpath(bpy.path.abspath(final_image_filepath))
-
     print(f'Composited output OK. Saving to "{final_image_filepath}" ...')
 
-    final_image = bpy.data.images.new(final_image_name, alpha=True, float_buffer=True, width=res_x, height=res_y)
+    final_image = bpy.data.images.new(FINAL_IMAGE_NAME, alpha=True, float_buffer=True, width=res_x, height=res_y)
     final_image.alpha_mode = 'STRAIGHT'
     final_image.colorspace_settings.name = 'Linear'
     final_image.generated_type = 'BLANK'
     final_image.filepath_raw = final_image_filepath
-    final_image.file_format = render.image_settings.file_format
+    final_image.file_format = file_format
 
     if bpy.app.version < (2, 83):
         # Poor users that haven't upgraded to 2.83, I hope you have more than 26 gigs of RAM...
@@ -174,10 +1664,52 @@ def do_merge_tiles(context: Context, tiles: List[MergeTile]) -> None:
         # This is so. much. better.!
         final_image.pixels.foreach_set(final_image_pixels)
 
-    final_image.save_render(final_image_filepath)
+    # save_render() takes the file format, colour mode and depth from the scene, so apply ours there while saving
+    old_file_format = image_settings.file_format
+    old_color_mode = image_settings.color_mode
+    old_color_depth = image_settings.color_depth
+    try:
+        # Blender adjusts the colour mode and depth to ones the new format supports
+        image_settings.file_format = file_format
+        if pixel_format and pixel_format.channels != 'RGBA':
+            image_settings.color_mode = pixel_format.channels
+        if pixel_format and pixel_format.half and file_format == 'OPEN_EXR':
+            image_settings.color_depth = '16'
+    except TypeError as e:
+        print(f"Output format doesn't support the merge format ({e}), saving with the scene's settings.")
+
+    try:
+        final_image.save_render(final_image_filepath)
+    finally:
+        image_settings.file_format = old_file_format
+        image_settings.color_mode = old_color_mode
+        image_settings.color_depth = old_color_depth
 
-    del final_image_pixels
     final_image.buffers_free()
     bpy.data.images.remove(final_image)
     final_image = None
     gc.collect()
+
+
+def save_display_image(canvas: "np.ndarray", filepath: str, file_format: str) -> None:
+    """
+    Save a display-quantised canvas through Blender, for formats without our own encoder (e.g. JPEG).
+    Byte images store the given 0-1 values without colour management, so the scene's view transform isn't applied again.
+    """
+    res_y, res_x = canvas.shape[:2]
+    print(f'Composited output OK. Saving display values to "{filepath}" ...')
+
+    pixels = as_rgba_float32(canvas * np.float32(1 / np.iinfo(canvas.dtype).max))
+
+    image = bpy.data.images.new(FINAL_IMAGE_NAME, alpha=True, float_buffer=False, width=res_x, height=res_y)
+    try:
+        image.filepath_raw = filepath
+        image.file_format = file_format
+        image.pixels.foreach_set(pixels.reshape(-1))
+        del pixels
+        image.save()
+    finally:
+        image.buffers_free()
+        bpy.data.images.remove(image)
+        image = None
+        gc.collect()
@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+from functools import lru_cache
+
+
+def get_peak_rss() -> int:
+    """
+    Peak resident set size of this (Blender) process in bytes, or 0 if it can't be determined.
+    """
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [
+                    ('cb', wintypes.DWORD),
+                    ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t),
+                    ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t),
+                    ('PeakPagefileUsage', ctypes.c_size_t),
+                ]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return counters.PeakWorkingSetSize
+        except Exception:
+            pass
+        return 0
+
+    try:
+        import resource
+    except ImportError:
+        return 0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+@lru_cache(maxsize=None)
+def get_total_memory() -> int:
+    """
+    Physical memory of this machine in bytes, or 0 if it can't be determined.
+    """
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [
+                    ('dwLength', ctypes.c_ulong),
+                    ('dwMemoryLoad', ctypes.c_ulong),
+                    ('ullTotalPhys', ctypes.c_ulonglong),
+                    ('ullAvailPhys', ctypes.c_ulonglong),
+                    ('ullTotalPageFile', ctypes.c_ulonglong),
+                    ('ullAvailPageFile', ctypes.c_ulonglong),
+                    ('ullTotalVirtual', ctypes.c_ulonglong),
+                    ('ullAvailVirtual', ctypes.c_ulonglong),
+                    ('ullAvailExtendedVirtual', ctypes.c_ulonglong),
+                ]
+
+            status = MEMORYSTATUSEX()
+            status.dwLength = ctypes.sizeof(status)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return status.ullTotalPhys
+        except Exception:
+            pass
+        return 0
+
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def format_bytes(nbytes: int) -> str:
+    for unit in ('bytes', 'KB', 'MB', 'GB'):
+        if abs(nbytes) < 1024:
+            return f"{nbytes:,.0f} {unit}" if unit == 'bytes' else f"{nbytes:,.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:,.1f} TB"
+
+
+class MergeStats:
+    """Collects timing and volume of a merge so the merge strategies can be compared."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.tiles = 0
+        self.tiles_skipped = 0
+        self.bytes_copied = 0
+        self.wait_time = 0.0
+        self.start_time = time.perf_counter()
+        self.end_time = None
+
+    def add_tile(self, nbytes: int) -> None:
+        self.tiles += 1
+        self.bytes_copied += nbytes
+
+    def add_skipped_tile(self) -> None:
+        """An empty tile that was neither decoded nor copied."""
+        self.tiles_skipped += 1
+
+    def add_wait(self, seconds: float) -> None:
+        """Time the merge spent blocked on reading and decoding tiles."""
+        self.wait_time += seconds
+
+    def finish(self) -> None:
+        self.end_time = time.perf_counter()
+
+    def report(self) -> str:
+        elapsed = (self.end_time or time.perf_counter()) - self.start_time
+        throughput = self.bytes_copied / elapsed if elapsed > 0 else 0
+        peak_rss = get_peak_rss()
+
+        lines = [
+            f"Merge ({self.label}): {self.tiles} tiles, {self.bytes_copied / 1024 / 1024:,.2f} MBytes in {elapsed:.2f}s",
+            f"Throughput: {throughput / 1024 / 1024:,.2f} MBytes/s ({self.tiles / elapsed if elapsed > 0 else 0:.2f} tiles/s)",
+            f"Waiting for tiles: {self.wait_time:.2f}s",
+            f"Empty tiles skipped: {self.tiles_skipped}",
+            f"Peak RSS: {peak_rss / 1024 / 1024:,.2f} MBytes" if peak_rss else "Peak RSS: unknown",
+        ]
+        return os.linesep.join(lines)
+
+
+class RenderGapStats:
+    """Collects the idle time between one tile finishing (and being written) and the next one starting to render."""
+
+    def __init__(self):
+        self.gaps = []
+        self.finished_at = None
+
+    def tile_finished(self) -> None:
+        self.finished_at = time.perf_counter()
+
+    def tile_started(self) -> None:
+        if self.finished_at is not None:
+            self.gaps.append(time.perf_counter() - self.finished_at)
+            self.finished_at = None
+
+    def report(self) -> str:
+        if not self.gaps:
+            return "Idle between tiles: none"
+        total = sum(self.gaps)
+        return (f"Idle between tiles: {total:.2f}s in total, {total / len(self.gaps) * 1000:.1f}ms on average, "
+            f"{max(self.gaps) * 1000:.1f}ms at most ({len(self.gaps)} gaps)")
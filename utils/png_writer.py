@@ -0,0 +1,81 @@
+import struct
+import zlib
+
+import numpy as np
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Channel count to PNG colour type: greyscale, greyscale + alpha, RGB, RGBA
+COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+
+class PngWriter:
+    """
+    Writes an 8 or 16 bit PNG one block of rows at a time, compressing as it goes,
+    so only the rows being written need to be in memory.
+    Rows are passed top-to-bottom as `(rows, width, channels)` uint8 or uint16 arrays.
+    """
+
+    def __init__(self, filepath: str, width: int, height: int, channels: int, dtype=np.uint8, compress_level: int = 6):
+        self.filepath = filepath
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.rows_written = 0
+
+        if self.dtype not in {np.dtype(np.uint8), np.dtype(np.uint16)}:
+            raise ValueError(f"Unsupported PNG sample type {self.dtype}")
+
+        self.compressor = zlib.compressobj(compress_level)
+        self.file = open(filepath, 'wb')
+        self.file.write(PNG_SIGNATURE)
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, self.dtype.itemsize * 8, COLOR_TYPES[channels], 0, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        if rows.shape[1:] != (self.width, self.channels):
+            raise ValueError(f"Expected rows of shape (n, {self.width}, {self.channels}); got {rows.shape}")
+
+        # Each scanline is prefixed with filter type 0 (none); samples are big-endian
+        samples = np.ascontiguousarray(rows, dtype=self.dtype.newbyteorder('>')).reshape(rows.shape[0], -1).view(np.uint8)
+        scanlines = np.zeros((rows.shape[0], 1 + samples.shape[1]), dtype=np.uint8)
+        scanlines[:, 1:] = samples
+
+        data = self.compressor.compress(scanlines.tobytes())
+        if data:
+            self._write_chunk(b'IDAT', data)
+        self.rows_written += rows.shape[0]
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+
+        self._write_chunk(b'IDAT', self.compressor.flush())
+        self._write_chunk(b'IEND', b'')
+        self.file.close()
+
+        if self.rows_written != self.height:
+            raise RuntimeError(f"Wrote {self.rows_written} rows to {self.filepath}; expected {self.height}.")
+
+    def _write_chunk(self, chunk_type: bytes, data: bytes) -> None:
+        self.file.write(struct.pack('>I', len(data)))
+        self.file.write(chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff))
+
+
+def write_png(filepath: str, pixels: np.ndarray, compress_level: int = 6) -> None:
+    """Write a whole `(height, width, channels)` uint8 or uint16 array, rows top-to-bottom, as a PNG."""
+    height, width, channels = pixels.shape
+    with PngWriter(filepath, width, height, channels, pixels.dtype, compress_level) as writer:
+        writer.write_rows(pixels)
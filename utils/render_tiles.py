@@ -1,7 +1,7 @@
 import bpy
-from bpy.types import Camera, Context, Object
+from bpy.types import Camera, Context, Object, Window
 from math import ceil
-from typing import List, NamedTuple, Union
+from typing import List, NamedTuple, Optional, Union
 
 from ..SRR_Settings import SRR_Settings
 from .saved_render_settings import SavedRenderSettings
@@ -35,20 +35,42 @@ TileSettings = Union[
     TileCameraSplitSettings,
 ]
 
+# EXR codecs the merge can decode itself
+MERGEABLE_EXR_CODECS = {'NONE', 'RLE', 'ZIPS', 'ZIP'}
+
+
 class RenderTile(NamedTuple):
     render_method: str # Python 3.8+: Literal['camshift', 'border', 'camsplit']
     tile_settings: TileSettings
     filepath: str
     file_format: str
+    frame: Optional[int] = None # None: the current frame, unnumbered
+
+
+def get_tile_frames(context: Context) -> List[Optional[int]]:
+    """Frames to render tiles for: each frame of the scene's frame range, or just the current one, unnumbered."""
+    scene = context.scene
+    settings: SRR_Settings = scene.srr_settings
+
+    if not settings.use_frame_range:
+        return [None]
+    return list(range(scene.frame_start, scene.frame_end + 1, scene.frame_step))
 
 
-def do_render_tile(context: Context, render_tile: RenderTile, camera_object: Object):
+def set_up_render_tile(context: Context, render_tile: RenderTile, camera_object: Object) -> None:
+    """Set the frame, output and camera or render border up for rendering `render_tile`."""
     scene = context.scene
     render = scene.render
 
+    if render_tile.frame is not None and scene.frame_current != render_tile.frame:
+        scene.frame_set(render_tile.frame)
+
     # Prepare render settings
     render.filepath = render_tile.filepath
     render.image_settings.file_format = render_tile.file_format
+    if render_tile.file_format == 'OPEN_EXR_MULTILAYER' and render.image_settings.exr_codec not in MERGEABLE_EXR_CODECS:
+        # Passes are merged without Blender, which can only read these codecs
+        render.image_settings.exr_codec = 'ZIP'
 
     if render_tile.render_method == 'camshift':
         camera_data: Camera = camera_object.data
@@ -73,12 +95,27 @@ def do_render_tile(context: Context, render_tile: RenderTile, camera_object: Obj
         render.border_max_x = settings.border_max_x
         render.border_max_y = settings.border_max_y
 
+
+def do_render_tile(context: Context, render_tile: RenderTile, camera_object: Object, window: Window = None) -> set:
+    """
+    Set up the scene for `render_tile` and start rendering it. Returns the render operator's result.
+    Pass the `window` to render in when calling from outside an operator, e.g. from a `bpy.app.timers` callback.
+    """
+    set_up_render_tile(context, render_tile, camera_object)
+
     # Render tile
     # print("Rendering tile %s ..." % filepath)
-    bpy.ops.render.render("INVOKE_DEFAULT", write_still = True)
+    if window is None:
+        return bpy.ops.render.render("INVOKE_DEFAULT", write_still = True)
 
+    if hasattr(context, "temp_override"):
+        # Blender 3.2+
+        with context.temp_override(window=window, screen=window.screen):
+            return bpy.ops.render.render("INVOKE_DEFAULT", write_still = True)
+    return bpy.ops.render.render({'window': window, 'screen': window.screen}, "INVOKE_DEFAULT", write_still = True)
 
-def generate_tiles(context: Context, saved_settings: SavedRenderSettings) -> List[RenderTile]:
+
+def generate_tiles(context: Context, saved_settings: SavedRenderSettings, frame: int = None) -> List[RenderTile]:
     scene = context.scene
 
     render = scene.render
@@ -209,14 +246,20 @@ def generate_tiles(context: Context, saved_settings: SavedRenderSettings) -> Lis
                 raise f"Unhandled render method {settings.render_method}"
 
             # Render
-            filepath = get_tile_filepath(tile_suffix)
+            filepath = get_tile_filepath(tile_suffix, frame)
             tile = RenderTile(
                 render_method = settings.render_method,
                 tile_settings = tile_settings,
                 filepath = filepath,
-                file_format = 'OPEN_EXR',
+                file_format = 'OPEN_EXR_MULTILAYER' if settings.use_multilayer else 'OPEN_EXR',
+                frame = frame,
             )
 
             tiles.append(tile)
 
     return tiles
+
+
+def get_render_tiles(context: Context, saved_settings: SavedRenderSettings) -> List[RenderTile]:
+    """The tiles of every frame rendered, in render order. Render workers are handed tiles by their index in this list."""
+    return [tile for frame in get_tile_frames(context) for tile in generate_tiles(context, saved_settings, frame)]
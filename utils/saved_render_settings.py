@@ -4,8 +4,10 @@ from typing import NamedTuple
 
 
 class SavedRenderSettings(NamedTuple):
+    old_frame_current: int
     old_file_path: str
     old_file_format: str
+    old_exr_codec: str
     old_resolution_percentage: int
     old_res_x: int
     old_res_y: int
@@ -29,8 +31,10 @@ def save_render_settings(context: Context, camera_object: Object) -> SavedRender
     camera_data: Camera = camera_object.data
 
     return SavedRenderSettings(
+        old_frame_current = scene.frame_current,
         old_file_path = render.filepath,
         old_file_format = render.image_settings.file_format,
+        old_exr_codec = render.image_settings.exr_codec,
         old_resolution_percentage = render.resolution_percentage,
         old_res_x = render.resolution_x,
         old_res_y = render.resolution_y,
@@ -54,8 +58,13 @@ def restore_render_settings(context: Context, settings: SavedRenderSettings, cam
     render: RenderSettings = scene.render
     camera_data: Camera = camera_object.data
 
+    # Set the frame first, so animated properties don't override the ones restored below
+    if scene.frame_current != settings.old_frame_current:
+        scene.frame_set(settings.old_frame_current)
+
     render.filepath = settings.old_file_path
     render.image_settings.file_format = settings.old_file_format
+    render.image_settings.exr_codec = settings.old_exr_codec
     render.resolution_percentage = settings.old_resolution_percentage 
     render.resolution_x = settings.old_res_x
     render.resolution_y = settings.old_res_y
@@ -0,0 +1,233 @@
+import os
+import struct
+import zlib
+from typing import List
+
+import numpy as np
+
+
+# TIFF tags
+TAG_IMAGE_WIDTH = 256
+TAG_IMAGE_LENGTH = 257
+TAG_BITS_PER_SAMPLE = 258
+TAG_COMPRESSION = 259
+TAG_PHOTOMETRIC = 262
+TAG_STRIP_OFFSETS = 273
+TAG_SAMPLES_PER_PIXEL = 277
+TAG_ROWS_PER_STRIP = 278
+TAG_STRIP_BYTE_COUNTS = 279
+TAG_PLANAR_CONFIG = 284
+TAG_EXTRA_SAMPLES = 338
+TAG_SAMPLE_FORMAT = 339
+
+# TIFF field types: (struct code, size in bytes)
+TYPE_SHORT = 3
+TYPE_LONG = 4
+TYPE_LONG8 = 16
+TYPE_FORMATS = {
+    TYPE_SHORT: ('H', 2),
+    TYPE_LONG: ('I', 4),
+    TYPE_LONG8: ('Q', 8),
+}
+
+COMPRESSION_NONE = 1
+COMPRESSION_DEFLATE = 8
+
+SAMPLE_FORMAT_UINT = 1
+SAMPLE_FORMAT_FLOAT = 3
+
+# Leave headroom for the IFD and for deflate expanding incompressible data
+CLASSIC_TIFF_LIMIT = 2 ** 32 - 2 ** 26
+
+
+class TiffStripWriter:
+    """
+    Writes a TIFF one horizontal strip at a time, so only the rows being written need to be in memory.
+
+    Rows are passed top-to-bottom as `(rows, width, channels)` arrays via `write_rows()`; they are buffered
+    into strips of `rows_per_strip`. The IFD is written by `close()` once all strip offsets are known.
+    BigTIFF is used automatically when the uncompressed image could exceed 4 GB.
+
+    A partly written file can be continued by passing the `checkpoint_state()` taken after its last durable strip
+    as `resume_state`, with the same image parameters.
+    """
+
+    def __init__(self, filepath: str, width: int, height: int, channels: int, dtype,
+            rows_per_strip: int, compress: bool = True, bigtiff: bool = None, resume_state: dict = None):
+        self.filepath = filepath
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.rows_per_strip = min(rows_per_strip, height)
+        self.compress = compress
+
+        if self.dtype.kind not in {'f', 'u'}:
+            raise ValueError(f"Unsupported TIFF sample type {self.dtype}")
+
+        if bigtiff is None:
+            bigtiff = width * height * channels * self.dtype.itemsize > CLASSIC_TIFF_LIMIT
+        self.bigtiff = bigtiff
+
+        self.strip_offsets: List[int] = []
+        self.strip_byte_counts: List[int] = []
+        self.rows_written = 0
+        self._pending: List[np.ndarray] = []
+        self._pending_rows = 0
+
+        if resume_state:
+            # Drop anything written after the checkpoint
+            self.file = open(filepath, 'r+b')
+            self.file.truncate(resume_state['end'])
+            self.file.seek(0, os.SEEK_END)
+            self.strip_offsets = list(resume_state['strip_offsets'])
+            self.strip_byte_counts = list(resume_state['strip_byte_counts'])
+            self.rows_written = resume_state['rows_written']
+            return
+
+        self.file = open(filepath, 'wb')
+        if self.bigtiff:
+            # Byte order, version 43, offset size 8, reserved, first IFD offset (patched on close)
+            self.file.write(struct.pack('<2sHHHQ', b'II', 43, 8, 0, 0))
+        else:
+            self.file.write(struct.pack('<2sHI', b'II', 42, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        """Append `rows` (top-to-bottom) to the image."""
+        if rows.shape[1:] != (self.width, self.channels):
+            raise ValueError(f"Expected rows of shape (n, {self.width}, {self.channels}); got {rows.shape}")
+
+        self._pending.append(rows)
+        self._pending_rows += rows.shape[0]
+
+        while self._pending_rows >= self.rows_per_strip:
+            self._flush_strip(self.rows_per_strip)
+
+        # Callers may reuse their band buffer, so keep our own copy of any leftover rows
+        self._pending = [np.array(chunk) for chunk in self._pending]
+
+    def checkpoint_state(self) -> dict:
+        """
+        Make everything written so far durable and return the state needed to resume writing after it.
+        Only possible between strips, when no rows are waiting to fill one, or once every row has been written.
+        """
+        if self._pending_rows and self.rows_written + self._pending_rows == self.height:
+            # The last strip is allowed to be short
+            self._flush_strip(self._pending_rows)
+        if self._pending_rows:
+            raise RuntimeError(f"Can't checkpoint {self.filepath} part way through a strip.")
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {
+            'end': self.file.tell(),
+            'strip_offsets': list(self.strip_offsets),
+            'strip_byte_counts': list(self.strip_byte_counts),
+            'rows_written': self.rows_written,
+        }
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+
+        if self._pending_rows:
+            self._flush_strip(self._pending_rows)
+
+        if self.rows_written != self.height:
+            self.file.close()
+            raise RuntimeError(f"Wrote {self.rows_written} rows to {self.filepath}; expected {self.height}.")
+
+        self._write_ifd()
+        self.file.close()
+
+    def _flush_strip(self, row_count: int) -> None:
+        # Take exactly `row_count` rows from the pending chunks
+        parts = []
+        needed = row_count
+        while needed:
+            chunk = self._pending[0]
+            if chunk.shape[0] <= needed:
+                parts.append(chunk)
+                self._pending.pop(0)
+                needed -= chunk.shape[0]
+            else:
+                parts.append(chunk[:needed])
+                self._pending[0] = chunk[needed:]
+                needed = 0
+        self._pending_rows -= row_count
+
+        strip = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        data = np.ascontiguousarray(strip, dtype=self.dtype.newbyteorder('<')).tobytes()
+        if self.compress:
+            data = zlib.compress(data)
+
+        self.strip_offsets.append(self.file.tell())
+        self.strip_byte_counts.append(len(data))
+        self.file.write(data)
+        self.rows_written += row_count
+
+    def _write_ifd(self) -> None:
+        offset_type = TYPE_LONG8 if self.bigtiff else TYPE_LONG
+        bits = self.dtype.itemsize * 8
+        sample_format = SAMPLE_FORMAT_FLOAT if self.dtype.kind == 'f' else SAMPLE_FORMAT_UINT
+
+        entries = [
+            (TAG_IMAGE_WIDTH, TYPE_LONG, [self.width]),
+            (TAG_IMAGE_LENGTH, TYPE_LONG, [self.height]),
+            (TAG_BITS_PER_SAMPLE, TYPE_SHORT, [bits] * self.channels),
+            (TAG_COMPRESSION, TYPE_SHORT, [COMPRESSION_DEFLATE if self.compress else COMPRESSION_NONE]),
+            (TAG_PHOTOMETRIC, TYPE_SHORT, [2 if self.channels >= 3 else 1]), # RGB or BlackIsZero
+            (TAG_STRIP_OFFSETS, offset_type, self.strip_offsets),
+            (TAG_SAMPLES_PER_PIXEL, TYPE_SHORT, [self.channels]),
+            (TAG_ROWS_PER_STRIP, TYPE_LONG, [self.rows_per_strip]),
+            (TAG_STRIP_BYTE_COUNTS, offset_type, self.strip_byte_counts),
+            (TAG_PLANAR_CONFIG, TYPE_SHORT, [1]), # Interleaved
+        ]
+        if self.channels in {2, 4}:
+            entries.append((TAG_EXTRA_SAMPLES, TYPE_SHORT, [2])) # Unassociated alpha
+        entries.append((TAG_SAMPLE_FORMAT, TYPE_SHORT, [sample_format] * self.channels))
+
+        if self.bigtiff:
+            count_format, entry_format, next_format, inline_size = '<Q', '<HHQ', '<Q', 8
+        else:
+            count_format, entry_format, next_format, inline_size = '<H', '<HHI', '<I', 4
+
+        # Word-align the IFD
+        if self.file.tell() % 2:
+            self.file.write(b'\0')
+
+        ifd_offset = self.file.tell()
+        ifd_size = struct.calcsize(count_format) + len(entries) * (struct.calcsize(entry_format) + inline_size) + struct.calcsize(next_format)
+        extra_offset = ifd_offset + ifd_size
+
+        ifd = bytearray(struct.pack(count_format, len(entries)))
+        extra = bytearray()
+        for (tag, field_type, values) in entries:
+            code, size = TYPE_FORMATS[field_type]
+            value_bytes = struct.pack(f'<{len(values)}{code}', *values)
+            ifd += struct.pack(entry_format, tag, field_type, len(values))
+            if len(value_bytes) <= inline_size:
+                ifd += value_bytes.ljust(inline_size, b'\0')
+            else:
+                ifd += struct.pack('<Q' if self.bigtiff else '<I', extra_offset + len(extra))
+                extra += value_bytes
+                if len(extra) % 2:
+                    extra += b'\0'
+        ifd += struct.pack(next_format, 0)
+
+        self.file.write(ifd)
+        self.file.write(extra)
+
+        # Point the header at the IFD
+        self.file.seek(8 if self.bigtiff else 4, os.SEEK_SET)
+        self.file.write(struct.pack('<Q' if self.bigtiff else '<I', ifd_offset))
+        self.file.seek(0, os.SEEK_END)
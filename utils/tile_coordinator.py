@@ -0,0 +1,398 @@
+import hmac
+import ipaddress
+import json
+import os
+import secrets
+import socket
+import statistics
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import ceil
+from typing import Dict, List, Optional, Set
+
+
+# Seconds between a worker's heartbeats, and without one after which its tiles are handed to other workers
+HEARTBEAT_INTERVAL = 10.0
+LEASE_TIMEOUT = 60.0
+# Seconds a heartbeat may take, short as it can be sent from the render itself
+HEARTBEAT_TIMEOUT = 5.0
+# Seconds a worker waits before asking again when there is nothing to claim yet
+CLAIM_RETRY_DELAY = 2.0
+# A tile still rendering after this many times the median tile time is also given to an idle worker, whichever upload comes first wins.
+# The slower copy isn't aborted, as a background render can't be stopped part way; its worker drops it when it finishes.
+SPECULATE_FACTOR = 1.5
+SPECULATE_MIN_SECONDS = 10.0
+MAX_TILE_COPIES = 2
+# Times a tile may fail before it is given up on. Tiles lost with their worker don't count, as it may only be slow.
+MAX_TILE_FAILURES = 2
+# Queue of tiles no worker has taken yet
+UNASSIGNED = ""
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Header carrying the shared token every request to a coordinator must have, and the environment variable it is read from
+TOKEN_HEADER = "X-SRR-Token"
+TOKEN_ENV_VAR = "SRR_COORDINATOR_TOKEN"
+
+
+def is_loopback_host(host: str) -> bool:
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def generate_token() -> str:
+    return secrets.token_urlsafe(16)
+
+
+class TileLease:
+    def __init__(self, worker: str, now: float):
+        self.worker = worker
+        self.started = now
+
+
+class TileCoordinator:
+    """
+    Hands out tiles, by index, to render workers on any number of machines and collects the rendered files.
+
+    Each worker claims tiles from a queue of its own. A worker whose queue is empty steals the back half of the
+    longest queue, initially the unassigned one, so workers mostly render runs of neighbouring tiles and the queues
+    balance themselves without any tuning. Once every queue is empty, idle workers are also given tiles that have been
+    rendering for much longer than usual (speculative re-execution), so one slow or stuck machine doesn't hold up the job.
+
+    Workers heartbeat while rendering; the tiles of a worker not heard from for `lease_timeout` are queued again,
+    but its upload is still accepted if it turns up first. So is an upload of a tile given up on after failing elsewhere.
+    Uploads are written next to the tile's file and renamed over it, so a tile is either complete or absent.
+    All methods are thread-safe.
+    """
+
+    def __init__(self, filepaths: Dict[int, str], lease_timeout: float = LEASE_TIMEOUT):
+        self.filepaths = dict(filepaths) # Absolute path each tile's upload is written to
+        self.lease_timeout = lease_timeout
+        self.lock = threading.Lock()
+        self.queues: Dict[str, deque] = {UNASSIGNED: deque(sorted(filepaths))}
+        self.leases: Dict[int, List[TileLease]] = {}
+        self.last_seen: Dict[str, float] = {}
+        self.done: Dict[int, str] = {} # Worker that rendered each tile
+        self.failed: Dict[int, str] = {} # Last error of each tile given up on
+        self.failures: Dict[int, int] = {}
+        self.durations: List[float] = []
+        self.newly_done: List[int] = []
+
+    @property
+    def is_finished(self) -> bool:
+        return len(self.done) + len(self.failed) == len(self.filepaths)
+
+    def pop_done(self) -> List[int]:
+        """Tiles uploaded since the last call."""
+        with self.lock:
+            (done, self.newly_done) = (self.newly_done, [])
+        return done
+
+    def claim(self, worker: str) -> dict:
+        """The next tile for `worker`: `{'tile': index}`, `{'wait': seconds}` if there is none yet, or `{'finished': True}`."""
+        with self.lock:
+            now = time.monotonic()
+            self._seen(worker, now)
+
+            if self.is_finished:
+                return {'finished': True}
+
+            index = self._next_queued(worker)
+            if index is None:
+                index = self._straggler(worker, now)
+            if index is None:
+                return {'wait': CLAIM_RETRY_DELAY}
+
+            self.leases.setdefault(index, []).append(TileLease(worker, now))
+            return {'tile': index}
+
+    def _next_queued(self, worker: str) -> Optional[int]:
+        own = self.queues.setdefault(worker, deque())
+        if not own:
+            victim = max(self.queues.values(), key=len)
+            for _ in range(ceil(len(victim) / 2)):
+                own.appendleft(victim.pop())
+
+        while own:
+            index = own.popleft()
+            # Tiles queued again after being lost may have been rendered by a speculative copy since
+            if index not in self.done and index not in self.failed:
+                return index
+        return None
+
+    def _straggler(self, worker: str, now: float) -> Optional[int]:
+        """The tile that has been rendering the longest, if it is taking much longer than usual and isn't `worker`'s already."""
+        if not self.durations:
+            return None
+        threshold = max(SPECULATE_MIN_SECONDS, SPECULATE_FACTOR * statistics.median(self.durations))
+
+        candidates = [(now - min(lease.started for lease in leases), index) for (index, leases) in self.leases.items()
+            if leases and len(leases) < MAX_TILE_COPIES and all(lease.worker != worker for lease in leases)]
+        (elapsed, index) = max(candidates, default=(0.0, None))
+        if index is None or elapsed < threshold:
+            return None
+
+        print(f"Tile {index + 1} has been rendering for {elapsed:.1f}s, also giving it to {worker}.")
+        return index
+
+    def heartbeat(self, worker: str, tiles: List[int]) -> dict:
+        """Keep `worker`'s leases. Returns the tiles it is rendering that are no longer needed, as `{'cancel': [index, ...]}`."""
+        with self.lock:
+            self._seen(worker, time.monotonic())
+            return {'cancel': [index for index in tiles if index in self.done]}
+
+    def _seen(self, worker: str, now: float) -> None:
+        """Note that `worker` is alive, and queue the tiles of workers that haven't been heard from for too long."""
+        self.last_seen[worker] = now
+
+        lost = {other for (other, seen) in self.last_seen.items() if now - seen > self.lease_timeout}
+        for other in lost:
+            del self.last_seen[other]
+            for (index, leases) in self.leases.items():
+                if any(lease.worker == other for lease in leases):
+                    self._drop_lease(other, index)
+
+    def _drop_lease(self, worker: str, index: int, error: str = None) -> None:
+        """
+        End `worker`'s lease of a tile, queueing it again unless someone else is still rendering it.
+        With an `error` the tile failed, which counts towards giving up on it; without, the worker was lost.
+        """
+        leases = self.leases.get(index, [])
+        leases[:] = [lease for lease in leases if lease.worker != worker]
+        if leases or index in self.done or index in self.failed:
+            return
+
+        if error is None:
+            print(f"Lost {worker}, queueing tile {index + 1} again.")
+        else:
+            self.failures[index] = self.failures.get(index, 0) + 1
+            if self.failures[index] >= MAX_TILE_FAILURES:
+                print(f"Tile {index + 1} failed {self.failures[index]} times, giving up on it: {error}")
+                self.failed[index] = error
+                return
+            print(f"Tile {index + 1} failed on {worker}, queueing it again: {error}")
+        self.queues[UNASSIGNED].appendleft(index)
+
+    def fail(self, worker: str, index: int, error: str) -> None:
+        with self.lock:
+            self._seen(worker, time.monotonic())
+            self._drop_lease(worker, index, error or "unknown error")
+
+    def get_upload_filepath(self, index: int) -> str:
+        """A file to receive an upload of a tile in, on the same filesystem as the tile and unique to the uploading thread."""
+        filepath = self.filepaths[index]
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        return f"{filepath}.{threading.get_ident()}.part"
+
+    def complete(self, worker: str, index: int, upload_filepath: str) -> bool:
+        """Move a finished upload into place. Returns whether it was used, rather than another copy of the tile."""
+        with self.lock:
+            now = time.monotonic()
+            self._seen(worker, now)
+
+            if index in self.done:
+                os.remove(upload_filepath)
+                return False
+
+            os.replace(upload_filepath, self.filepaths[index])
+            self.failed.pop(index, None)
+            self.done[index] = worker
+            self.newly_done.append(index)
+            for lease in self.leases.pop(index, []):
+                if lease.worker == worker:
+                    self.durations.append(now - lease.started)
+            return True
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                'tiles': len(self.filepaths),
+                'done': len(self.done),
+                'failed': len(self.failed),
+                'rendering': sum(1 for leases in self.leases.values() if leases),
+                'workers': sorted(self.last_seen),
+            }
+
+
+class CoordinatorRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON over HTTP:
+    `POST /claim {"worker"}`, `POST /heartbeat {"worker", "tiles"}`, `POST /fail {"worker", "tile", "error"}`,
+    `PUT /tiles/<index>?worker=<worker>` with the tile file as the body, and `GET /status`.
+    If the server has a token, every request must send it in the `X-SRR-Token` header.
+    """
+
+    server: "CoordinatorServer"
+
+    def _is_authorised(self) -> bool:
+        if self.server.token is None:
+            return True
+        token = self.headers.get(TOKEN_HEADER) or ""
+        if hmac.compare_digest(token.encode(), self.server.token.encode()):
+            return True
+        self.send_error(403, "Missing or wrong coordinator token")
+        return False
+
+    def do_GET(self):
+        if not self._is_authorised():
+            return
+        if self.path != '/status':
+            return self.send_error(404)
+        self._reply(self.server.coordinator.status())
+
+    def do_POST(self):
+        if not self._is_authorised():
+            return
+        coordinator = self.server.coordinator
+        try:
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            worker = str(request['worker'])
+            if self.path == '/claim':
+                return self._reply(coordinator.claim(worker))
+            if self.path == '/heartbeat':
+                return self._reply(coordinator.heartbeat(worker, [int(index) for index in request['tiles']]))
+            if self.path == '/fail':
+                coordinator.fail(worker, int(request['tile']), str(request.get('error', "")))
+                return self._reply({})
+        except (KeyError, TypeError, ValueError) as e:
+            return self.send_error(400, str(e))
+        self.send_error(404)
+
+    def do_PUT(self):
+        if not self._is_authorised():
+            return
+        coordinator = self.server.coordinator
+        (path, _, worker) = self.path.partition('?worker=')
+        worker = urllib.parse.unquote(worker)
+        try:
+            index = int(path[len('/tiles/'):]) if path.startswith('/tiles/') else -1
+            length = int(self.headers['Content-Length'])
+        except (TypeError, ValueError):
+            index = -1
+        if index not in coordinator.filepaths or not worker:
+            return self.send_error(400, "Expected PUT /tiles/<index>?worker=<worker>")
+
+        upload_filepath = coordinator.get_upload_filepath(index)
+        try:
+            with open(upload_filepath, 'wb') as f:
+                while length > 0:
+                    chunk = self.rfile.read(min(length, UPLOAD_CHUNK_SIZE))
+                    if not chunk:
+                        raise ConnectionError("Upload ended early")
+                    f.write(chunk)
+                    length -= len(chunk)
+        except OSError as e:
+            if os.path.exists(upload_filepath):
+                os.remove(upload_filepath)
+            return self.send_error(500, str(e))
+
+        self._reply({'accepted': coordinator.complete(worker, index, upload_filepath)})
+
+    def _reply(self, data: dict) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Every claim and heartbeat would be printed otherwise
+        pass
+
+
+class CoordinatorServer(ThreadingHTTPServer):
+    """Serves a `TileCoordinator`. With a `token`, requests without it are refused."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple, coordinator: TileCoordinator, token: str = None):
+        super().__init__(address, CoordinatorRequestHandler)
+        self.coordinator = coordinator
+        self.token = token
+
+
+class CoordinatorClient:
+    """A render worker's side of the coordinator's protocol. Network errors are raised as `OSError`."""
+
+    def __init__(self, url: str, worker: str = None, token: str = None):
+        self.url = url.rstrip('/')
+        self.worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        self.token = token
+
+    def _request(self, method: str, path: str, data=None, headers: dict = None, timeout: float = LEASE_TIMEOUT) -> dict:
+        headers = dict(headers or {})
+        if self.token:
+            headers[TOKEN_HEADER] = self.token
+        request = urllib.request.Request(f"{self.url}{path}", data=data, headers=headers, method=method)
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+
+    def _post(self, path: str, timeout: float = LEASE_TIMEOUT, **payload) -> dict:
+        return self._request('POST', path, json.dumps(dict(worker=self.worker, **payload)).encode(),
+            {'Content-Type': 'application/json'}, timeout)
+
+    def claim(self) -> dict:
+        return self._post('/claim')
+
+    def heartbeat(self, tiles: List[int]) -> Set[int]:
+        """Returns the tiles that are no longer needed."""
+        return set(self._post('/heartbeat', HEARTBEAT_TIMEOUT, tiles=tiles)['cancel'])
+
+    def is_needed(self, index: int) -> bool:
+        """Whether a tile is still wanted, i.e. no other worker's copy of it has been uploaded in the meantime."""
+        return index not in self.heartbeat([index])
+
+    def fail(self, index: int, error: str) -> None:
+        self._post('/fail', tile=index, error=error)
+
+    def upload(self, index: int, filepath: str) -> bool:
+        """Upload a rendered tile. Returns whether it was used, rather than another worker's copy."""
+        with open(filepath, 'rb') as f:
+            return self._request('PUT', f"/tiles/{index}?worker={urllib.parse.quote(self.worker)}", f,
+                {'Content-Length': str(os.path.getsize(filepath)), 'Content-Type': 'application/octet-stream'})['accepted']
+
+
+class Heartbeat:
+    """
+    Heartbeats the tile a worker is rendering, noting if the coordinator no longer needs it. A background thread
+    heartbeats between renders, but Python threads don't run while Blender renders, so the render must call `beat()`,
+    e.g. from a `render_stats` handler.
+    """
+
+    def __init__(self, client: CoordinatorClient, interval: float = HEARTBEAT_INTERVAL):
+        self.client = client
+        self.interval = interval
+        self.tile: Optional[int] = None
+        self.cancelled: Set[int] = set()
+        self.last_sent = time.monotonic()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def beat(self) -> None:
+        """Heartbeat if one is due. Cheap enough to call as often as the render reports progress."""
+        if time.monotonic() - self.last_sent >= self.interval:
+            self._send()
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self._send()
+
+    def _send(self) -> None:
+        self.last_sent = time.monotonic()
+        tile = self.tile
+        try:
+            self.cancelled |= self.client.heartbeat([] if tile is None else [tile])
+        except OSError as e:
+            print(f"Heartbeat failed: {e}")
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
@@ -0,0 +1,188 @@
+import os
+import socket
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+# Seconds between touches of a held lock, and without a change to a lock after which it is taken to be abandoned
+LOCK_REFRESH_INTERVAL = 15.0
+STALE_LOCK_SECONDS = 120.0
+# Seconds between looks for tiles to claim once all are done or claimed, while waiting for the rest to finish
+CLAIM_POLL_INTERVAL = 5.0
+
+
+def get_lock_filepath(tile_abspath: str) -> str:
+    return f"{tile_abspath}.lock"
+
+
+def get_done_filepath(tile_abspath: str) -> str:
+    return f"{tile_abspath}.done"
+
+
+def is_tile_done(tile_abspath: str) -> bool:
+    """Whether the tile has been rendered completely; a tile file without its marker may have been cut short by a crash."""
+    return os.path.exists(get_done_filepath(tile_abspath)) and os.path.exists(tile_abspath)
+
+
+def get_lock_owner() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class TileClaim:
+    """A tile's lock held by this process. Keep it alive with `refresh()` while rendering, then `finish()` or `release()` it."""
+
+    def __init__(self, tile_abspath: str, owner: str):
+        self.tile_abspath = tile_abspath
+        self.lock_filepath = get_lock_filepath(tile_abspath)
+        self.owner = owner
+
+    def refresh(self) -> None:
+        try:
+            os.utime(self.lock_filepath)
+        except OSError as e:
+            print(f"Can't refresh the lock of {self.tile_abspath}: {e}")
+
+    def finish(self) -> None:
+        """Mark the tile done, then drop the lock; the marker is written first so the tile is never unclaimed and not done."""
+        with open(get_done_filepath(self.tile_abspath), 'w') as f:
+            f.write(self.owner)
+        self.release()
+
+    def release(self) -> None:
+        try:
+            os.remove(self.lock_filepath)
+        except FileNotFoundError:
+            pass
+
+
+class TileLocks:
+    """
+    Claims tiles through lock files next to them, so several Blender instances rendering the same .blend file into a
+    shared folder split the tiles between them without any server. A lock is created with `O_EXCL`, which exactly one
+    process can do, and touched while its tile renders; a finished tile gets a `.done` marker.
+
+    Machines' clocks may disagree, so a lock isn't judged by its age: it is abandoned (its owner crashed) once it hasn't
+    changed for `stale_seconds` of this process's time. It is then taken over by renaming it aside, which only one process
+    can do, and checking that what was moved is the lock that went stale rather than a new one.
+    """
+
+    def __init__(self, owner: str = None, stale_seconds: float = STALE_LOCK_SECONDS):
+        self.owner = owner or get_lock_owner()
+        self.stale_seconds = stale_seconds
+        # When each lock seen held by someone else was first seen in its current state
+        self.observed: Dict[str, Tuple[tuple, float]] = {}
+
+    def try_claim(self, tile_abspath: str) -> Optional[TileClaim]:
+        """Claim a tile that isn't done, or `None` if it is or someone else holds it."""
+        if is_tile_done(tile_abspath):
+            return None
+
+        lock_filepath = get_lock_filepath(tile_abspath)
+        os.makedirs(os.path.dirname(lock_filepath), exist_ok=True)
+        if self._create(lock_filepath):
+            return self._claimed(tile_abspath)
+
+        if self._is_stale(lock_filepath) and self._take_over(lock_filepath) and self._create(lock_filepath):
+            print(f"Took over the abandoned lock of {tile_abspath}.")
+            return self._claimed(tile_abspath)
+        return None
+
+    def _claimed(self, tile_abspath: str) -> Optional[TileClaim]:
+        claim = TileClaim(tile_abspath, self.owner)
+        # The tile may have been finished, and its lock dropped, since it was checked above
+        if is_tile_done(tile_abspath):
+            claim.release()
+            return None
+        return claim
+
+    def _create(self, lock_filepath: str) -> bool:
+        try:
+            fd = os.open(lock_filepath, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.owner)
+        return True
+
+    @staticmethod
+    def _signature(filepath: str) -> Optional[tuple]:
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _is_stale(self, lock_filepath: str) -> bool:
+        signature = self._signature(lock_filepath)
+        if signature is None:
+            self.observed.pop(lock_filepath, None)
+            return False
+
+        now = time.monotonic()
+        (observed, since) = self.observed.get(lock_filepath, (None, now))
+        if observed != signature:
+            self.observed[lock_filepath] = (signature, now)
+            return False
+        return now - since >= self.stale_seconds
+
+    def _take_over(self, lock_filepath: str) -> bool:
+        """Remove an abandoned lock. Returns `False` if another process got to it first."""
+        (stale_signature, _) = self.observed.pop(lock_filepath)
+        moved_filepath = f"{lock_filepath}.{self.owner}.stale"
+        try:
+            os.rename(lock_filepath, moved_filepath)
+        except FileNotFoundError:
+            return False
+
+        if self._signature(moved_filepath) != stale_signature:
+            # Someone else took the lock over and made a new one in between: put it back
+            try:
+                os.link(moved_filepath, lock_filepath)
+            except OSError as e:
+                # A third process made a lock since, or the file system can't link. Keep the moved lock under a name
+                # of its own rather than delete another process's claim without a trace; the tile may be rendered twice.
+                kept_filepath = f"{moved_filepath}.{time.time_ns()}"
+                os.rename(moved_filepath, kept_filepath)
+                print(f"Can't put back the lock {lock_filepath} of another process ({e}), left it at {kept_filepath}.")
+                return False
+            os.remove(moved_filepath)
+            return False
+
+        os.remove(moved_filepath)
+        return True
+
+
+class LockRefresher:
+    """
+    Touches the lock of the tile being rendered, so other processes don't take it over. A background thread touches it
+    between renders, but Python threads don't run while Blender renders, so the render must call `refresh()`, e.g. from a
+    `render_stats` handler; the lock is only as fresh as the render's last progress report.
+    """
+
+    def __init__(self, interval: float = LOCK_REFRESH_INTERVAL):
+        self.interval = interval
+        self.claim: Optional[TileClaim] = None
+        self.last_refreshed = time.monotonic()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def refresh(self) -> None:
+        """Touch the lock if it is due. Cheap enough to call as often as the render reports progress."""
+        if time.monotonic() - self.last_refreshed >= self.interval:
+            self._touch()
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self._touch()
+
+    def _touch(self) -> None:
+        self.last_refreshed = time.monotonic()
+        claim = self.claim
+        if claim:
+            claim.refresh()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
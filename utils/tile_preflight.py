@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple, Union
+
+try:
+    from .exr import ExrError, ExrHeader, read_exr_header
+except ImportError:
+    # The EXR reader needs NumPy; without it only the tiles' existence is checked
+    read_exr_header = None
+
+
+# Problems listed in the error message; the console gets all of them
+MAX_REPORTED_PROBLEMS = 20
+
+
+class TilePreflightError(RuntimeError):
+    """One or more tiles can't be merged. `problems` lists every problem found."""
+
+    def __init__(self, problems: List[str]):
+        self.problems = problems
+
+        lines = problems[:MAX_REPORTED_PROBLEMS]
+        if len(problems) > MAX_REPORTED_PROBLEMS:
+            lines.append(f"... and {len(problems) - MAX_REPORTED_PROBLEMS} more (see the console)")
+        super().__init__(f"{len(problems)} problem(s) with the image tiles:\n" + "\n".join(lines))
+
+
+# A channel name, or a tuple of names any one of which will do
+RequiredChannel = Union[str, Tuple[str, ...]]
+
+
+def check_tile_header(tile, filepath: str, required_channels: Sequence[RequiredChannel] = None) -> Tuple[Optional["ExrHeader"], List[str]]:
+    """Check one tile against its expected size and channels. Returns its header (if readable) and any problems."""
+    if not os.path.exists(filepath):
+        return (None, [f"{tile.filepath}: missing"])
+    if read_exr_header is None:
+        return (None, [])
+
+    try:
+        header = read_exr_header(filepath)
+    except (OSError, ExrError) as e:
+        return (None, [f"{tile.filepath}: can't read EXR header ({e})"])
+
+    problems = []
+    tile_x, tile_y = tile.image_size
+    image_x, image_y = header.size
+    if (image_x, image_y) != (tile_x, tile_y):
+        problems.append(f"{tile.filepath}: is {image_x}x{image_y}, expected {tile_x}x{tile_y}")
+
+    if header.data_window != header.display_window:
+        problems.append(f"{tile.filepath}: data window {header.data_window} doesn't match display window {header.display_window}")
+
+    missing = []
+    for required in required_channels or ():
+        alternatives = (required,) if isinstance(required, str) else required
+        if not any(name in header.channel_names for name in alternatives):
+            missing.append(" or ".join(alternatives))
+    if missing:
+        problems.append(f"{tile.filepath}: missing channels {', '.join(missing)} (has {', '.join(header.channel_names) or 'none'})")
+
+    return (header, problems)
+
+
+def preflight_tiles(tiles: list, abspaths: List[str], required_channels: Sequence[RequiredChannel] = None,
+        same_channels: bool = False) -> List[Optional["ExrHeader"]]:
+    """
+    Validate every tile from its EXR header alone, before any pixel memory is allocated.
+    Headers are read in parallel. With `same_channels`, every tile must have the first tile's channels.
+    Returns the headers, or raises `TilePreflightError` listing every problem at once.
+    """
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+        results = list(executor.map(lambda args: check_tile_header(*args, required_channels), zip(tiles, abspaths)))
+
+    headers = [header for (header, _) in results]
+    problems = [problem for (_, tile_problems) in results for problem in tile_problems]
+
+    if same_channels:
+        reference = next(((tile, header) for (tile, header) in zip(tiles, headers) if header), None)
+        if reference:
+            reference_tile, reference_header = reference
+            for (tile, header) in zip(tiles, headers):
+                if header and header.channel_names != reference_header.channel_names:
+                    problems.append(f"{tile.filepath}: has different passes to {reference_tile.filepath}")
+
+    if problems:
+        for problem in problems:
+            print(problem)
+        raise TilePreflightError(problems)
+
+    print(f"Checked {len(tiles)} tile headers OK.")
+    return headers
@@ -0,0 +1,212 @@
+import bpy
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    # Stats are read from the tiles with our EXR decoder, which needs NumPy
+    np = None
+    read_exr_rgba = None
+else:
+    from .color import LUMINANCE_WEIGHTS
+    from .exr import ExrError, read_exr_rgba
+
+
+TILE_STATS_VERSION = 1
+MERGE_STATS_VERSION = 1
+# Luminance histogram bins, one per stop: values below the first edge are counted in the first bin, above the last in the last
+HISTOGRAM_STOPS = (-12, 12)
+
+
+def get_tile_stats_filepath(tile_filepath: str) -> str:
+    return f"{tile_filepath}.stats.json"
+
+
+def write_tile_stats(tile_abspath: str, pixels: "np.ndarray") -> None:
+    """
+    Write the stats sidecar of a tile from its decoded pixels. The tile's size and mtime are recorded with them,
+    so stats of a tile that has been rendered again since are ignored.
+    """
+    stat = os.stat(tile_abspath)
+    data = {
+        'version': TILE_STATS_VERSION,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        # Every channel zero, e.g. transparent background; NaNs count as content
+        'empty': not bool(pixels.any()),
+    }
+
+    with open(get_tile_stats_filepath(tile_abspath), 'w') as f:
+        json.dump(data, f)
+
+
+def load_tile_stats(tile_abspath: str) -> Optional[dict]:
+    """The stats of a tile, or `None` if there are none or the tile has changed since they were written."""
+    try:
+        with open(get_tile_stats_filepath(tile_abspath), 'r') as f:
+            data = json.load(f)
+        stat = os.stat(tile_abspath)
+    except (OSError, ValueError):
+        return None
+
+    if data.get('version') != TILE_STATS_VERSION or data.get('size') != stat.st_size or data.get('mtime') != stat.st_mtime:
+        return None
+    return data
+
+
+def is_empty_tile(tile_abspath: str) -> bool:
+    stats = load_tile_stats(tile_abspath)
+    return bool(stats and stats['empty'])
+
+
+class TileStatsRecorder:
+    """
+    Writes the stats sidecar of each tile as soon as it has been rendered, decoding it on a background thread
+    while the next tile renders.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def record(self, tile_filepath: str) -> None:
+        if read_exr_rgba is None:
+            return
+        # Resolve the path here, bpy must not be touched from the worker thread
+        self.executor.submit(self._record, bpy.path.abspath(tile_filepath))
+
+    def _record(self, tile_abspath: str) -> None:
+        try:
+            write_tile_stats(tile_abspath, read_exr_rgba(tile_abspath))
+        except (OSError, ExrError) as e:
+            print(f"Can't record stats of tile {tile_abspath}: {e}")
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+
+
+def get_merge_stats_filepath(output_filepath: str) -> str:
+    return f"{output_filepath}.tiles.json"
+
+
+def measure_tile(pixels: "np.ndarray") -> dict:
+    """
+    Statistics of one tile's float RGBA pixels. Luminance (Rec. 709) min, max and mean and its histogram in stops
+    only count pixels whose luminance is finite; pixels with any NaN channel, and pixels with an infinite one, are counted apart.
+    """
+    pixels = pixels.reshape(-1, 4)
+    nan = np.isnan(pixels).any(axis=1)
+    inf = np.isinf(pixels).any(axis=1) & ~nan
+
+    luminance = pixels[:, :3] @ LUMINANCE_WEIGHTS
+    luminance = luminance[np.isfinite(luminance)]
+
+    low, high = HISTOGRAM_STOPS
+    stops = np.clip(np.log2(np.maximum(luminance, 2.0 ** low)), low, high)
+    histogram, _ = np.histogram(stops, bins=high - low, range=(low, high))
+
+    return {
+        'pixels': len(pixels),
+        'finite': len(luminance),
+        'min': float(luminance.min()) if len(luminance) else None,
+        'max': float(luminance.max()) if len(luminance) else None,
+        'mean': float(luminance.mean(dtype=np.float64)) if len(luminance) else None,
+        'histogram': histogram.tolist(),
+        'nan': int(nan.sum()),
+        'inf': int(inf.sum()),
+        'alpha_coverage': float(np.clip(pixels[:, 3], 0.0, 1.0).mean(dtype=np.float64)),
+    }
+
+
+def measure_empty_tile(pixel_count: int) -> dict:
+    """The statistics `measure_tile()` gives for an all-zero tile, without needing its pixels."""
+    low, high = HISTOGRAM_STOPS
+    return {
+        'pixels': pixel_count,
+        'finite': pixel_count,
+        'min': 0.0,
+        'max': 0.0,
+        'mean': 0.0,
+        'histogram': [pixel_count] + [0] * (high - low - 1),
+        'nan': 0,
+        'inf': 0,
+        'alpha_coverage': 0.0,
+    }
+
+
+def summarise_tiles(tiles: List[dict]) -> dict:
+    """Combine the statistics of tiles into those of the image they make up."""
+    measured = [tile for tile in tiles if tile['finite']]
+    finite = sum(tile['finite'] for tile in tiles)
+    pixels = sum(tile['pixels'] for tile in tiles)
+
+    return {
+        'pixels': pixels,
+        'finite': finite,
+        'min': min((tile['min'] for tile in measured), default=None),
+        'max': max((tile['max'] for tile in measured), default=None),
+        'mean': sum(tile['mean'] * tile['finite'] for tile in measured) / finite if finite else None,
+        'histogram': [sum(counts) for counts in zip(*(tile['histogram'] for tile in tiles))],
+        'nan': sum(tile['nan'] for tile in tiles),
+        'inf': sum(tile['inf'] for tile in tiles),
+        'alpha_coverage': sum(tile['alpha_coverage'] * tile['pixels'] for tile in tiles) / pixels if pixels else 0.0,
+    }
+
+
+class MergeTileStats:
+    """
+    Collects the statistics of each tile as it is merged, from the pixels already decoded for the merge
+    (on the worker threads when prefetching), and writes them with a summary of the whole image to a JSON sidecar
+    of the output, so exposure and problem tiles can be checked without reading the output again.
+    """
+
+    def __init__(self, resolution: Tuple[int, int]):
+        self.resolution = resolution
+        self.tiles: Dict[str, dict] = {}
+
+    def measure(self, tile, pixels: "np.ndarray") -> None:
+        self.tiles[tile.filepath] = self._entry(tile, measure_tile(pixels))
+
+    def measure_empty(self, tile) -> None:
+        tile_x, tile_y = tile.dimensions
+        self.tiles[tile.filepath] = self._entry(tile, measure_empty_tile(tile_x * tile_y))
+
+    @staticmethod
+    def _entry(tile, stats: dict) -> dict:
+        return dict(filepath=tile.filepath, offset=list(tile.offset), dimensions=list(tile.dimensions), **stats)
+
+    def write(self, output_filepath: str, update: bool = False) -> None:
+        """
+        Write the sidecar of `output_filepath`. With `update`, tiles measured by an earlier merge of the same
+        output that weren't measured this time (e.g. unchanged tiles of a patched merge) are kept.
+        """
+        filepath = get_merge_stats_filepath(output_filepath)
+
+        tiles = dict(self.tiles)
+        if update:
+            try:
+                with open(filepath, 'r') as f:
+                    previous = json.load(f)
+                if previous.get('version') == MERGE_STATS_VERSION and previous.get('resolution') == list(self.resolution):
+                    tiles = {**{tile['filepath']: tile for tile in previous['tiles']}, **tiles}
+            except (OSError, ValueError, KeyError):
+                pass
+
+        entries = sorted(tiles.values(), key=lambda tile: (-tile['offset'][1], tile['offset'][0]))
+        data = {
+            'version': MERGE_STATS_VERSION,
+            'resolution': list(self.resolution),
+            'histogram_stops': list(HISTOGRAM_STOPS),
+            'image': summarise_tiles(entries),
+            'tiles': entries,
+        }
+
+        with open(filepath, 'w') as f:
+            json.dump(data, f, indent=1)
+        print(f'Wrote tile statistics "{filepath}".')
+
+        problems = [tile for tile in entries if tile['nan'] or tile['inf']]
+        for tile in problems:
+            print(f"Tile {tile['filepath']} has {tile['nan']} NaN and {tile['inf']} infinite pixels, it may need rendering again.")
@@ -0,0 +1,157 @@
+import os
+import queue
+import subprocess
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+# Marks the lines of a worker's output that are messages to the pool, among Blender's own output
+WORKER_PREFIX = "SRR_WORKER"
+# Times a tile is handed out again after the worker rendering it exits, before it is given up on
+MAX_TILE_ATTEMPTS = 2
+# Seconds to wait for workers to exit after being asked to, before killing them
+WORKER_EXIT_TIMEOUT = 5.0
+
+
+def get_batch_script_filepath() -> str:
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "SRR_Batch.py")
+
+
+def get_worker_threads(worker_count: int) -> int:
+    """Render threads for each of `worker_count` workers, sharing the machine's CPUs between them."""
+    return max(1, (os.cpu_count() or 1) // max(worker_count, 1))
+
+
+def get_batch_command(blender_binary: str, blend_filepath: str, args: Sequence[str]) -> List[str]:
+    """Command line running `SRR_Batch.py` with `args` in a background Blender."""
+    return [blender_binary, '-b', blend_filepath, '--python', get_batch_script_filepath(), '--', '--srr', *args]
+
+
+def get_worker_command(blender_binary: str, blend_filepath: str, threads: int, extra_args: Sequence[str] = ()) -> List[str]:
+    return get_batch_command(blender_binary, blend_filepath, ['--worker', '--threads', str(threads), *extra_args])
+
+
+class PoolWorker:
+    def __init__(self, number: int, process: subprocess.Popen):
+        self.number = number
+        self.process = process
+        self.tile: Optional[int] = None # Index of the tile being rendered
+        self.alive = True
+
+
+class WorkerPool:
+    """
+    Renders tiles in background Blender processes running `SRR_Batch.py --worker`. Tiles are handed out one at a time
+    from a shared queue as each worker reports the previous one done, so faster workers take more of them.
+    Workers are told tile indices on stdin and report them on stdout; their output is read on a thread per worker,
+    and `poll()` hands out tiles and collects results on the caller's thread.
+    """
+
+    def __init__(self, command: List[str], tile_indices: Sequence[int], worker_count: int):
+        self.pending = deque(tile_indices)
+        self.attempts: Dict[int, int] = {}
+        self.events = queue.Queue()
+        self.workers: List[PoolWorker] = []
+
+        for number in range(1, worker_count + 1):
+            process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+            worker = PoolWorker(number, process)
+            self.workers.append(worker)
+            threading.Thread(target=self._read_output, args=(worker,), daemon=True).start()
+
+        # Workers read their first tile once they have loaded the .blend file
+        self._hand_out_tiles()
+
+    def _read_output(self, worker: PoolWorker) -> None:
+        for line in worker.process.stdout:
+            if line.startswith(WORKER_PREFIX):
+                self.events.put((worker, line[len(WORKER_PREFIX):].split(None, 2)))
+            else:
+                print(f"[Worker {worker.number}] {line}", end='')
+        worker.process.wait()
+        self.events.put((worker, ['exited']))
+
+    @property
+    def is_finished(self) -> bool:
+        """Whether every worker has exited: all tiles are done, or the workers died."""
+        return not any(worker.alive for worker in self.workers)
+
+    def poll(self) -> List[Tuple[str, int, str]]:
+        """
+        Handle the workers' messages since the last call, handing out the next tiles.
+        Returns `(result, tile index, message)` for each tile finished since, `result` being 'done' or 'failed'.
+        """
+        finished = []
+        while True:
+            try:
+                (worker, message) = self.events.get_nowait()
+            except queue.Empty:
+                break
+
+            event = message[0]
+            if event in {'done', 'failed'}:
+                worker.tile = None
+                finished.append((event, int(message[1]), message[2].strip() if len(message) > 2 else ""))
+            elif event == 'exited':
+                worker.alive = False
+                if worker.tile is not None:
+                    finished += self._retry_tile(worker)
+
+        self._hand_out_tiles()
+        return finished
+
+    def _retry_tile(self, worker: PoolWorker) -> List[Tuple[str, int, str]]:
+        """Queue the tile of a worker that exited while rendering it again, unless it already has been too often."""
+        index = worker.tile
+        worker.tile = None
+        message = f"worker {worker.number} exited with code {worker.process.returncode} while rendering it"
+
+        self.attempts[index] = self.attempts.get(index, 1) + 1
+        if self.attempts[index] > MAX_TILE_ATTEMPTS or self.is_finished:
+            return [('failed', index, message)]
+
+        print(f"Tile {index + 1}: {message}, rendering it again.")
+        self.pending.appendleft(index)
+        return []
+
+    def _hand_out_tiles(self) -> None:
+        """
+        Give each idle worker the next tile. Once none are left, idle workers are kept waiting while others are still rendering,
+        in case a tile has to be rendered again, and told to exit (their stdin closed) when the last one is done.
+        """
+        idle = [worker for worker in self.workers if worker.alive and worker.tile is None and not worker.process.stdin.closed]
+        for worker in idle:
+            if not self.pending:
+                break
+            worker.tile = self.pending.popleft()
+            self._send(worker, f"{worker.tile}\n")
+
+        if not self.pending and not any(worker.tile is not None for worker in self.workers):
+            for worker in idle:
+                self._send(worker, None)
+
+    @staticmethod
+    def _send(worker: PoolWorker, line: Optional[str]) -> None:
+        """Write `line` to the worker, or close its stdin if `None`."""
+        try:
+            if line is None:
+                worker.process.stdin.close()
+            else:
+                worker.process.stdin.write(line)
+                worker.process.stdin.flush()
+        except OSError:
+            # The worker died; its tile is queued again once its output ends
+            pass
+
+    def stop(self) -> None:
+        """Stop the workers, killing any that don't exit in time."""
+        for worker in self.workers:
+            if worker.process.poll() is None:
+                worker.process.terminate()
+        for worker in self.workers:
+            try:
+                worker.process.wait(WORKER_EXIT_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                worker.process.kill()
+                worker.process.wait()